@@ -0,0 +1,12 @@
+"""Shared setup for the benchmark scripts: import path and placeholder credentials.
+
+Benchmarks never talk to Telegram or Gemini, but importing kosha reads the
+config module, which refuses to load without these variables.
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault('BOT_TOKEN', 'benchmark')
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
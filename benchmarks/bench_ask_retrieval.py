@@ -0,0 +1,190 @@
+"""/ask retrieval: latency of picking the relevant entries, and prompt size vs sending the whole journal.
+
+Builds a generated journal (Zipf-distributed words, one summary per day) for
+one user and times retrieval.build_ask_prompt over random questions. With
+NumPy installed, also times the dense search step over random unit vectors,
+the part of /ask that runs locally once entries are embedded, and runs the
+dense path end to end against a fake Gemini client: a second user's entries
+are embedded in batches with one batch failing, and the cached index is
+checked against the stored embeddings before and after it catches up, then
+BM25 and dense rankings are fused for a question.
+
+Usage: python benchmarks/bench_ask_retrieval.py [logs] [questions]
+"""
+import asyncio
+import contextlib
+import datetime
+import io
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+
+from fakes import FakeGeminiClient
+from kosha import async_db, client, db, retrieval
+
+VOCABULARY = 20000
+LOGS_PER_DAY = 20
+EMBEDDING_SIZE = 768
+BATCH = 50_000
+DENSE_USER = 2
+DENSE_ENTRIES = 350
+
+
+def populate(logs):
+    rng = random.Random(1)
+    words = [f"w{i}" for i in range(VOCABULARY)]
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY)))
+    sentence = lambda low, high: " ".join(rng.choices(words, cum_weights=cumulative, k=rng.randrange(low, high)))
+    start_day = datetime.datetime(2020, 1, 1)
+
+    conn = db.get_connection()
+    conn.execute("INSERT INTO users (id, telegram_chat_id) VALUES (1, 1)")
+    for batch_start in range(0, logs, BATCH):
+        batch = []
+        for i in range(batch_start, min(logs, batch_start + BATCH)):
+            when = start_day + datetime.timedelta(minutes=i * 24 * 60 // LOGS_PER_DAY)
+            batch.append((sentence(8, 30), when.strftime('%Y-%m-%d %H:%M:%S')))
+        with conn:
+            conn.executemany("INSERT INTO logs (user_id, content, timestamp) VALUES (1, ?, ?)", batch)
+    days = logs // LOGS_PER_DAY
+    with conn:
+        conn.executemany("INSERT INTO summaries (user_id, content, date) VALUES (1, ?, ?)",
+                         ((sentence(60, 200), (start_day + datetime.timedelta(days=day)).date().isoformat())
+                          for day in range(days)))
+    return rng, words, days
+
+
+async def ask(rng, words, questions):
+    for _ in range(questions):
+        question = f"what did I write about {rng.choice(words[50:2000])} and {rng.choice(words[2000:])}?"
+        await retrieval.build_ask_prompt(1, question)
+
+
+def measure_dense(entries, questions):
+    import numpy
+
+    rng = numpy.random.default_rng(1)
+    matrix = rng.standard_normal((entries, EMBEDDING_SIZE), dtype=numpy.float32)
+    matrix /= numpy.linalg.norm(matrix, axis=1, keepdims=True)
+    samples = []
+    for _ in range(questions):
+        query = rng.standard_normal(EMBEDDING_SIZE, dtype=numpy.float32)
+        start = time.perf_counter()
+        scores = matrix @ (query / numpy.linalg.norm(query))
+        top = numpy.argpartition(-scores, retrieval.CANDIDATES)[:retrieval.CANDIDATES]
+        top[numpy.argsort(-scores[top])]
+        samples.append(time.perf_counter() - start)
+    print(f"Dense search over {entries} x {EMBEDDING_SIZE} float32 ({matrix.nbytes / 2**20:.0f} MiB): "
+          f"{statistics.median(samples) * 1000:.2f} ms median, {max(samples) * 1000:.2f} ms max")
+
+
+class FailingEmbeddings:
+    """Fails the `fail_on`-th embed_content call, as a 429 on a later batch would."""
+
+    def __init__(self, models, fail_on):
+        self.models = models
+        self.embed_content_of = models.embed_content
+        self.fail_on = fail_on
+        models.embed_content = self.embed_content
+
+    async def embed_content(self, **kwargs):
+        self.fail_on -= 1
+        if self.fail_on == 0:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        return await self.embed_content_of(**kwargs)
+
+
+def check_cache(index, user_id, expected):
+    import numpy
+
+    keys, matrix = index._users[user_id]
+    stored = {(kind, row_id): numpy.frombuffer(vector, dtype=numpy.float32)
+              for kind, row_id, vector in db.get_embeddings(user_id)}
+    assert len(keys) == len(stored) == expected, f"{len(keys)} cached keys, {len(stored)} stored, expected {expected}"
+    assert matrix.shape[0] == len(keys), f"{len(keys)} cached keys for {matrix.shape[0]} rows"
+    for key, row in zip(keys, matrix):
+        assert numpy.array_equal(stored[key], row), f"cached row of {key} is not its stored embedding"
+
+
+async def check_dense():
+    gemini = client._client = FakeGeminiClient(0)
+    retrieval.gemini_limiter.rate = 1e9
+    index = retrieval.dense = retrieval.DenseIndex()
+    conn = db.get_connection()
+
+    def write(entries):
+        with conn:
+            conn.executemany("INSERT INTO logs (user_id, content, timestamp) VALUES (?, ?, ?)",
+                             [(DENSE_USER, f"entry {i} about the garden" if i % 5 else f"entry {i} about the dentist",
+                               f"2024-01-{1 + i % 28:02d} 12:00:00") for i in entries])
+
+    with conn:
+        conn.execute("INSERT INTO users (id, telegram_chat_id) VALUES (?, ?)", (DENSE_USER, DENSE_USER))
+    write(range(retrieval.EMBED_BATCH))
+    await index.search(DENSE_USER, "dentist", retrieval.CANDIDATES)
+    check_cache(index, DENSE_USER, retrieval.EMBED_BATCH)
+
+    # The user's index is cached; of the entries written since, the second batch fails.
+    write(range(retrieval.EMBED_BATCH, DENSE_ENTRIES))
+    FailingEmbeddings(gemini.aio.models, fail_on=2)
+    try:
+        await index.search(DENSE_USER, "dentist", retrieval.CANDIDATES)
+        raise AssertionError("the failing batch did not fail")
+    except RuntimeError:
+        pass
+    check_cache(index, DENSE_USER, 2 * retrieval.EMBED_BATCH)
+
+    found = await index.search(DENSE_USER, "dentist", retrieval.CANDIDATES)
+    check_cache(index, DENSE_USER, DENSE_ENTRIES)
+    assert len(found) == retrieval.CANDIDATES and len(set(found)) == len(found)
+
+    bm25 = [tuple(key) for key in await async_db.rank_journal(DENSE_USER, retrieval.bm25_query("dentist"), retrieval.CANDIDATES)]
+    fused = retrieval.fuse([bm25, found], retrieval.TOP_K)
+    assert fused[0] in bm25 and fused[0] in found, "the top fused entry is not ranked by both"
+    entries = await retrieval.retrieve(DENSE_USER, "when did I see the dentist?")
+    assert len(entries) == retrieval.TOP_K and all("dentist" in entry for entry in entries[:1])
+    return (f"Dense path: {DENSE_ENTRIES} entries embedded across a failed batch, cache matches the stored embeddings, "
+          f"{gemini.calls['embed_content']} embed calls; fused retrieval returned {len(entries)} entries.")
+
+
+def main():
+    logs = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    questions = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'ask.db')
+        db.user_ids.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.init_db()
+        rng, words, days = populate(logs)
+        print(f"Journal: {logs} logs and {days} daily summaries.")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(ask(rng, words, questions))
+        stats = retrieval.stats()
+        print(f"BM25 retrieval over {stats['questions']} questions: {stats['retrieval_p50'] * 1000:.2f} ms median, "
+              f"{stats['retrieval_p99'] * 1000:.2f} ms p99")
+        print(f"Prompt: ~{stats['tokens_sent'] // questions} tokens per question vs "
+              f"~{stats['tokens_full_context'] // questions} with the whole journal "
+              f"({100 * (1 - stats['tokens_sent'] / stats['tokens_full_context']):.2f}% saved)")
+
+        try:
+            measure_dense(logs + days, questions)
+        except ImportError:
+            print("NumPy is not installed; skipping the dense search timing and check.")
+        else:
+            with contextlib.redirect_stdout(io.StringIO()):
+                report = asyncio.run(check_dense())
+            print(report)
+        async_db.shutdown()
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""/remind and /summary date parsing: dateparser on every call vs utils.search_date.
+
+Runs a corpus of reminder-style inputs at several reference times and
+checks that utils.search_date answers like dateparser. The comparison is
+with dateparser in English, falling back to language detection when that
+finds nothing, which is what search_date's fallback does. The only allowed
+differences are where dateparser is wrong: inputs it misreads (MISREAD),
+times of day it finds nothing in (e.g. any "at 18:30" outside UTC), its
+month-rollover bug, which reads "friday" on Dec 31 as Dec 3 of the next
+year, and day shifts across a DST change that keep the old UTC offset.
+It also counts how many answers differ from the old detect-only call, and
+times both. Set TIMEZONE to run the checks in a zone with DST.
+
+Usage: TIMEZONE=America/New_York python benchmarks/bench_date_parsing.py [repeat]
+"""
+import datetime
+import re
+import statistics
+import sys
+import time
+
+import _setup  # noqa: F401
+from dateparser.search import search_dates
+
+from kosha import utils
+from kosha.core.config import TIMEZONE
+
+MESSAGES = ["call mom", "to check the oven", "dentist", "pay the rent", "standup with the team"]
+EXPRESSIONS = [
+    "in 2 hours", "in 30 minutes", "in 1 hour", "in an hour", "in a day", "in 3 days", "in 2 weeks", "in 90 seconds",
+    "tomorrow", "today", "yesterday", "tomorrow at 9:30 pm", "today at 9pm", "yesterday at 18:00",
+    "at 18:30", "at 9pm", "at 9 pm", "at 9:05am", "at 14:37", "at noon", "at midnight", "9pm", "07:15",
+    "monday", "on friday", "wednesday", "sunday", "friday at 18:30", "2025-08-10", "2024-02-29",
+    # dateparser misreads these; the fast path reads them as written.
+    "tomorrow 9am", "tomorrow at 9am", "9am tomorrow", "2025-08-10 15:00", "on monday at 10am", "next monday", "at 12am",
+]
+# Inputs that only go to dateparser, to check the fallback still answers like before.
+FALLBACK_ONLY = ["in 2 months", "next week", "in 2 hours and 30 minutes", "5 march at 9am", "10 minutes ago",
+                 "last friday", "August 3rd", "in 2h", "tonight"]
+MISREAD = re.compile(r"(tomorrow|today|yesterday) (at )?\d+am|\d+am (tomorrow|today)|\d{4}-\d\d-\d\d \d|"
+                     r"day at \d+am|next \w+day|12am")
+TIME_OF_DAY = re.compile(r"\d:\d\d|\d ?[ap]m|noon|midnight")
+BASES = [(2025, 8, 13, 14, 37, 21, 123456), (2025, 3, 9, 1, 30), (2025, 11, 2, 0, 45), (2024, 12, 31, 23, 50),
+         (2025, 8, 17, 8, 0)]
+
+
+def corpus():
+    for expression in EXPRESSIONS:
+        yield expression
+        for message in MESSAGES[:2]:
+            yield f"{expression} {message}"
+        yield f"{MESSAGES[2]} {expression}"
+    for expression in FALLBACK_ONLY:
+        yield f"{expression} {MESSAGES[3]}"
+
+
+def old_search(text, prefer, now, languages=None):
+    results = search_dates(text, languages=languages, settings={'TIMEZONE': TIMEZONE, 'RETURN_AS_TIMEZONE_AWARE': True,
+                                                                'PREFER_DATES_FROM': prefer, 'RELATIVE_BASE': now})
+    return results[0] if results else None
+
+
+def month_rollover(expected, actual):
+    """dateparser keeps the reference month when a weekday or time of day lands in the next or previous month."""
+    if expected is None or actual is None or expected[0] != actual[0]:
+        return False
+    ours, theirs = actual[1], expected[1]
+    return (ours.day, ours.time()) == (theirs.day, theirs.time()) and (ours.year, ours.month) != (theirs.year, theirs.month)
+
+
+def stale_offset(expected, actual):
+    """dateparser keeps the reference time's UTC offset when a day shift crosses a DST change."""
+    if expected is None or actual is None or expected[0] != actual[0]:
+        return False
+    wall_time = actual[1].replace(tzinfo=None)
+    return (expected[1].replace(tzinfo=None) == wall_time
+            and actual[1].utcoffset() == utils.tz.localize(wall_time).utcoffset() != expected[1].utcoffset())
+
+
+def check_equivalence(texts):
+    fast = differ = changed = 0
+    for base in BASES:
+        now = utils.tz.localize(datetime.datetime(*base))
+        for text in texts:
+            for prefer in ('future', 'past'):
+                old = old_search(text, prefer, now)
+                english = old_search(text, prefer, now, ['en'])
+                expected = english or old
+                actual = utils.search_date(text, prefer, now)
+                fast += utils.quick_parse_date(text, now, prefer) is not None
+                changed += actual != old
+                if actual != expected:
+                    assert (MISREAD.search(text) or month_rollover(expected, actual) or stale_offset(expected, actual)
+                            or (english is None and TIME_OF_DAY.search(text))), \
+                        f"{text!r} ({prefer}, {now}): dateparser {expected}, search_date {actual}"
+                    differ += 1
+    total = len(BASES) * len(texts) * 2
+    print(f"{total} parses in {TIMEZONE}: {fast} on the fast path, {total - differ} identical to dateparser, "
+          f"{differ} differ only where dateparser is wrong; {changed} differ from the old detect-only call.")
+
+
+def measure(label, func, texts, repeat):
+    now = datetime.datetime.now(utils.tz)
+    samples = []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            func(text, 'future', now)
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    print(f"  {label:<12} {statistics.median(samples) * 1000:8.3f} ms median  {samples[int(0.99 * (len(samples) - 1))] * 1000:8.3f} ms p99")
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    start = time.perf_counter()
+    utils.warm_up_date_parser()
+    print(f"dateparser warm-up: {time.perf_counter() - start:.2f}s")
+
+    texts = list(corpus())
+    check_equivalence(texts)
+
+    common = [text for text in texts if not any(text.startswith(expression) for expression in FALLBACK_ONLY)]
+    print(f"Common forms ({len(common)} inputs):")
+    measure("dateparser", old_search, common, repeat)
+    measure("search_date", utils.search_date, common, repeat)
+    fallback = [f"{expression} {MESSAGES[3]}" for expression in FALLBACK_ONLY]
+    print(f"Fallback forms ({len(fallback)} inputs):")
+    measure("dateparser", old_search, fallback, repeat)
+    measure("search_date", utils.search_date, fallback, repeat)
+
+
+if __name__ == '__main__':
+    main()
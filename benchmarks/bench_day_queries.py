@@ -0,0 +1,79 @@
+"""Day lookups on a large journal: DATE(timestamp) = ? scans vs indexed ranges.
+
+Usage: python benchmarks/bench_day_queries.py [rows] [users]
+"""
+import contextlib
+import datetime
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+from kosha import db
+
+DAYS = 365
+QUERIES = 200
+
+
+def populate(conn, rows, users):
+    conn.executemany("INSERT INTO users (id, telegram_chat_id) VALUES (?, ?)",
+                     ((user_id, user_id) for user_id in range(1, users + 1)))
+    start = datetime.datetime(2024, 1, 1)
+    rng = random.Random(42)
+
+    def generate():
+        for i in range(rows):
+            ts = start + datetime.timedelta(seconds=rng.randrange(DAYS * 86400))
+            yield rng.randrange(1, users + 1), f"journal entry {i}", ts.strftime('%Y-%m-%d %H:%M:%S')
+
+    conn.executemany("INSERT INTO logs (user_id, content, timestamp) VALUES (?, ?, ?)", generate())
+    conn.commit()
+
+
+def legacy_get_messages_for_day(user_id, date):
+    return db.get_connection().execute(
+        "SELECT timestamp,content FROM logs WHERE user_id = ? AND DATE(timestamp) = ? ORDER BY timestamp ",
+        (user_id, date)).fetchall()
+
+
+def bench(label, func, lookups):
+    start = time.perf_counter()
+    for user_id, date in lookups:
+        func(user_id, date)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(lookups) * 1e3:9.3f} ms/query")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'bench.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.init_db()
+        conn = db.get_connection()
+
+        start = time.perf_counter()
+        populate(conn, rows, users)
+        print(f"Inserted {rows} log rows for {users} users in {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(7)
+        lookups = [(rng.randrange(1, users + 1),
+                    (datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(DAYS))).isoformat())
+                   for _ in range(QUERIES)]
+
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT timestamp,content FROM logs "
+                            "WHERE user_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+                            (1, '2024-01-01', '2024-01-02')).fetchall()
+        print("Range query plan:", "; ".join(row[3] for row in plan))
+
+        bench('DATE(timestamp) = ?', legacy_get_messages_for_day, lookups)
+        bench('half-open range (indexed)', db.get_messages_for_day, lookups)
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
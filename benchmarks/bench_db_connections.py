@@ -0,0 +1,69 @@
+"""Per-call latency of kosha.db: connect-per-call (old) vs pooled connections.
+
+Usage: python benchmarks/bench_db_connections.py [iterations]
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+from kosha import db
+
+
+def legacy_log_message(user_id, content):
+    """The pre-pooling implementation: new connection, one statement, close."""
+    conn = sqlite3.connect(db.DB_NAME)
+    conn.execute("PRAGMA foreign_keys = ON")
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO logs (user_id, content) VALUES (?, ?)", (user_id, content))
+    conn.commit()
+    conn.close()
+
+
+def legacy_get_or_create_user(telegram_chat_id):
+    conn = sqlite3.connect(db.DB_NAME)
+    conn.execute("PRAGMA foreign_keys = ON")
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM users WHERE telegram_chat_id = ?", (telegram_chat_id,))
+    user = cursor.fetchone()
+    conn.close()
+    return user[0]
+
+
+def timed(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        user_id = db.get_or_create_user(1)
+
+        # Silence the per-call prints so they do not dominate the timings.
+        with contextlib.redirect_stdout(io.StringIO()):
+            cases = [
+                ('get_or_create_user (connect per call)', lambda i: legacy_get_or_create_user(1)),
+                ('get_or_create_user (pooled)', lambda i: db.get_or_create_user(1)),
+                ('log_message (connect per call)', lambda i: legacy_log_message(user_id, f"entry {i}")),
+                ('log_message (pooled)', lambda i: db.log_message(user_id, f"entry {i}")),
+            ]
+            timings = []
+            for label, func in cases:
+                timings.append((label, timed(func, iterations)))
+
+        for label, elapsed in timings:
+            print(f"{label:<40} {elapsed / iterations * 1e6:10.1f} us/call")
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
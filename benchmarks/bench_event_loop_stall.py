@@ -0,0 +1,80 @@
+"""Event-loop stall under concurrent journal traffic: blocking db vs async_db.
+
+A ticker task sleeps for a fixed interval and records how late it wakes up;
+that overshoot is time the loop spent unable to serve other chats.
+
+Usage: python benchmarks/bench_event_loop_stall.py [chats] [messages_per_chat]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+from kosha import db, async_db
+
+TICK = 0.001
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def blocking_chat(chat_id, messages):
+    for i in range(messages):
+        user_id = db.get_or_create_user(chat_id)
+        db.log_message(user_id, f"message {i}")
+        db.get_messages_for_day(user_id, '2000-01-01')
+        await asyncio.sleep(0)
+
+
+async def async_chat(chat_id, messages):
+    for i in range(messages):
+        user_id = await async_db.get_or_create_user(chat_id)
+        await async_db.log_message(user_id, f"message {i}")
+        await async_db.get_messages_for_day(user_id, '2000-01-01')
+
+
+async def run(label, chat, chats, messages):
+    lags = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(chat(chat_id, messages) for chat_id in range(chats)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+
+    lags.sort()
+    p99 = lags[max(int(len(lags) * 0.99) - 1, 0)]
+    return (f"{label:<10} total {elapsed:6.2f}s  ticks {len(lags):6d}  "
+            f"lag mean {statistics.fmean(lags) * 1e3:7.2f}ms  p99 {p99 * 1e3:7.2f}ms  "
+            f"max {lags[-1] * 1e3:7.2f}ms")
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'bench.db')
+        db.init_db()
+
+        # Silence the per-call prints so they do not dominate the timings.
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = [asyncio.run(run(label, chat, chats, messages))
+                       for label, chat in (('blocking', blocking_chat), ('async_db', async_chat))]
+
+        for line in results:
+            print(line)
+        async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Prompt size and memory of long Gemini chats, with and without the session store's token budget.
+
+Turns are recorded straight into the chat history, so no API calls are made.
+Also checks that a chat survives a restart (a fresh store over the same database).
+
+Usage: python benchmarks/bench_gemini_sessions.py [turns] [users]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+from google.genai import types
+
+from kosha import db, sessions
+
+WORDS = "the a journal day work meeting idea walk coffee plan note read write call lunch sleep".split()
+
+
+def fake_turn(chat, rng):
+    question = " ".join(rng.choices(WORDS, k=rng.randrange(10, 60)))
+    answer = " ".join(rng.choices(WORDS, k=rng.randrange(100, 600)))
+    chat.record_history(types.Content(role='user', parts=[types.Part(text=question)]),
+                        [types.Content(role='model', parts=[types.Part(text=answer)])], [], True)
+
+
+async def run(store, turns, users):
+    rng = random.Random(1)
+    user_ids = list(range(1, users + 1))
+    for user_id in user_ids:
+        await store.open(user_id)
+
+    save_time = 0.0
+    for _ in range(turns):
+        for user_id in user_ids:
+            chat = await store.get(user_id)
+            fake_turn(chat, rng)
+            start = time.perf_counter()
+            await store.save(user_id)
+            save_time += time.perf_counter() - start
+    return save_time / (turns * users)
+
+
+def report(label, store, samples):
+    stats = store.stats()
+    growth = " -> ".join(str(samples[i]) for i in range(0, len(samples), max(1, len(samples) // 6)))
+    print(f"{label:<16} prompt tokens by turn: {growth} -> {samples[-1]}")
+    print(f"{'':<16} memory {stats['bytes_per_session'] / 1024:7.1f} KiB/session "
+          f"(largest {stats['largest_session_bytes'] / 1024:.1f} KiB), trimmed {stats['trimmed_messages']} messages")
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, budget in (('unbounded', 10**12), (f'budget {sessions.TOKEN_BUDGET}', sessions.TOKEN_BUDGET)):
+            db.DB_NAME = os.path.join(tmp, f'{budget}.db')
+            db.user_ids.clear()
+            store = sessions.SessionStore(token_budget=budget)
+            with contextlib.redirect_stdout(io.StringIO()):
+                db.init_db()
+                conn = db.get_connection()
+                conn.executemany("INSERT INTO users (id, telegram_chat_id) VALUES (?, ?)", ((i, i) for i in range(1, users + 1)))
+                conn.commit()
+                save_time = asyncio.run(run(store, turns, users))
+            report(label, store, list(store._sessions[1].prompt_tokens))
+            print(f"{'':<16} save {save_time * 1000:.2f} ms/turn")
+
+            # A new store over the same database stands in for a restart.
+            restarted = sessions.SessionStore(token_budget=budget)
+            before = [c.model_dump() for c in store._sessions[1].chat.get_history(curated=True)]
+            chat = asyncio.run(restarted.get(1))
+            after = [c.model_dump() for c in chat.get_history(curated=True)]
+            assert before == after, "history changed across restart"
+        print("Restored histories match the pre-restart chats.")
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Sustained journal insert throughput: commit per message vs group commit.
+
+Each chat sends its messages back to back, the way a pasted or forwarded
+burst arrives. Runs once per synchronous mode, since the cost of a commit is
+mostly the fsync that FULL adds.
+
+Usage: python benchmarks/bench_journal_ingest.py [chats] [messages_per_chat]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+from kosha import db, async_db, journal
+
+
+async def per_message_commit(chats, messages):
+    async def chat(user_id):
+        for i in range(messages):
+            await async_db.log_message(user_id, f"message {i}")
+    await asyncio.gather(*(chat(user_id) for user_id in range(1, chats + 1)))
+
+
+async def group_commit(chats, messages):
+    writer = journal.JournalWriter()
+
+    async def chat(user_id):
+        for i in range(messages):
+            await writer.log(user_id, f"message {i}")
+    await asyncio.gather(*(chat(user_id) for user_id in range(1, chats + 1)))
+    await writer.close()
+    return writer
+
+
+def run(tmp, synchronous, label, func, chats, messages):
+    db.DB_NAME = os.path.join(tmp, f'{label}-{synchronous}.db')
+    db.CONNECTION_PRAGMAS = tuple(
+        f"PRAGMA synchronous = {synchronous}" if pragma.startswith("PRAGMA synchronous") else pragma
+        for pragma in db.CONNECTION_PRAGMAS)
+    db.close_connections()
+    db.user_ids.clear()
+    db.init_db()
+    for chat_id in range(1, chats + 1):
+        db.get_or_create_user(chat_id)
+
+    start = time.perf_counter()
+    result = asyncio.run(func(chats, messages))
+    elapsed = time.perf_counter() - start
+    total = chats * messages
+    batches = f"  ({result.batches} commits)" if result else f"  ({total} commits)"
+    return f"{synchronous:<7} {label:<20} {total / elapsed:10.0f} msg/s{batches}"
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Silence the per-call prints so they do not dominate the timings.
+        with contextlib.redirect_stdout(io.StringIO()):
+            for synchronous in ('NORMAL', 'FULL'):
+                for label, func in (('commit per message', per_message_commit), ('group commit', group_commit)):
+                    results.append(run(tmp, synchronous, label, func, chats, messages))
+        async_db.shutdown()
+
+    for line in results:
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
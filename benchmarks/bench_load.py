@@ -0,0 +1,376 @@
+"""Offline load test: the bot's real handler graph under synthetic traffic.
+
+Builds the Application from main.py against a fake Bot API (in its own
+process, with a configurable one-way delay) and a fake Gemini client (with
+a configurable time to first token), then feeds scenarios of updates
+through the update queue exactly where polling and the webhook put them:
+
+  journal   bursts of plain messages from every chat
+  todos     storms of done/undone taps on each chat's /todos list
+  remind    floods of /remind commands
+  gemini    multi-turn /gemini chats: start, several turns, /endgemini
+
+For each scenario it reports throughput, p50/p99 latency from enqueueing an
+update to its handler finishing (and the handling time alone, without the
+wait in the queue), the event-loop lag seen by a ticker task, and the Bot
+API and Gemini calls made. Results are appended to a JSON-lines file and
+compared with the last run that used the same settings; slower runs are
+flagged.
+
+By default replies are paced by the outbox exactly as in production, so
+throughput is capped near outbox.GLOBAL_RATE; --unthrottled lifts the
+pacing to measure the bot's own capacity.
+
+Usage: python benchmarks/bench_load.py [--chats N] [--per-chat N] [--rate UPDATES/S] [--telegram-delay MS]
+                                       [--gemini-latency MS] [--unthrottled] [--scenarios journal,todos,...]
+                                       [--results FILE] [--strict]
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import _setup  # noqa: F401
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+# Every synthetic chat must be let in.
+os.environ['MY_CHAT_ID'] = ''
+os.environ['PREWARM_IMPORTS'] = 'false'
+
+from telegram import Update
+
+import main as bot
+from fakes import FakeGeminiClient, serve_bot_api
+from main import async_db, client, db, outbox, utils
+from main import todo as todo_handlers
+
+SCENARIOS = ('journal', 'todos', 'remind', 'gemini')
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'load.jsonl')
+TODOS_PER_CHAT = 5
+GEMINI_TURNS = 3
+TICK = 0.005
+# Seconds to wait for a scenario's updates to be handled and its queued sends to drain.
+SCENARIO_TIMEOUT = 300
+# A run is flagged when throughput drops or p99 latency grows by more than these fractions.
+THROUGHPUT_TOLERANCE = 0.10
+LATENCY_TOLERANCE = 0.20
+
+
+def percentile(samples, q):
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class Traffic:
+    """Builds Telegram update payloads with increasing update and message ids."""
+
+    def __init__(self):
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+
+    def _message(self, chat_id, text):
+        message = {'message_id': next(self.message_ids), 'date': int(time.time()), 'text': text,
+                   'chat': {'id': chat_id, 'type': 'private'},
+                   'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'}}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split(' ', 1)[0])}]
+        return message
+
+    def message(self, chat_id, text):
+        return {'update_id': next(self.update_ids), 'message': self._message(chat_id, text)}
+
+    def callback(self, chat_id, data, message_id):
+        message = {'message_id': message_id, 'date': int(time.time()), 'text': "Your TODOs",
+                   'chat': {'id': chat_id, 'type': 'private'},
+                   'from': {'id': 2, 'is_bot': True, 'first_name': 'Kosha'}}
+        return {'update_id': next(self.update_ids),
+                'callback_query': {'id': str(next(self.message_ids)), 'chat_instance': str(chat_id), 'data': data,
+                                   'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+                                   'message': message}}
+
+
+def interleave(per_chat):
+    """Round-robins the chats' update lists, keeping each chat's own order."""
+    return [update for round_ in itertools.zip_longest(*per_chat) for update in round_ if update is not None]
+
+
+async def journal_updates(traffic, chats, per_chat):
+    return [], interleave([[traffic.message(chat_id, f"journal entry {i} from chat {chat_id}: walked, read, wrote")
+                            for i in range(per_chat)] for chat_id in chats])
+
+
+async def todos_updates(traffic, chats, per_chat):
+    setup = interleave([[traffic.message(chat_id, f"/todo task {i} for chat {chat_id}") for i in range(TODOS_PER_CHAT)]
+                        for chat_id in chats])
+    setup += [traffic.message(chat_id, "/todos") for chat_id in chats]
+
+    async def storm():
+        today = datetime.date.today().strftime('%Y-%m-%d')
+        taps = []
+        for chat_id in chats:
+            user_id = await async_db.get_or_create_user(chat_id)
+            todo_ids = [todo['id'] for todo in await async_db.get_todos_for_user(user_id, today)]
+            message_id = next(traffic.message_ids)
+            taps.append([traffic.callback(chat_id, f"{'done' if i % 2 == 0 else 'undone'}:{todo_ids[i // 2 % len(todo_ids)]}",
+                                          message_id) for i in range(per_chat)])
+        return interleave(taps)
+    return setup, storm
+
+
+async def remind_updates(traffic, chats, per_chat):
+    return [], interleave([[traffic.message(chat_id, f"/remind in {10 + i} minutes to stretch number {i}")
+                            for i in range(per_chat)] for chat_id in chats])
+
+
+async def gemini_updates(traffic, chats, per_chat):
+    conversations = []
+    for chat_id in chats:
+        updates = []
+        for session in range(max(1, per_chat // (GEMINI_TURNS + 2))):
+            updates.append(traffic.message(chat_id, "/gemini"))
+            updates += [traffic.message(chat_id, f"question {session}.{turn} from chat {chat_id}: what should I do next?")
+                        for turn in range(GEMINI_TURNS)]
+            updates.append(traffic.message(chat_id, "/endgemini"))
+        conversations.append(updates)
+    return [], interleave(conversations)
+
+
+BUILDERS = {'journal': journal_updates, 'todos': todos_updates, 'remind': remind_updates, 'gemini': gemini_updates}
+
+
+class Driver:
+    """Feeds updates into a started Application and times each one through process_update."""
+
+    def __init__(self, application):
+        self.application = application
+        self.enqueued = {}
+        self.started = {}
+        self.finished = {}
+        self.all_done = asyncio.Event()
+        self.expected = set()
+        process_update = application.process_update
+
+        async def timed_process_update(update):
+            self.started[update.update_id] = time.perf_counter()
+            try:
+                await process_update(update)
+            finally:
+                self.finished[update.update_id] = time.perf_counter()
+                if self.expected <= self.finished.keys():
+                    self.all_done.set()
+        application.process_update = timed_process_update
+
+    async def feed(self, payloads, rate):
+        self.all_done.clear()
+        self.expected = {payload['update_id'] for payload in payloads}
+        start = time.perf_counter()
+        for i, payload in enumerate(payloads):
+            if rate:
+                await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+            self.enqueued[payload['update_id']] = time.perf_counter()
+            await self.application.update_queue.put(Update.de_json(payload, self.application.bot))
+        await asyncio.wait_for(self.all_done.wait(), SCENARIO_TIMEOUT)
+        # Coalesced TODO edits and queued sends finish after their handlers return.
+        deadline = time.monotonic() + SCENARIO_TIMEOUT
+        while (outbox.queue.depth or todo_handlers._pending_edits) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+def bot_api_calls(port):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/botload/benchmarkCalls", data=b'{}',
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)['result']
+
+
+async def run_scenario(name, driver, traffic, chats, per_chat, rate, port, gemini):
+    setup, updates = await BUILDERS[name](traffic, chats, per_chat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if setup:
+            await driver.feed(setup, 0)
+        if callable(updates):
+            updates = await updates()
+
+    api_before = await asyncio.to_thread(bot_api_calls, port)
+    gemini_before = sum(gemini.calls.values())
+    lags = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    with contextlib.redirect_stdout(io.StringIO()):
+        await driver.feed(updates, rate)
+    stop.set()
+    await tick_task
+    api_after = await asyncio.to_thread(bot_api_calls, port)
+
+    ids = [update['update_id'] for update in updates]
+    total = sorted(driver.finished[i] - driver.enqueued[i] for i in ids)
+    handling = sorted(driver.finished[i] - driver.started[i] for i in ids)
+    elapsed = max(driver.finished[i] for i in ids) - min(driver.enqueued[i] for i in ids)
+    lags.sort()
+    return {
+        'updates': len(ids),
+        'throughput': len(ids) / elapsed,
+        'p50': statistics.median(total),
+        'p99': percentile(total, 0.99),
+        'handling_p50': statistics.median(handling),
+        'handling_p99': percentile(handling, 0.99),
+        'loop_lag_p99': percentile(lags, 0.99) if lags else 0.0,
+        'loop_lag_max': lags[-1] if lags else 0.0,
+        'bot_api_calls': sum(api_after.values()) - sum(api_before.values()),
+        'gemini_calls': sum(gemini.calls.values()) - gemini_before,
+    }
+
+
+async def run(args, port):
+    gemini = client._client = FakeGeminiClient(args.gemini_latency / 1000)
+    # As main.prewarm does a second after startup, so no scenario pays for the imports.
+    await asyncio.to_thread(client.warm_up)
+    await asyncio.to_thread(utils.warm_up_date_parser)
+    application = bot.build_application(f"http://127.0.0.1:{port}/bot")
+    await application.initialize()
+    await application.start()
+    driver = Driver(application)
+    traffic = Traffic()
+
+    results = {}
+    try:
+        for offset, name in enumerate(args.scenarios):
+            # Each scenario gets chats of its own, so none starts with another's state.
+            chats = range(100000 * (offset + 1), 100000 * (offset + 1) + args.chats)
+            results[name] = await run_scenario(name, driver, traffic, chats, args.per_chat, args.rate, port, gemini)
+            report(name, results[name])
+    finally:
+        await application.stop()
+        await application.shutdown()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await outbox.queue.close()
+    return results
+
+
+def report(name, result):
+    print(f"  {name:<8} {result['updates']:>6} {result['throughput']:>9.1f}/s "
+          f"{result['p50'] * 1000:>9.1f} {result['p99'] * 1000:>9.1f} "
+          f"{result['handling_p50'] * 1000:>9.1f} {result['handling_p99'] * 1000:>9.1f} "
+          f"{result['loop_lag_p99'] * 1000:>8.1f} {result['loop_lag_max'] * 1000:>8.1f} "
+          f"{result['bot_api_calls']:>8} {result['gemini_calls']:>7}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, results):
+    """Prints the change from the previous comparable run and returns the scenarios that got slower."""
+    print(f"Compared with the run of {previous['time']} (commit {previous['commit'] or 'unknown'}):")
+    regressions = []
+    for name, result in results.items():
+        before = previous['scenarios'].get(name)
+        if before is None:
+            continue
+        throughput = result['throughput'] / before['throughput'] - 1
+        p99 = result['p99'] / before['p99'] - 1
+        slower = throughput < -THROUGHPUT_TOLERANCE or p99 > LATENCY_TOLERANCE
+        if slower:
+            regressions.append(name)
+        print(f"  {name:<8} throughput {throughput:+7.1%}  p99 {p99:+7.1%}{'  <- slower' if slower else ''}")
+    return regressions
+
+
+def save(path, record):
+    """Appends this run to `path` and returns the last earlier run with the same settings, if any."""
+    previous = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                run = json.loads(line)
+                if run['config'] == record['config']:
+                    previous = run
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    return previous
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load-test the bot's handlers against fake Telegram and Gemini APIs.")
+    parser.add_argument('--chats', type=int, default=50, help="concurrent chats per scenario")
+    parser.add_argument('--per-chat', type=int, default=10, help="updates each chat sends per scenario")
+    parser.add_argument('--rate', type=float, default=0, help="updates per second offered (0: all at once)")
+    parser.add_argument('--telegram-delay', type=float, default=0, help="one-way Bot API delay in ms")
+    parser.add_argument('--gemini-latency', type=float, default=300, help="Gemini time to first token in ms")
+    parser.add_argument('--unthrottled', action='store_true', help="lift the outbox's Telegram rate limits")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma-separated subset of " + ', '.join(SCENARIOS))
+    parser.add_argument('--results', default=RESULTS, help="JSON-lines file the results are appended to")
+    parser.add_argument('--strict', action='store_true', help="exit with status 1 when a scenario got slower")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.unthrottled:
+        outbox.CHAT_RATE = outbox.CHAT_BURST = outbox.GLOBAL_RATE = outbox.GLOBAL_BURST = 1e6
+        outbox.queue = outbox.Outbox()
+
+    receive_port, send_port = multiprocessing.Pipe(duplex=False)
+    api = multiprocessing.Process(target=serve_bot_api, args=(args.telegram_delay / 1000, send_port), daemon=True)
+    api.start()
+    port = receive_port.recv()
+
+    print(f"{args.chats} chats x {args.per_chat} updates per scenario, "
+          f"{f'{args.rate:.0f} updates/s' if args.rate else 'all at once'}, "
+          f"{args.telegram_delay:.0f} ms Bot API delay, {args.gemini_latency:.0f} ms Gemini latency"
+          f"{', unthrottled' if args.unthrottled else ''}:")
+    print(f"  {'scenario':<8} {'updates':>6} {'throughput':>11} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'handle50':>9} {'handle99':>9} {'lag99 ms':>8} {'lagmax':>8} {'api':>8} {'gemini':>7}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_NAME = os.path.join(tmp, 'load.db')
+            db.user_ids.clear()
+            db.user_shards.clear()
+            with contextlib.redirect_stdout(io.StringIO()):
+                db.init_db()
+            results = asyncio.run(run(args, port))
+            with contextlib.redirect_stdout(io.StringIO()):
+                async_db.shutdown()
+    finally:
+        api.terminate()
+
+    config = {name: getattr(args, name) for name in
+              ('chats', 'per_chat', 'rate', 'telegram_delay', 'gemini_latency', 'unthrottled', 'scenarios')}
+    record = {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+              'config': config, 'scenarios': results}
+    previous = save(args.results, record)
+    print(f"Results appended to {args.results}.")
+    if previous is not None and compare(previous, results) and args.strict:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""Storage and read cost of archiving old journal entries into compressed monthly blobs.
+
+Fills two shards with a year of journal entries (and embeddings for some of
+them), then archives everything before the start of the month three months
+ago: first with the nightly job through async_db, then once more by hand after
+back-dated entries land in an already archived month, so they are merged into
+it. Reports the size of the live journal b-trees (what scans and day lookups
+keep in the page cache), the archive, and the files before and after VACUUM,
+plus the time of a full logs scan and of live and archived day lookups.
+
+Checks that every user's days read back exactly as before, that journal sizes
+are unchanged, that no entry older than the cutoff is left live, that the
+archived entries' embeddings and full-text rows are gone, that /ask's cached
+dense index no longer holds them, and that a rebalance to three shards
+carries the archives along.
+
+Usage: python benchmarks/bench_log_archive.py [users] [months] [entries per day]
+"""
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+
+from kosha import archive, async_db, db, rebalance, retrieval
+
+SHARDS = 2
+ARCHIVE_DAYS = 90
+WORDS = ("walked the dog, coffee with sam, long meeting about the roadmap, read two chapters, "
+         "felt tired after lunch, fixed the bike, called mom, cooked pasta, idea for the garden").split(", ")
+LOOKUPS = 2000
+
+
+def use_database(path, shards):
+    db.close_connections()
+    db.DB_NAME = path
+    db.SHARDS = shards
+    db.user_ids.clear()
+    db.user_shards.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.init_db()
+
+
+def populate(users, months, per_day, now):
+    rng = random.Random(1)
+    user_ids = [db.get_or_create_user(chat_id) for chat_id in range(1, users + 1)]
+    days = months * 30
+    for user_id in user_ids:
+        shard = db.shard_of_user(user_id)
+        conn = db.get_connection(shard)
+        rows = []
+        for day in range(days, -1, -1):
+            for _ in range(rng.randrange(per_day * 2 + 1)):
+                moment = now - datetime.timedelta(days=day, seconds=rng.randrange(86400))
+                content = "; ".join(rng.choices(WORDS, k=rng.randrange(1, 8)))
+                rows.append((moment.strftime('%Y-%m-%d %H:%M:%S'), user_id, content))
+        rows.sort()
+        with conn:
+            conn.executemany(f"INSERT INTO logs (id, user_id, content, timestamp) VALUES ({db.next_id('logs', shard)}, ?, ?, ?)",
+                             [(user_id, content, timestamp) for timestamp, user_id, content in rows])
+        entries = conn.execute("SELECT id FROM logs WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        db.put_embeddings([('log', row_id, user_id, os.urandom(32)) for (row_id,) in entries[::10]])
+    return user_ids, days
+
+
+def snapshot(user_ids, days, now):
+    dates = [(now - datetime.timedelta(days=day)).date() for day in range(days + 1)]
+    return {user_id: ([[tuple(row) for row in db.get_messages_for_day(user_id, date)] for date in dates],
+                      tuple(db.get_journal_size(user_id)))
+            for user_id in user_ids}
+
+
+def storage():
+    # Settle recent writes into the main files first, so before and after compare like with like.
+    for shard in range(db.shard_count):
+        db.get_connection(shard).execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return archive._total([db.log_storage(shard) for shard in range(db.shard_count)])
+
+
+
+def timed_reads(user_ids, now):
+    rng = random.Random(2)
+
+    def lookups(days_ago):
+        samples = []
+        for _ in range(LOOKUPS):
+            user_id = rng.choice(user_ids)
+            date = (now - datetime.timedelta(days=days_ago(rng))).date()
+            start = time.perf_counter()
+            db.get_messages_for_day(user_id, date)
+            samples.append(time.perf_counter() - start)
+        return statistics.median(samples)
+
+    start = time.perf_counter()
+    for shard in range(db.shard_count):
+        db.get_connection(shard).execute("SELECT COUNT(*), SUM(LENGTH(content)) FROM logs").fetchone()
+    scan = time.perf_counter() - start
+    return scan, lookups(lambda rng: rng.randrange(0, 30)), lookups(lambda rng: rng.randrange(120, 330))
+
+
+def check_archived(before):
+    for shard in range(db.shard_count):
+        conn = db.get_connection(shard)
+        stale = conn.execute("SELECT COUNT(*) FROM logs WHERE timestamp < ?", (before,)).fetchone()[0]
+        assert stale == 0, f"{stale} entries older than {before} are still live in shard {shard}"
+        orphans = conn.execute("""SELECT COUNT(*) FROM journal_embeddings e WHERE kind = 'log'
+                                  AND NOT EXISTS (SELECT 1 FROM logs WHERE logs.id = e.row_id)""").fetchone()[0]
+        assert orphans == 0, f"{orphans} embeddings of archived entries left in shard {shard}"
+        indexed = conn.execute("SELECT COUNT(*) FROM logs_fts").fetchone()[0]
+        live = conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+        assert indexed == live, f"shard {shard}: {indexed} full-text rows for {live} entries"
+        with conn:
+            conn.execute("INSERT INTO logs_fts (logs_fts) VALUES ('integrity-check')")
+        assert not conn.execute("PRAGMA foreign_key_check").fetchall(), f"foreign key violations in shard {shard}"
+
+
+def cache_dense_index(user_ids):
+    """Loads users' embeddings into a dense index as /ask would, without embedding anything new."""
+    import numpy
+
+    retrieval.dense = retrieval.DenseIndex()
+    for user_id in user_ids:
+        rows = db.get_embeddings(user_id)
+        retrieval.dense._users[user_id] = ([(kind, row_id) for kind, row_id, _ in rows],
+                                           numpy.vstack([numpy.frombuffer(vector, dtype=numpy.float32) for _, _, vector in rows]))
+
+
+def check_dense_index():
+    for user_id, (keys, _) in retrieval.dense._users.items():
+        stored = {(kind, row_id) for kind, row_id, _ in db.get_embeddings(user_id)}
+        assert stored.issuperset(keys), f"user {user_id}'s cached dense index still holds archived entries"
+
+
+def backdate(user_ids, before):
+    """Adds an entry to an already archived month for some users, as an import or a clock fix might."""
+    moment = (datetime.datetime.fromisoformat(before) - datetime.timedelta(days=40)).strftime('%Y-%m-%d %H:%M:%S')
+    for user_id in user_ids[::7]:
+        shard = db.shard_of_user(user_id)
+        with db.get_connection(shard) as conn:
+            conn.execute(f"INSERT INTO logs (id, user_id, content, timestamp) VALUES ({db.next_id('logs', shard)}, ?, ?, ?)",
+                         (user_id, "found an old note", moment))
+
+
+def mb(size):
+    return f"{size / 1e6:8.2f} MB"
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    months = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    per_day = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    before = archive.cutoff(ARCHIVE_DAYS)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_database(os.path.join(tmp, 'archive.db'), SHARDS)
+        with contextlib.redirect_stdout(io.StringIO()):
+            user_ids, days = populate(users, months, per_day, now)
+        entries = sum(db.get_connection(shard).execute("SELECT COUNT(*) FROM logs").fetchone()[0] for shard in range(SHARDS))
+        expected = snapshot(user_ids, days, now)
+        storage_before = storage()
+        scan_before, live_before, old_before = timed_reads(user_ids, now)
+
+        cache_dense_index(user_ids)
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(archive.run_nightly_archive(ARCHIVE_DAYS))
+        check_archived(before)
+        check_dense_index()
+        assert snapshot(user_ids, days, now) == expected, "archived days read back differently"
+
+        # Back-dated entries in archived months are merged into them on the next run.
+        backdate(user_ids, before)
+        expected = snapshot(user_ids, days, now)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            merged, _ = archive.archive(ARCHIVE_DAYS)
+        merge_time = time.perf_counter() - start
+        check_archived(before)
+        assert merged == len(user_ids[::7]), f"merged {merged} back-dated entries, expected {len(user_ids[::7])}"
+        assert snapshot(user_ids, days, now) == expected, "days read back differently after merging into archived months"
+
+        storage_after = storage()
+        scan_after, live_after, old_after = timed_reads(user_ids, now)
+        archived = sum(db.get_connection(shard).execute("SELECT COALESCE(SUM(entries), 0) FROM logs_archive").fetchone()[0]
+                       for shard in range(db.shard_count))
+
+        print(f"{users} users, {days} days, {entries} entries; {archived} archived from before {before[:7]}:")
+        print(f"  live journal b-trees {mb(storage_before['live_bytes'])} -> {mb(storage_after['live_bytes'])}  "
+              f"(archive {mb(storage_after['archive_bytes']).strip()})")
+        print(f"  files                {mb(storage_before['file_bytes'])} -> {mb(storage_after['file_bytes'])}  "
+              f"({mb(storage_after['free_bytes']).strip()} in free pages)")
+        for shard in range(db.shard_count):
+            db.vacuum(shard)
+        print(f"  files after VACUUM   {mb(storage()['file_bytes'])}")
+        print(f"  full logs scan       {scan_before * 1000:8.2f} ms -> {scan_after * 1000:8.2f} ms")
+        print(f"  live day lookup      {live_before * 1e6:8.1f} us -> {live_after * 1e6:8.1f} us")
+        print(f"  archived day lookup  {old_before * 1e6:8.1f} us -> {old_after * 1e6:8.1f} us")
+        print(f"  merging {merged} back-dated entries into archived months took {merge_time:.2f}s")
+
+        db.SHARDS = 3
+        with contextlib.redirect_stdout(io.StringIO()):
+            rebalance.rebalance()
+        db.user_shards.clear()
+        check_archived(before)
+        assert snapshot(user_ids, days, now) == expected, "days read back differently after a rebalance"
+        print("Every day and journal size read back unchanged after archiving, merging and a rebalance to 3 shards; "
+              "no archived entry left in the cached dense index.")
+        with contextlib.redirect_stdout(io.StringIO()):
+            async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Markdown to Telegram HTML: the three-step utils pipeline vs the single-pass render_telegram_html.
+
+Before timing, checks on random Gemini-like replies that the single-pass
+renderer keeps every chunk within the limit with balanced tags, renders the
+same HTML as markdown_to_safe_html when nothing is split, and carries the
+same visible text as the old pipeline. Then checks the same bounds on
+multi-megabyte single paragraphs, including runs where escaping grows the
+text several times over.
+
+Usage: python benchmarks/bench_markdown_render.py [property cases]
+"""
+import html
+import random
+import re
+import sys
+import time
+
+import _setup  # noqa: F401
+
+from kosha import utils
+
+WORDS = "the a journal day work <meeting> idea & walk \"coffee\" plan note it's read write call lunch sleep".split()
+CODE = "x = compute(value) + 1; return items[0] if items else None".split()
+TAG = re.compile(r'</?(\w+)>')
+
+
+def words(rng, low, high):
+    return " ".join(rng.choices(WORDS, k=rng.randrange(low, high)))
+
+
+def paragraph(rng):
+    kind = rng.random()
+    if kind < 0.1:
+        return "```\n" + "\n".join(" ".join(rng.choices(CODE, k=rng.randrange(2, 10))) for _ in range(rng.randrange(1, 8))) + "\n```"
+    if kind < 0.25:
+        return "\n".join(f"- **{words(rng, 1, 3)}:** {words(rng, 3, 20)}" for _ in range(rng.randrange(2, 6)))
+    if kind < 0.3:
+        return "## " + words(rng, 2, 6)
+    pieces = []
+    for _ in range(rng.randrange(1, 6)):
+        style = rng.random()
+        text = words(rng, 2, 25)
+        if style < 0.2:
+            text = f"**{text}**"
+        elif style < 0.35:
+            text = f"*{text}*"
+        elif style < 0.45:
+            text = f"`{rng.choice(CODE)}` {text}"
+        pieces.append(text)
+    return " ".join(pieces)
+
+
+def reply(rng, paragraphs):
+    return "\n\n".join(paragraph(rng) for _ in range(paragraphs))
+
+
+def old_pipeline(text, max_length=4000):
+    chunks = utils.split_message_for_telegram(utils.markdown_to_safe_html(text), max_length)
+    return utils.fix_chunks_with_tags(chunks)
+
+
+def new_pipeline(text, max_length=4000):
+    return list(utils.render_telegram_html(text, max_length))
+
+
+def visible(chunks):
+    return re.sub(r'\s+', '', html.unescape(TAG.sub('', ''.join(chunks))))
+
+
+def balanced(chunk):
+    stack = []
+    for match in TAG.finditer(chunk):
+        if match.group(0).startswith('</'):
+            if not stack or stack.pop() != match.group(1):
+                return False
+        else:
+            stack.append(match.group(1))
+    return not stack
+
+
+def check_properties(cases):
+    rng = random.Random(7)
+    for case in range(cases):
+        text = reply(rng, rng.randrange(1, 40))
+        max_length = rng.choice((120, 500, 1000, 4000))
+        chunks = new_pipeline(text, max_length)
+        assert all(len(chunk) <= max_length for chunk in chunks), f"case {case}: oversized chunk"
+        assert all(balanced(chunk) for chunk in chunks), f"case {case}: unbalanced tags"
+        assert visible(chunks) == visible(old_pipeline(text, max_length)), f"case {case}: visible text differs"
+        assert "".join(new_pipeline(text, 10**9)) == utils.markdown_to_safe_html(text).strip(), f"case {case}: HTML differs"
+    print(f"{cases} random replies: chunks bounded and balanced, HTML and visible text match the old pipeline.")
+
+
+def check_large_inputs():
+    rng = random.Random(3)
+    inputs = [
+        ("4 MB paragraph", words(rng, 700_000, 700_001), 4000),
+        ("2 MB of 'word '", 'word ' * 400_000, 4000),
+        ("1 MB without spaces", "".join(rng.choices(WORDS, k=200_000)), 4000),
+        ("ampersands", "&" * 200_000 + " <b>", 500),
+    ]
+    for label, text, max_length in inputs:
+        start = time.perf_counter()
+        chunks = new_pipeline(text, max_length)
+        elapsed = time.perf_counter() - start
+        assert all(len(chunk) <= max_length for chunk in chunks), f"{label}: oversized chunk"
+        assert all(balanced(chunk) for chunk in chunks), f"{label}: unbalanced tags"
+        assert visible(chunks) == re.sub(r'\s+', '', text), f"{label}: visible text differs"
+        print(f"{label} ({len(text)} chars): {len(chunks)} chunks in {elapsed * 1000:.0f} ms, bounded and balanced.")
+
+
+def measure(label, func, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chunks = func(text)
+    elapsed = (time.perf_counter() - start) / repeat
+    oversized = sum(len(chunk) > 4000 for chunk in chunks)
+    print(f"  {label:<12} {elapsed * 1000:9.2f} ms  {len(chunks):4d} chunks  {oversized} over 4000 chars")
+
+
+def main():
+    check_properties(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
+    check_large_inputs()
+
+    rng = random.Random(1)
+    inputs = [(f"{size} paragraphs", reply(rng, size)) for size in (10, 100, 1000, 10000)]
+    inputs.append(("one 200k-char line", words(rng, 40000, 40001)))
+    for label, text in inputs:
+        print(f"{label} ({len(text)} chars):")
+        repeat = max(1, 200_000 // len(text))
+        measure("three-step", old_pipeline, text, repeat)
+        measure("single-pass", new_pipeline, text, repeat)
+
+
+if __name__ == '__main__':
+    main()
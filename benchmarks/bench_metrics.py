@@ -0,0 +1,193 @@
+"""Cost of the metrics instrumentation, and a check of what /metrics and /stats serve.
+
+Times a bare Histogram.observe and Counter.inc, a handler call through
+restricted_access, and an async_db read with its wait and query timings,
+each against the same work without metrics. Then records from several
+threads at once and checks that no sample is lost, scrapes the endpoint
+over HTTP and validates the exposition format (names, labels, cumulative
+buckets ending in +Inf equal to _count), and checks that the /stats
+summary fits in one Telegram message.
+
+Usage: python benchmarks/bench_metrics.py [iterations]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import _setup  # noqa: F401
+
+# The fake updates come from a chat that must not be turned away.
+os.environ['MY_CHAT_ID'] = ''
+
+from kosha import async_db, db, metrics
+from kosha.handlers import admin, auth
+
+THREADS = 8
+TELEGRAM_MESSAGE_LIMIT = 4096
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+
+
+class FakeChat:
+    id = 1
+
+
+class FakeUpdate:
+    effective_chat = FakeChat()
+
+
+def per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def measure_primitives(iterations):
+    histogram = metrics.Histogram('bench_observe_seconds', "benchmark", ('name',))
+    counter = metrics.Counter('bench_inc_total', "benchmark", ('name',))
+    observe = per_call(lambda: histogram.observe(0.003, name='x'), iterations)
+    inc = per_call(lambda: counter.inc(name='x'), iterations)
+    print(f"Histogram.observe: {observe * 1e9:.0f} ns, Counter.inc: {inc * 1e9:.0f} ns")
+
+
+async def measure_handler(iterations):
+    async def handler(update, context):
+        return None
+
+    wrapped = auth.restricted_access(handler)
+    update = FakeUpdate()
+
+    async def loop(func):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await func(update, None)
+        return (time.perf_counter() - start) / iterations
+
+    bare, timed = await loop(handler), await loop(wrapped)
+    print(f"Handler call: {bare * 1e6:.2f} us bare, {timed * 1e6:.2f} us through restricted_access")
+
+
+async def measure_db(iterations):
+    loop = asyncio.get_running_loop()
+    with contextlib.redirect_stdout(io.StringIO()):
+        user_id = await async_db.get_or_create_user(1)
+        await async_db.log_message(user_id, "hello")
+
+    async def run(call):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await call()
+        return (time.perf_counter() - start) / iterations
+
+    bare = await run(lambda: loop.run_in_executor(async_db._readers, db.get_messages_for_day, user_id, '2025-01-01'))
+    timed = await run(lambda: async_db.get_messages_for_day(user_id, '2025-01-01'))
+    print(f"async_db read: {bare * 1e6:.1f} us without metrics, {timed * 1e6:.1f} us with wait and query timings")
+
+
+def check_threads(iterations):
+    histogram = metrics.Histogram('bench_threads_seconds', "benchmark")
+    counter = metrics.Counter('bench_threads_total', "benchmark")
+
+    def record():
+        for i in range(iterations):
+            histogram.observe(i % 100 / 1000)
+            counter.inc()
+
+    threads = [threading.Thread(target=record) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    (series,) = histogram.series().values()
+    assert series.count == sum(series.counts) == THREADS * iterations, "histogram lost samples"
+    assert counter.value() == THREADS * iterations, "counter lost increments"
+    print(f"{THREADS} threads recorded {THREADS * iterations} samples, none lost.")
+
+
+def check_exposition(text):
+    families = {}
+    buckets = {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            families[name] = kind
+            continue
+        if line.startswith('#'):
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"malformed sample line: {line!r}"
+        name, labels, value = match.group(1), match.group(2) or '', match.group(3)
+        float(value.replace('+Inf', 'inf'))
+        family = re.sub(r'_(bucket|sum|count)$', '', name)
+        assert name in families or family in families, f"sample {name} has no TYPE line"
+        if name.endswith('_bucket'):
+            series = re.sub(r',?le="[^"]*"', '', labels)
+            buckets.setdefault((family, series), []).append((re.search(r'le="([^"]*)"', labels).group(1), float(value)))
+        elif name.endswith('_count') and families.get(family) == 'histogram':
+            series_buckets = buckets[(family, labels.replace('{}', ''))]
+            counts = [count for _, count in series_buckets]
+            assert counts == sorted(counts), f"{family}{labels} buckets are not cumulative"
+            assert series_buckets[-1] == ('+Inf', float(value)), f"{family}{labels} +Inf bucket != _count"
+    return families
+
+
+async def check_endpoint():
+    await metrics.server.start('127.0.0.1', 0)
+    url = f"http://127.0.0.1:{metrics.server.port}"
+    try:
+        response = await asyncio.to_thread(urllib.request.urlopen, url + '/metrics')
+        assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+        text = response.read().decode('utf-8')
+        with contextlib.suppress(urllib.error.HTTPError):
+            await asyncio.to_thread(urllib.request.urlopen, url + '/other')
+            raise AssertionError("a path other than /metrics was served")
+    finally:
+        await metrics.server.stop()
+    families = check_exposition(text)
+    for name in ('kosha_handler_seconds', 'kosha_db_query_seconds', 'kosha_gemini_tokens_total', 'kosha_send_errors_total'):
+        assert name in families, f"{name} missing from /metrics"
+    assert 'query="get_messages_for_day"' in text, "db queries are not being timed"
+    print(f"Scraped {len(text)} bytes, {len(families)} metric families, all well formed.")
+
+
+def check_stats():
+    metrics.gemini_tokens.inc(1200, model='gemini-2.5-flash', kind='prompt')
+    metrics.send_errors.inc(method='send_message', error='Forbidden')
+    text = admin.render_stats()
+    assert len(text) < TELEGRAM_MESSAGE_LIMIT, f"/stats is {len(text)} characters"
+    assert 'gemini-2.5-flash/prompt: 1200' in text and 'send_message/Forbidden: 1' in text
+    print(f"/stats summary is {len(text)} characters.")
+
+
+async def run(iterations):
+    await measure_handler(iterations)
+    await measure_db(iterations // 10)
+    await check_endpoint()
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'metrics.db')
+        db.user_ids.clear()
+        db.user_shards.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.init_db()
+        measure_primitives(iterations)
+        asyncio.run(run(iterations))
+        check_threads(iterations // 10)
+        check_stats()
+        with contextlib.redirect_stdout(io.StringIO()):
+            async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
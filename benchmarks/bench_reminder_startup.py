@@ -0,0 +1,103 @@
+"""Startup cost with many pending reminders: one APScheduler job each vs the windowed dispatcher.
+
+Usage: python benchmarks/bench_reminder_startup.py [pending] [missed]
+"""
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import _setup  # noqa: F401
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.date import DateTrigger
+
+from kosha import db, outbox, reminder_dispatcher, utils
+
+CHATS = 100
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, **kwargs):
+        self.sent += 1
+
+
+def populate(pending, missed):
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO users (id, telegram_chat_id) VALUES (?, ?)",
+                     ((chat_id, chat_id) for chat_id in range(1, CHATS + 1)))
+    rng = random.Random(1)
+    now = datetime.datetime.now(utils.tz)
+
+    def rows():
+        for i in range(pending + missed):
+            offset = -rng.randrange(60, 86400) if i < missed else rng.randrange(600, 30 * 86400)
+            fire = now + datetime.timedelta(seconds=offset)
+            yield rng.randrange(1, CHATS + 1), f"reminder {i}", fire.isoformat(), int(fire.timestamp())
+
+    conn.executemany("INSERT INTO reminders (user_id, content, timestamp, fire_at) VALUES (?, ?, ?, ?)", rows())
+    conn.commit()
+
+
+async def legacy_startup(bot):
+    """What setup_scheduler_jobs used to do: one DateTrigger job per reminder, missed ones sent one by one."""
+    scheduler = AsyncIOScheduler(timezone=utils.tz)
+    scheduler.start()
+    for reminder in db.get_active_reminders():
+        time_stamp = utils.normalize_timestamp(datetime.datetime.fromisoformat(reminder['timestamp']))
+        if time_stamp <= datetime.datetime.now(utils.tz) + datetime.timedelta(seconds=5):
+            await bot.send_message(chat_id=reminder['chat_id'], text=reminder['content'])
+            continue
+        scheduler.add_job(bot.send_message, DateTrigger(run_date=time_stamp), id=f"reminder_{reminder['id']}")
+    jobs = len(scheduler.get_jobs())
+    scheduler.shutdown(wait=False)
+    return jobs
+
+
+async def dispatcher_startup(bot):
+    dispatcher = reminder_dispatcher.ReminderDispatcher()
+    await dispatcher.start(bot)
+    dispatcher.stop()
+    return len(dispatcher._heap)
+
+
+def measure(label, func):
+    bot = FakeBot()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        held = asyncio.run(func(bot))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} {elapsed:7.2f}s  peak {peak / 2**20:7.1f} MiB  "
+          f"in memory {held:7d}  missed-reminder messages {bot.sent}")
+
+
+def main():
+    pending = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    missed = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    # Fake sends are instant; do not let Telegram pacing dominate the timing.
+    outbox.CHAT_RATE = outbox.CHAT_BURST = 1e9
+    outbox.queue.global_bucket.rate = outbox.queue.global_bucket.capacity = 1e9
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, func in (('APScheduler job each', legacy_startup), ('windowed dispatcher', dispatcher_startup)):
+            db.DB_NAME = os.path.join(tmp, f'{func.__name__}.db')
+            with contextlib.redirect_stdout(io.StringIO()):
+                db.init_db()
+                populate(pending, missed)
+            measure(label, func)
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
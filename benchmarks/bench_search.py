@@ -0,0 +1,113 @@
+"""Journal search latency: ranked FTS5 search vs an unranked LIKE scan, on a large generated journal.
+
+Also times a page deep into a common word's matches, and checks that paging
+through every match of a moderately common word returns each one exactly once.
+
+Usage: python benchmarks/bench_search.py [rows] [users]
+"""
+import contextlib
+import io
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+
+from kosha import db
+
+VOCABULARY = 20000
+REPEAT = 20
+BATCH = 50_000
+PAGE = 50
+
+
+def populate(rows, users):
+    rng = random.Random(1)
+    words = [f"w{i}" for i in range(VOCABULARY)]
+    # Zipf-like word frequencies, as in natural text.
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY)))
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO users (id, telegram_chat_id) VALUES (?, ?)", ((i, i) for i in range(1, users + 1)))
+
+    elapsed = 0.0
+    for batch_start in range(0, rows, BATCH):
+        batch = [(rng.randrange(1, users + 1), " ".join(rng.choices(words, cum_weights=cumulative, k=rng.randrange(8, 30))))
+                 for _ in range(min(BATCH, rows - batch_start))]
+        start = time.perf_counter()
+        with conn:
+            conn.executemany("INSERT INTO logs (user_id, content) VALUES (?, ?)", batch)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def like_search(user_id, text, limit, offset=0):
+    conn = db.get_connection()
+    clauses = " AND ".join("content LIKE ?" for _ in text.split())
+    return conn.execute(f"SELECT id, timestamp, content FROM logs WHERE user_id = ? AND {clauses} LIMIT ? OFFSET ?",
+                        (user_id, *(f"%{word}%" for word in text.split()), limit, offset)).fetchall()
+
+
+def check_paging(text):
+    """Pages through every match of `text` and checks each is returned once, with the block note where it applies."""
+    conn = db.get_connection()
+    expected = {row[0] for row in conn.execute("SELECT rowid FROM logs_fts WHERE logs_fts MATCH ?",
+                                              (f'user_id : "1" AND content : ({db.fts_query(text)})',))}
+    seen = []
+    start = time.perf_counter()
+    while True:
+        rows, span = db.search_logs(1, text, PAGE, len(seen))
+        if not rows:
+            break
+        assert span is not None or len(expected) <= db.SEARCH_CANDIDATES, f"no block span with {len(expected)} matches"
+        assert span is None or span[0] <= len(seen) + 1 <= span[1], f"span {span} does not hold match {len(seen) + 1}"
+        seen += [row['id'] for row in rows]
+    elapsed = time.perf_counter() - start
+    assert len(seen) == len(set(seen)), "a match was returned twice"
+    assert set(seen) == expected, f"paging reached {len(set(seen))} of {len(expected)} matches"
+    print(f"Paged through all {len(expected)} matches of {text!r}, {PAGE} at a time, in {elapsed:.2f}s; none missed or repeated.")
+
+
+def fts_search(user_id, text, limit, offset=0):
+    return db.search_logs(user_id, text, limit, offset)[0]
+
+
+def measure(label, func, text, repeat=REPEAT, offset=0):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hits = func(1, text, 6, offset)
+        samples.append(time.perf_counter() - start)
+    print(f"  {label:<6} {statistics.median(samples) * 1000:9.2f} ms median  {max(samples) * 1000:9.2f} ms max  {len(hits)} hits")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'search.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.init_db()
+        elapsed = populate(rows, users)
+        size = os.path.getsize(db.DB_NAME) + os.path.getsize(db.DB_NAME + '-wal')
+        print(f"Inserted {rows} entries for {users} users in {elapsed:.1f}s with the FTS triggers ({size / 2**20:.0f} MiB).")
+
+        queries = (('rare word', 'w19000'), ('two rare words', 'w5000 w9000'),
+                   ('common word', 'w3'), ('common pair', 'w1 w2'))
+        for label, text in queries:
+            print(f"{label} ({text!r}):")
+            measure("fts5", fts_search, text)
+            measure("like", like_search, text, repeat=3)
+        print("common word ('w3'), page 1001:")
+        measure("fts5", fts_search, 'w3', offset=5000)
+        measure("like", like_search, 'w3', repeat=3, offset=5000)
+        check_paging('w30')
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Journal write throughput across 1-N SQLite shards as concurrent users rise, and a rebalance check.
+
+Each simulated user commits single journal entries through async_db (one
+transaction per entry, on the writer thread of the user's shard) as fast as
+it can, while one reader keeps loading whole days the way the nightly
+summaries do. Reports committed writes per second and the p99 write latency.
+
+Then fills a one-shard database, rebalances it to four shards and back to
+one, and checks after each step that every user's logs, TODOs, reminders,
+summaries, search results and embeddings are unchanged, that every row id
+is in its shard's range and that the foreign keys and full-text indexes
+are intact.
+
+Usage: python benchmarks/bench_sharded_writes.py [seconds per run] [max shards]
+"""
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+
+from kosha import async_db, db, rebalance
+
+CONCURRENT_USERS = [1, 4, 16, 64]
+REBALANCE_USERS = 300
+
+
+def use_database(path, shards):
+    db.close_connections()
+    db.DB_NAME = path
+    db.SHARDS = shards
+    db.user_ids.clear()
+    db.user_shards.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.init_db()
+
+
+async def write_load(users, seconds):
+    with contextlib.redirect_stdout(io.StringIO()):
+        user_ids = [await async_db.get_or_create_user(chat_id) for chat_id in range(1, users + 1)]
+    latencies = []
+    stop = time.perf_counter() + seconds
+    today = datetime.date.today()
+
+    async def writer(user_id):
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            await async_db.log_message(user_id, f"entry from {user_id} at {start}")
+            latencies.append(time.perf_counter() - start)
+
+    async def summary_reader():
+        while time.perf_counter() < stop:
+            for user_id in user_ids:
+                await async_db.get_messages_for_day(user_id, today)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(summary_reader(), *(writer(user_id) for user_id in user_ids))
+    latencies.sort()
+    return len(latencies) / seconds, latencies[int(0.99 * (len(latencies) - 1))]
+
+
+def measure_throughput(tmp, seconds, max_shards):
+    shard_counts = [shards for shards in (1, 2, 4, 8, 16) if shards <= max_shards]
+    print(f"Committed journal writes/s (p99 latency), {seconds:.0f}s per run:")
+    print("  users " + "".join(f"{f'{shards} shard' + 's' * (shards > 1):>22}" for shards in shard_counts))
+    for users in CONCURRENT_USERS:
+        cells = []
+        for shards in shard_counts:
+            use_database(os.path.join(tmp, f'writes-{users}-{shards}.db'), shards)
+            rate, p99 = asyncio.run(write_load(users, seconds))
+            cells.append(f"{rate:>10.0f} ({p99 * 1000:6.2f} ms)")
+        print(f"  {users:>5} " + "".join(f"{cell:>22}" for cell in cells))
+
+
+async def populate(users):
+    rng = random.Random(1)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    user_ids = []
+    for chat_id in range(1, users + 1):
+        user_id = await async_db.get_or_create_user(chat_id)
+        user_ids.append(user_id)
+        await async_db.log_messages([(user_id, f"walked the dog {rng.random()} with {chat_id}") for _ in range(rng.randrange(1, 20))])
+        for i in range(rng.randrange(0, 4)):
+            todo_id = await async_db.add_todo(user_id, f"task {i} of {chat_id}")
+            if rng.random() < 0.5:
+                await async_db.mark_todo_done(todo_id, True)
+        await async_db.set_reminder(user_id, f"call {chat_id}", now + datetime.timedelta(minutes=rng.randrange(1, 10000)))
+        await async_db.add_summary(user_id, f"the dog summary of {chat_id}", datetime.date(2025, 1, 1))
+        entries = await async_db.get_unembedded_entries(user_id, 1000)
+        await async_db.put_embeddings([(kind, row_id, user_id, os.urandom(16)) for kind, row_id, _ in entries[::2]])
+    return user_ids
+
+
+def snapshot(user_ids):
+    """Everything each user can see, with ids left out since moves renumber them."""
+    state = {}
+    for user_id in user_ids:
+        conn = db.user_connection(user_id)
+        rows = lambda query: [tuple(row) for row in conn.execute(query, (user_id,))]
+        keys = [tuple(key) for key in db.rank_journal(user_id, '"dog"', 50)]
+        embedded = {(kind, row_id) for kind, row_id, _ in db.get_embeddings(user_id)}
+        state[user_id] = (
+            rows("SELECT content, timestamp FROM logs WHERE user_id = ? ORDER BY id"),
+            rows("SELECT content, is_done FROM todo WHERE user_id = ? ORDER BY id"),
+            rows("SELECT content, fire_at, is_active FROM reminders WHERE user_id = ? ORDER BY id"),
+            rows("SELECT content, date, sent_at FROM summaries WHERE user_id = ? ORDER BY id"),
+            [row['snippet'] for row in db.search_logs(user_id, "walked dog", 50)[0]],
+            sorted(db.get_journal_entries(keys).values()),
+            sorted(content for kind, row_id, content in db.get_unembedded_entries(user_id, 1000) if (kind, row_id) not in embedded),
+        )
+    todos = {chat_id: sorted(todo['content'] for todo in todos)
+             for (_, chat_id), todos in db.get_todos_for_all_users(datetime.date.today()).items()}
+    # Reminders due at the same second may come back in either order once they sit in different shards.
+    reminders = sorted((reminder['fire_at'], reminder['chat_id'], reminder['content']) for reminder in db.get_active_reminders())
+    return state, todos, reminders
+
+
+def check_shards():
+    for shard in range(db.shard_count):
+        conn = db.get_connection(shard)
+        for table in rebalance.ID_TABLES:
+            stray = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE id / ? != ?", (db.SHARD_ID_SPAN, shard)).fetchone()[0]
+            assert stray == 0, f"{stray} rows of {table} in shard {shard} have ids from another shard"
+        assert not conn.execute("PRAGMA foreign_key_check").fetchall(), f"foreign key violations in shard {shard}"
+        conn.execute("INSERT INTO logs_fts (logs_fts) VALUES ('integrity-check')")
+        conn.execute("INSERT INTO summaries_fts (summaries_fts) VALUES ('integrity-check')")
+
+
+def check_rebalance(tmp):
+    use_database(os.path.join(tmp, 'rebalance.db'), 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        user_ids = asyncio.run(populate(REBALANCE_USERS))
+    expected = snapshot(user_ids)
+
+    for shards in (4, 1):
+        db.SHARDS = shards
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            moves = rebalance.rebalance()
+        elapsed = time.perf_counter() - start
+        db.user_shards.clear()
+        assert snapshot(user_ids) == expected, f"user data changed when rebalancing to {shards} shards"
+        check_shards()
+        print(f"Rebalanced {REBALANCE_USERS} users to {shards} shard{'s' * (shards > 1)}: "
+              f"{sum(moves.values())} moved in {elapsed:.2f}s, all data unchanged.")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    max_shards = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    with tempfile.TemporaryDirectory() as tmp:
+        measure_throughput(tmp, seconds, max_shards)
+        check_rebalance(tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Cold-start import time of main.py, checked against a budget.
+
+Imports main (which imports every handler) in fresh interpreters under
+`python -X importtime` and sums the reported import times. Exits with
+status 1 if the median run is over budget, so it can gate a deploy. Also
+shows the slowest top-level imports and what the lazily loaded
+dependencies would add if imported up front.
+
+Usage: python benchmarks/bench_startup_imports.py [budget ms] [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+import _setup  # noqa: F401
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# Default budget; main imported in about 340 ms on the reference machine once heavy imports became lazy.
+BUDGET_MS = 600
+RUNS = 5
+LAZY_DEPENDENCIES = ['google.genai', 'dateparser.search']
+
+
+def import_times(statement):
+    """Runs `statement` in a fresh interpreter and returns [(module, self us, cumulative us, depth)]."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT, env=os.environ,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else RUNS
+
+    samples = []
+    for _ in range(runs):
+        modules = import_times('import main')
+        samples.append(sum(self_us for _, self_us, _, _ in modules) / 1000)
+    total_ms = statistics.median(samples)
+
+    print("Slowest top-level imports of main (last run):")
+    top_level = sorted((module for module in modules if module[3] <= 1 and module[0] != 'main'), key=lambda module: -module[2])
+    for name, _, cumulative_us, _ in top_level[:8]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    loaded = {name for name, _, _, _ in modules}
+    for dependency in LAZY_DEPENDENCIES:
+        state = "imported at startup!" if dependency in loaded else "deferred"
+        extra = sum(self_us for _, self_us, _, _ in import_times(f'import main, {dependency}')) / 1000 - total_ms
+        print(f"  {dependency:<20} {state:<22} ~{extra:.0f} ms when first used")
+
+    print(f"Import time of main: {total_ms:.0f} ms median over {runs} runs (budget {budget_ms:.0f} ms).")
+    if total_ms > budget_ms:
+        print("Over budget.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
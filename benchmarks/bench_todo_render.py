@@ -0,0 +1,92 @@
+"""TODO list rendering: querying and rendering on every tap vs the per-user rendered-list cache.
+
+Times one list refresh (what each button tap and /todos costs) and the
+hourly check-in's load-and-render step for every user, cold and cached.
+
+Usage: python benchmarks/bench_todo_render.py [users] [todos per user]
+"""
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import _setup  # noqa: F401
+
+from kosha import async_db, db
+from kosha.handlers import todo
+
+REPEAT = 200
+
+
+def populate(users, todos_per_user):
+    rng = random.Random(1)
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO users (id, telegram_chat_id) VALUES (?, ?)", ((i, i) for i in range(1, users + 1)))
+    with conn:
+        conn.executemany("INSERT INTO todo (user_id, content, is_done) VALUES (?, ?, ?)",
+                         ((user_id, f"task {i} for user {user_id}", rng.random() < 0.3)
+                          for user_id in range(1, users + 1) for i in range(todos_per_user)))
+
+
+async def time_refreshes(users, cached):
+    rng = random.Random(2)
+    today = datetime.date.today()
+    samples = []
+    for _ in range(REPEAT):
+        user_id = rng.randrange(1, users + 1)
+        if not cached:
+            todo.invalidate_todos(user_id)
+        start = time.perf_counter()
+        await todo.get_rendered_todos(user_id, today)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+async def time_sweep(users, cached):
+    today = datetime.date.today()
+    if not cached:
+        todo.rendered_lists.clear()
+    start = time.perf_counter()
+    all_users = await async_db.get_all_users()
+    rendered = {user['id']: todo.cached_todos(user['id'], today) for user in all_users}
+    if None in rendered.values():
+        versions = {user_id: todo.cache_version(user_id) for user_id in rendered}
+        todos_by_user = await async_db.get_todos_for_all_users(today.strftime('%Y-%m-%d'))
+        for (user_id, _), todos in todos_by_user.items():
+            if rendered[user_id] is None:
+                rendered[user_id] = todo.cache_todos(user_id, today, todos, versions[user_id])
+    return time.perf_counter() - start
+
+
+async def run(users):
+    for label, cached in (("query + render", False), ("cached", True)):
+        refresh = await time_refreshes(users, cached)
+        sweep = await time_sweep(users, cached)
+        print(f"  {label:<15} refresh {refresh * 1000:7.3f} ms median   check-in load+render {sweep * 1000:8.1f} ms")
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    todos_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'todo.db')
+        db.user_ids.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.init_db()
+        populate(users, todos_per_user)
+        print(f"{users} users with {todos_per_user} TODOs each:")
+        asyncio.run(run(users))
+        with contextlib.redirect_stdout(io.StringIO()):
+            async_db.shutdown()
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Update-to-reply latency with long polling vs the webhook listener.
+
+Runs the bot in-process against a fake Bot API server and replays the
+recorded updates in updates.json (or another recording), each as if from a
+new chat, at a steady rate. In polling mode the fake server hands them out
+through getUpdates; in webhook mode they are POSTed to webhook.WebhookServer
+with the secret token. Latency runs from the moment an update reaches the
+fake server to the bot's first call answering it. An optional one-way
+network delay is added to every request in both directions. Also checks
+that the webhook is registered with the handlers' update types only, that
+requests with a wrong secret are refused, and that a client stalling after
+its request line or sending too many headers is cut off.
+
+Usage: python benchmarks/bench_webhook.py [updates] [one-way delay ms] [interval ms] [recording.json]
+"""
+import asyncio
+import contextlib
+import copy
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import _setup  # noqa: F401
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+# Every replayed update comes from its own chat, so none may be turned away.
+os.environ['MY_CHAT_ID'] = ''
+os.environ['PREWARM_IMPORTS'] = 'false'
+
+import httpx
+
+import main as bot
+from fakes import FakeBotAPI
+from main import db, webhook
+from src.kosha import http_listener
+
+RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'updates.json')
+# Default milliseconds between replayed updates; well under the outbox's global send rate. Updates are
+# handled one at a time, so with a network delay the interval must exceed a handler's round trips.
+INTERVAL_MS = 50
+SECRET = 'benchmark-secret'
+FIRST_CHAT = 1000
+REPLY_TIMEOUT = 10
+
+
+def replayed(recording, count, first_chat):
+    """Yields (chat_id, update) with each recorded update rewritten to come from a new chat."""
+    for i in range(count):
+        chat_id = first_chat + i
+        update = copy.deepcopy(recording[i % len(recording)])
+        update['update_id'] = i + 1
+        body = update.get('message') or update['callback_query']
+        body['from']['id'] = chat_id
+        message = body if 'message' in update else body['message']
+        message['chat']['id'] = chat_id
+        message['date'] = int(time.time())
+        if 'callback_query' in update:
+            update['callback_query']['id'] = str(chat_id)
+        yield chat_id, update
+
+
+async def replay(api, recording, count, interval, first_chat, deliver):
+    sent = {}
+    for chat_id, update in replayed(recording, count, first_chat):
+        sent[chat_id] = time.perf_counter()
+        deliver(update)
+        await asyncio.sleep(interval)
+    deadline = time.monotonic() + REPLY_TIMEOUT
+    while any(chat_id not in api.replies for chat_id in sent) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return [api.replies[chat_id] - start for chat_id, start in sent.items() if chat_id in api.replies]
+
+
+async def run_polling(api, recording, count, interval):
+    application = bot.build_application(f"http://127.0.0.1:{api.server_port}/bot")
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=10,
+                                            allowed_updates=webhook.allowed_updates(application))
+    latencies = await replay(api, recording, count, interval, FIRST_CHAT, api.push)
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    return latencies
+
+
+async def run_webhook(api, recording, count, interval):
+    application = bot.build_application(f"http://127.0.0.1:{api.server_port}/bot")
+    await application.initialize()
+    await application.start()
+    server = await webhook.start(application, 'https://example.com/telegram', '127.0.0.1', 0, '/telegram', SECRET)
+    url = f"http://127.0.0.1:{server.port}/telegram"
+
+    async with httpx.AsyncClient() as http:
+        response = await http.post(url, json={'update_id': 0}, headers={webhook.SECRET_HEADER: 'wrong'})
+        assert response.status_code == 403, f"wrong secret answered {response.status_code}"
+        assert api.webhook['secret_token'] == SECRET
+        registered = json.loads(api.webhook['allowed_updates'])
+        assert registered == ['callback_query', 'message'], registered
+
+        async def post(update):
+            await asyncio.sleep(api.delay)
+            response = await http.post(url, json=update, headers={webhook.SECRET_HEADER: SECRET})
+            response.raise_for_status()
+
+        tasks = set()
+        # New chats, so no user is already cached from the polling run.
+        latencies = await replay(api, recording, count, interval, FIRST_CHAT + count,
+                                 lambda update: tasks.add(asyncio.create_task(post(update))))
+        await asyncio.gather(*tasks)
+    await check_slow_clients(server.port)
+
+    await server.stop()
+    await application.stop()
+    await application.shutdown()
+    return latencies, registered
+
+
+async def check_slow_clients(port):
+    """A client that stalls mid-request is disconnected, and one with too many headers is refused."""
+    timeout, http_listener.REQUEST_TIMEOUT = http_listener.REQUEST_TIMEOUT, 0.2
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b"POST /telegram HTTP/1.1\r\nHost: example.com\r\n")
+        await writer.drain()
+        start = time.perf_counter()
+        assert await asyncio.wait_for(reader.read(), 5) == b'', "a stalled request was answered"
+        assert time.perf_counter() - start < 2, "a stalled request was held open"
+        writer.close()
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b"POST /telegram HTTP/1.1\r\n" + b"X-Filler: 1\r\n" * (http_listener.MAX_HEADERS + 1) + b"\r\n")
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        assert response.startswith(b"HTTP/1.1 431 "), f"too many headers answered {response[:40]!r}"
+        writer.close()
+    finally:
+        http_listener.REQUEST_TIMEOUT = timeout
+
+
+def report(label, latencies, count):
+    latencies.sort()
+    print(f"  {label:<8} {statistics.median(latencies) * 1000:7.1f} ms median  "
+          f"{latencies[int(0.9 * (len(latencies) - 1))] * 1000:7.1f} ms p90  {latencies[-1] * 1000:7.1f} ms max  "
+          f"({len(latencies)}/{count} answered)")
+
+
+async def run(count, delay, interval, recording):
+    api = FakeBotAPI(delay)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        polling = await run_polling(api, recording, count, interval)
+        webhooks, registered = await run_webhook(api, recording, count, interval)
+        await bot.post_shutdown(None)
+    api.shutdown()
+
+    print(f"{count} updates, one every {interval * 1000:.0f} ms, {delay * 1000:.0f} ms one-way network delay:")
+    report("polling", polling, count)
+    report("webhook", webhooks, count)
+    print(f"Webhook registered for {', '.join(registered)}; a wrong secret token was refused, "
+          f"a stalled request and one with too many headers were cut off.")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+    interval = float(sys.argv[3] if len(sys.argv) > 3 else INTERVAL_MS) / 1000
+    with open(sys.argv[4] if len(sys.argv) > 4 else RECORDING) as f:
+        recording = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'webhook.db')
+        db.user_ids.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.init_db()
+        asyncio.run(run(count, delay, interval, recording))
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
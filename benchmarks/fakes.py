@@ -0,0 +1,158 @@
+"""Stand-ins for the Telegram Bot API and Gemini, shared by the benchmarks that run the whole bot.
+
+FakeBotAPI is a real HTTP server, so the bot's own HTTP stack is exercised;
+FakeGeminiClient takes the place of the google.genai client (client._client)
+and answers after a configurable delay without any network traffic.
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import threading
+import time
+import types as pytypes
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.genai import chats, types
+
+REPLY = ("Here is a thought about your day. You got a lot done this morning, and the walk after lunch "
+         "seems to have helped. **Tomorrow**, try starting with the task you kept putting off.\n\n"
+         "- Finish the report\n- Call the dentist\n- Go to bed before midnight")
+
+
+class FakeBotAPI(ThreadingHTTPServer):
+    """Answers Bot API calls, serves queued updates to getUpdates and records when each chat is answered."""
+
+    daemon_threads = True
+
+    def __init__(self, delay):
+        super().__init__(('127.0.0.1', 0), FakeBotAPIHandler)
+        self.delay = delay
+        self.updates = []
+        self.replies = {}
+        self.calls = collections.Counter()
+        self.webhook = None
+        self.message_ids = iter(range(1, 1 << 30))
+        self.changed = threading.Condition()
+
+    def push(self, update):
+        with self.changed:
+            self.updates.append(update)
+            self.changed.notify_all()
+
+    def get_updates(self, offset, timeout):
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while not (pending := [update for update in self.updates if update['update_id'] >= offset]):
+                if not self.changed.wait(deadline - time.monotonic()) and time.monotonic() >= deadline:
+                    break
+            del self.updates[:len(self.updates) - len(pending)]
+            return pending
+
+    def answer(self, method, params):
+        # Not a Bot API method: lets a benchmark running the server in another process read the call counts.
+        if method == 'benchmarkCalls':
+            return dict(self.calls)
+        self.calls[method] += 1
+        key = params.get('chat_id') or params.get('callback_query_id')
+        if key is not None:
+            self.replies.setdefault(int(key), time.perf_counter())
+        if method == 'getMe':
+            return {'id': 2, 'is_bot': True, 'first_name': 'Kosha', 'username': 'kosha_bot'}
+        if method == 'getUpdates':
+            return self.get_updates(int(params.get('offset', 0)), float(params.get('timeout', 0)))
+        if method == 'setWebhook':
+            self.webhook = params
+        if method in ('sendMessage', 'editMessageText'):
+            return {'message_id': next(self.message_ids), 'date': int(time.time()), 'text': params.get('text', ''),
+                    'chat': {'id': int(params['chat_id']), 'type': 'private'}}
+        return True
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        time.sleep(self.server.delay)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(body or '{}')
+        else:
+            params = {name: values[0] for name, values in urllib.parse.parse_qs(body).items()}
+        result = self.server.answer(self.path.rsplit('/', 1)[-1], params)
+        payload = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+        time.sleep(self.server.delay)
+        # The bot drops its pending getUpdates call when polling stops.
+        with contextlib.suppress(ConnectionError):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_bot_api(delay, port_pipe):
+    """Process target: runs a FakeBotAPI and sends its port back through `port_pipe`."""
+    api = FakeBotAPI(delay)
+    port_pipe.send(api.server_port)
+    api.serve_forever()
+
+
+class FakeGeminiModels:
+    """The parts of client.aio.models the bot uses, replying with REPLY after `latency` seconds.
+
+    Streams deliver the reply in `chunks` pieces, `chunk_interval` seconds apart,
+    after the first one; unary calls take as long as the whole stream would.
+    """
+
+    def __init__(self, latency, chunks=8, chunk_interval=0.05):
+        self.latency = latency
+        self.chunks = chunks
+        self.chunk_interval = chunk_interval
+        self.calls = collections.Counter()
+
+    def _response(self, text, contents, usage=True):
+        usage_metadata = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=len(str(contents)) // 4, candidates_token_count=len(REPLY) // 4) if usage else None
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role='model', parts=[types.Part(text=text)]),
+                                        finish_reason=types.FinishReason.STOP)],
+            usage_metadata=usage_metadata)
+
+    async def generate_content(self, *, model, contents, config=None):
+        self.calls['generate_content'] += 1
+        await asyncio.sleep(self.latency + self.chunk_interval * (self.chunks - 1))
+        return self._response(REPLY, contents)
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        self.calls['generate_content_stream'] += 1
+        size = -(-len(REPLY) // self.chunks)
+        pieces = [REPLY[i:i + size] for i in range(0, len(REPLY), size)]
+
+        async def stream():
+            await asyncio.sleep(self.latency)
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(self.chunk_interval)
+                yield self._response(piece, contents, usage=i == len(pieces) - 1)
+        return stream()
+
+    async def embed_content(self, *, model, contents, config=None):
+        self.calls['embed_content'] += 1
+        await asyncio.sleep(self.latency)
+        return types.EmbedContentResponse(embeddings=[types.ContentEmbedding(values=[float(len(text) % 7), 1.0, 0.5])
+                                                      for text in contents])
+
+
+class FakeGeminiClient:
+    """Drop-in for genai.Client: chats are the library's own, running on the fake models."""
+
+    def __init__(self, latency, chunks=8, chunk_interval=0.05):
+        models = FakeGeminiModels(latency, chunks, chunk_interval)
+        self.aio = pytypes.SimpleNamespace(models=models, chats=chats.AsyncChats(modules=models))
+
+    @property
+    def calls(self):
+        return self.aio.models.calls
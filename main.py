@@ -1,7 +1,8 @@
 
+import asyncio
 import sys
 import os
-from telegram import Update
+import time
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -16,8 +17,22 @@ from telegram.ext import (
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.kosha.core import config
-from src.kosha import db, scheduler
-from src.kosha.handlers import general, reminders, todo, gemini
+from src.kosha import db, async_db, client, journal, metrics, outbox, reminder_dispatcher, scheduler, utils, webhook
+from src.kosha.handlers import admin, general, reminders, todo, gemini, search
+
+# Seconds after startup before the heavy imports are pre-warmed, so polling starts first.
+PREWARM_DELAY = 1
+
+async def prewarm() -> None:
+    """Loads the heavy, lazily imported dependencies once polling has started, off the event loop."""
+    await asyncio.sleep(PREWARM_DELAY)
+    started = time.perf_counter()
+    for warm_up in (client.warm_up, utils.warm_up_date_parser):
+        try:
+            await asyncio.to_thread(warm_up)
+        except Exception as e:
+            print(f"Error pre-warming {warm_up.__module__}: {e}")
+    print(f"Pre-warmed Gemini client and dateparser in {time.perf_counter() - started:.2f}s.")
 
 async def post_init(application: Application) -> None:
     """Post-initialization hook for the application."""
@@ -27,15 +42,32 @@ async def post_init(application: Application) -> None:
         print("Scheduler started.")
         await scheduler.setup_scheduler_jobs(application.bot)
         print("Scheduled jobs loaded.")
+        if config.PREWARM_IMPORTS:
+            application.create_task(prewarm())
     except Exception as e:
         print(f"Error during post-initialization: {e}")
 
-def main() -> None:
-    """Set up and run the bot."""
-    db.init_db()
-    print("Database initialized.")
+    if config.METRICS_PORT:
+        try:
+            await metrics.server.start(config.METRICS_LISTEN, config.METRICS_PORT)
+            print(f"Metrics served on http://{config.METRICS_LISTEN}:{metrics.server.port}/metrics")
+        except OSError as e:
+            print(f"Error starting the metrics endpoint: {e}")
+
+async def post_shutdown(application: Application) -> None:
+    """Post-shutdown hook for the application."""
+    reminder_dispatcher.dispatcher.stop()
+    await metrics.server.stop()
+    await outbox.queue.close()
+    await journal.writer.close()
+    async_db.shutdown()
 
-    application = Application.builder().token(config.BOT_TOKEN).post_init(post_init).build()
+def build_application(base_url: str | None = None) -> Application:
+    """Builds the application with all handlers registered; `base_url` points it at another Bot API server."""
+    builder = Application.builder().token(config.BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
 
     # --- Conversation Handlers ---
     gemini_conv_handler = ConversationHandler(
@@ -60,14 +92,43 @@ def main() -> None:
     application.add_handler(CommandHandler('todos', todo.show_daily_todos))
     application.add_handler(CommandHandler('summary', general.get_specific_summary))
     application.add_handler(CommandHandler('logs', general.show_logs))
-    application.add_handler(CallbackQueryHandler(todo.handle_todo_callback))
+    application.add_handler(CommandHandler('search', search.search_journal))
+    application.add_handler(CommandHandler('ask', gemini.ask_journal))
+    application.add_handler(CommandHandler('stats', admin.show_stats))
+    application.add_handler(CallbackQueryHandler(todo.handle_todo_callback, pattern='^(done|undone|delete):'))
+    application.add_handler(CallbackQueryHandler(search.handle_search_callback, pattern='^search:'))
     
     # This handler must be added last
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, general.handle_any_message))
+    return application
+
+def main() -> None:
+    """Set up and run the bot."""
+    db.init_db()
+    db.warm_user_cache()
+    print("Database initialized.")
+
+    application = build_application()
+
+    if config.WEBHOOK_URL:
+        print("Bot application built. Starting webhook...")
+        try:
+            webhook.run(application, config.WEBHOOK_URL, config.WEBHOOK_LISTEN, config.WEBHOOK_PORT,
+                        config.WEBHOOK_PATH, config.WEBHOOK_SECRET)
+        except Exception as e:
+            print(f"An unexpected error occurred while serving the webhook: {e}")
+            sys.exit(1)
+        finally:
+            try:
+                scheduler.scheduler.shutdown(wait=False)
+                print("Scheduler stopped.")
+            except Exception as e:
+                print(f"Error shutting down scheduler: {e}")
+        return
 
     print("Bot application built. Starting polling...")
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        application.run_polling(allowed_updates=webhook.allowed_updates(application))
     except KeyboardInterrupt: 
         print("\nKeyboard interrupt received. Stopping bot and scheduler.")
         try: 
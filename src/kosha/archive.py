@@ -0,0 +1,118 @@
+"""Moves old journal entries into compressed, month-partitioned archives.
+
+Entries from before the start of the month LOG_ARCHIVE_DAYS ago are packed
+per user and month into logs_archive, in the shard that holds the user, and
+removed from logs along with their full-text index entries and embeddings;
+the full-text index is then merged so the deleted entries stop taking space.
+Day views and the nightly summaries read archived days transparently; /search
+and /ask only cover the live entries, though /ask still has the archived
+days' summaries.
+
+Runs nightly when LOG_ARCHIVE_DAYS is set, and can be run by hand:
+
+    python -m src.kosha.archive [--days N] [--dry-run] [--vacuum]
+"""
+import argparse
+import datetime
+import time
+
+from . import async_db, db, retrieval
+from .core.config import LOG_ARCHIVE_DAYS
+
+def cutoff(days: int, now: datetime.datetime | None = None) -> str:
+    """The UTC timestamp entries older than which are archived: the start of the month `days` ago."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    month = (now - datetime.timedelta(days=days)).date().replace(day=1)
+    return f"{month.isoformat()} 00:00:00"
+
+def _mb(size) -> str:
+    return f"{size / 1e6:.1f} MB"
+
+def _total(storages: list[dict]) -> dict:
+    return {key: sum(storage[key] for storage in storages) for key in storages[0]}
+
+def report_savings(before: dict, after: dict) -> None:
+    """Prints how much smaller the live journal b-trees got, and what the archive and free pages take."""
+    print(f"Live journal b-trees (the page-cache working set): {_mb(before['live_bytes'])} -> {_mb(after['live_bytes'])}; "
+          f"archive {_mb(before['archive_bytes'])} -> {_mb(after['archive_bytes'])}.")
+    print(f"Database files: {_mb(after['file_bytes'])}, of which {_mb(after['free_bytes'])} are free pages "
+          f"SQLite will reuse (VACUUM returns them to the OS).")
+
+async def run_nightly_archive(days: int = LOG_ARCHIVE_DAYS) -> None:
+    """Archives every user's entries older than `days` through the shard writers, one month per transaction."""
+    before = cutoff(days)
+    started = time.perf_counter()
+    free_before = [(await async_db.log_storage(shard, pages=False))['free_bytes'] for shard in range(db.shard_count)]
+    moved = chars = packed = failed = 0
+    touched = []
+    for user in await async_db.get_all_users():
+        try:
+            entries, user_chars, user_packed = await async_db.archive_logs(user['id'], before)
+        except Exception as e:
+            failed += 1
+            touched.append(user['id'])
+            print(f"Error archiving journal entries of user {user['id']}: {e}")
+            continue
+        moved += entries
+        chars += user_chars
+        packed += user_packed
+        if entries:
+            touched.append(user['id'])
+    # Archived entries lose their embeddings; cached keys for them would take slots in /ask's dense top-k.
+    if retrieval.dense is not None:
+        retrieval.dense.forget(touched)
+    if moved:
+        for shard in range(db.shard_count):
+            await async_db.optimize_log_index(shard)
+
+    free_after = [(await async_db.log_storage(shard, pages=False))['free_bytes'] for shard in range(db.shard_count)]
+    print(f"Archived {moved} journal entries from before {before[:7]} ({_mb(chars)} of text, {_mb(packed)} packed), "
+          f"{failed} users failed, in {time.perf_counter() - started:.1f}s; "
+          f"{_mb(sum(free_after) - sum(free_before))} of pages freed for reuse.")
+
+def archive(days: int, dry_run: bool = False, vacuum: bool = False) -> tuple[int, int]:
+    """Archives every user's entries older than `days` and reports the savings; returns (entries, users)."""
+    db.init_db()
+    before = cutoff(days)
+    users = db.get_all_users()
+
+    if dry_run:
+        archivable = {user['id']: db.get_archivable_months(user['id'], before) for user in users}
+        months = [month for user_months in archivable.values() for month in user_months]
+        entries = sum(month['entries'] for month in months)
+        print(f"{entries} journal entries ({_mb(sum(month['chars'] for month in months))} of text) in "
+              f"{len(months)} user-months from before {before[:7]} would be archived.")
+        return entries, sum(bool(user_months) for user_months in archivable.values())
+
+    storage_before = _total([db.log_storage(shard) for shard in range(db.shard_count)])
+    started = time.perf_counter()
+    moved = archived_users = 0
+    for user in users:
+        entries, _, _ = db.archive_logs(user['id'], before)
+        moved += entries
+        archived_users += entries > 0
+    if moved:
+        for shard in range(db.shard_count):
+            db.optimize_log_index(shard)
+    print(f"Archived {moved} journal entries of {archived_users} users from before {before[:7]} "
+          f"in {time.perf_counter() - started:.1f}s.")
+
+    if vacuum:
+        print("Vacuuming...")
+        for shard in range(db.shard_count):
+            db.vacuum(shard)
+    report_savings(storage_before, _total([db.log_storage(shard) for shard in range(db.shard_count)]))
+    return moved, archived_users
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move old journal entries into compressed monthly archives.")
+    parser.add_argument('--days', type=int, default=LOG_ARCHIVE_DAYS or 365,
+                        help="archive entries older than this many days, counted back to the start of their month "
+                             "(default: LOG_ARCHIVE_DAYS, or 365 if unset)")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be archived")
+    parser.add_argument('--vacuum', action='store_true', help="rebuild the files afterwards to return freed space to the OS")
+    args = parser.parse_args()
+    try:
+        archive(args.days, args.dry_run, args.vacuum)
+    finally:
+        db.close_connections()
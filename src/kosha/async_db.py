@@ -0,0 +1,186 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import db, metrics
+
+# Every write to a shard goes through that shard's own thread, so writes
+# never fight over a file's write lock while different shards commit in
+# parallel. Reads get a small pool of their own (WAL lets them run alongside
+# the writers), so a slow summary query can't hold up journal inserts. Each
+# thread keeps its own long-lived connections from db.get_connection().
+READER_THREADS = 4
+
+_writers = {}
+_readers = ThreadPoolExecutor(max_workers=READER_THREADS, thread_name_prefix='kosha-db-reader')
+
+def _timed(pool, queued, func, args, kwargs):
+    """Runs `func` on a database thread, recording how long it waited for the thread and how long it ran."""
+    started = time.perf_counter()
+    metrics.db_wait_seconds.observe(started - queued, pool=pool)
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        metrics.db_errors.inc(query=func.__name__)
+        raise
+    finally:
+        metrics.db_query_seconds.observe(time.perf_counter() - started, query=func.__name__)
+
+async def _run(executor, pool, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _timed, pool, time.perf_counter(), func, args, kwargs)
+
+def _writer(shard):
+    executor = _writers.get(shard)
+    if executor is None:
+        executor = _writers[shard] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'kosha-db-writer-{shard}')
+    return executor
+
+async def write(func, *args, shard=0, **kwargs):
+    """Runs a blocking db function on the writer thread of `shard` (shard 0 for the shared tables)."""
+    return await _run(_writer(shard), f'writer-{shard}', func, *args, **kwargs)
+
+async def read(func, *args, **kwargs):
+    """Runs a read-only blocking db function on the reader pool."""
+    return await _run(_readers, 'reader', func, *args, **kwargs)
+
+def shutdown():
+    """Waits for queued db work to finish and closes every connection."""
+    for executor in _writers.values():
+        executor.shutdown(wait=True)
+    _readers.shutdown(wait=True)
+    db.close_connections()
+    print("Database executors stopped.")
+
+async def user_shard(user_id):
+    """The shard holding a user's data; cached users are answered without a thread hop."""
+    shard = db.user_shards.get(user_id)
+    if shard is None:
+        shard = await read(db.shard_of_user, user_id)
+    return shard
+
+async def _write_by_shard(func, items, shard_of):
+    """Splits `items` by shard and runs `func(items)` on each shard's writer at once."""
+    groups = db.group_by_shard(items, shard_of)
+    await asyncio.gather(*(write(func, group, shard=shard) for shard, group in groups.items()))
+
+async def init_db():
+    return await write(db.init_db)
+
+async def get_or_create_user(telegram_chat_id):
+    # Cached users are answered on the loop without a thread hop; otherwise
+    # this may insert, so it has to go through the writer.
+    if telegram_chat_id in db.user_ids:
+        user_id = db.user_ids.get(telegram_chat_id)
+        if user_id is not None:
+            return user_id
+    return await write(db.get_or_create_user, telegram_chat_id)
+
+async def log_message(user_id, content):
+    return await write(db.log_message, user_id, content, shard=await user_shard(user_id))
+
+async def get_messages_for_day(user_id, date):
+    return await read(db.get_messages_for_day, user_id, date)
+
+async def search_logs(user_id, text, limit, offset=0):
+    return await read(db.search_logs, user_id, text, limit, offset)
+
+async def rank_journal(user_id, query, limit):
+    return await read(db.rank_journal, user_id, query, limit)
+
+async def get_journal_entries(keys):
+    return await read(db.get_journal_entries, keys)
+
+async def get_journal_size(user_id):
+    return await read(db.get_journal_size, user_id)
+
+async def archive_logs(user_id, before):
+    return await write(db.archive_logs, user_id, before, shard=await user_shard(user_id))
+
+async def optimize_log_index(shard):
+    return await write(db.optimize_log_index, shard, shard=shard)
+
+async def log_storage(shard, pages=True):
+    return await read(db.log_storage, shard, pages)
+
+async def get_unembedded_entries(user_id, limit):
+    return await read(db.get_unembedded_entries, user_id, limit)
+
+async def log_messages(entries):
+    shards = {user_id: await user_shard(user_id) for user_id in {entry[0] for entry in entries}}
+    await _write_by_shard(db.log_messages, entries, lambda entry: shards[entry[0]])
+
+async def put_embeddings(rows):
+    await _write_by_shard(db.put_embeddings, rows, lambda row: db.shard_of_row(row[1]))
+
+async def get_embeddings(user_id):
+    return await read(db.get_embeddings, user_id)
+
+async def set_reminder(user_id, content, timestamp):
+    return await write(db.set_reminder, user_id, content, timestamp, shard=await user_shard(user_id))
+
+async def deactivate_reminder(reminder_id):
+    return await write(db.deactivate_reminder, reminder_id, shard=db.shard_of_row(reminder_id))
+
+async def deactivate_reminders(reminder_ids):
+    await _write_by_shard(db.deactivate_reminders, reminder_ids, db.shard_of_row)
+
+async def get_active_reminders():
+    return await read(db.get_active_reminders)
+
+async def get_reminders_due_before(fire_at):
+    return await read(db.get_reminders_due_before, fire_at)
+
+async def add_summary(user_id, content, date):
+    return await write(db.add_summary, user_id, content, date, shard=await user_shard(user_id))
+
+async def get_summary_checkpoints(date):
+    return await read(db.get_summary_checkpoints, date)
+
+async def mark_summary_sent(user_id, date):
+    return await write(db.mark_summary_sent, user_id, date, shard=await user_shard(user_id))
+
+async def get_all_users():
+    return await read(db.get_all_users)
+
+async def get_summary_for_user(user_id, date):
+    return await read(db.get_summary_for_user, user_id, date)
+
+async def get_cached_response(key, min_created_at):
+    return await read(db.get_cached_response, key, min_created_at)
+
+async def touch_cached_response(key, accessed_at):
+    return await write(db.touch_cached_response, key, accessed_at)
+
+async def put_cached_response(key, model, response, created_at):
+    return await write(db.put_cached_response, key, model, response, created_at)
+
+async def prune_response_cache(min_created_at, max_bytes):
+    return await write(db.prune_response_cache, min_created_at, max_bytes)
+
+async def get_gemini_session(user_id, min_updated_at):
+    return await read(db.get_gemini_session, user_id, min_updated_at)
+
+async def save_gemini_session(user_id, history, turns, updated_at):
+    return await write(db.save_gemini_session, user_id, history, turns, updated_at, shard=await user_shard(user_id))
+
+async def delete_gemini_session(user_id):
+    return await write(db.delete_gemini_session, user_id, shard=await user_shard(user_id))
+
+async def prune_gemini_sessions(min_updated_at):
+    return await write(db.prune_gemini_sessions, min_updated_at)
+
+async def add_todo(user_id, content):
+    return await write(db.add_todo, user_id, content, shard=await user_shard(user_id))
+
+async def get_todos_for_user(user_id, date):
+    return await read(db.get_todos_for_user, user_id, date)
+
+async def get_todos_for_all_users(date):
+    return await read(db.get_todos_for_all_users, date)
+
+async def mark_todo_done(todo_id, new_value):
+    return await write(db.mark_todo_done, todo_id, new_value, shard=db.shard_of_row(todo_id))
+
+async def delete_todo(todo_id):
+    return await write(db.delete_todo, todo_id, shard=db.shard_of_row(todo_id))
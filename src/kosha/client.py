@@ -1,31 +1,95 @@
+from __future__ import annotations
 
-from google import genai
-from google.genai import types
-from google.genai import chats
+import contextlib
+import threading
+from typing import TYPE_CHECKING, AsyncIterator
 
 from .core.config import GEMINI_API_KEY
+from . import metrics, response_cache
 
-# Configure the generative AI client
-client = genai.Client(api_key=GEMINI_API_KEY)
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import chats, types
 
-SAFETY_SETTINGS = [
-    types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-    types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-    types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-]
+# google.genai takes about a second to import, so it is loaded and the client
+# created on the first Gemini call (or by warm_up once the bot is running).
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> genai.Client:
+    """Returns the shared Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                _client = genai.Client(api_key=GEMINI_API_KEY)
+    return _client
+
+def warm_up():
+    """Imports google.genai and creates the client ahead of the first request."""
+    get_client()
+    from google.genai import chats, types  # noqa: F401
+
+def _generation_config() -> types.GenerateContentConfig:
+    from google.genai import types
+
+    return types.GenerateContentConfig(safety_settings=[
+        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
+        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
+        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
+    ])
 
 MODEL_NAME = "gemini-2.5-flash"
 CHAT_MODEL_NAME = "gemini-2.5-flash-lite"
+EMBEDDING_MODEL_NAME = "text-embedding-004"
+
+@contextlib.contextmanager
+def _measured(model: str, call: str):
+    """Records a Gemini request's latency, and its failure if the block raises."""
+    with metrics.gemini_seconds.time(model=model, call=call):
+        try:
+            yield
+        except Exception:
+            metrics.gemini_errors.inc(model=model, call=call)
+            raise
+
+def _record_usage(model: str, usage) -> None:
+    """Adds a response's usage_metadata to the per-model token counters."""
+    if usage is None:
+        return
+    for kind, count in (('prompt', usage.prompt_token_count), ('output', usage.candidates_token_count),
+                        ('thoughts', usage.thoughts_token_count)):
+        if count:
+            metrics.gemini_tokens.inc(count, model=model, kind=kind)
+
+def _cache_key(model: str, prompt: str, config: types.GenerateContentConfig) -> str:
+    return response_cache.make_key(model, prompt, config.model_dump_json(exclude_none=True))
+
+async def _generate_cached(model: str, prompt: str) -> str:
+    """Single-shot generate_content call served from the response cache when possible."""
+    config = _generation_config()
+    key = _cache_key(model, prompt, config)
+    cached = await response_cache.responses.get(key)
+    if cached is not None:
+        return cached
+
+    with _measured(model, 'generate'):
+        response = await get_client().aio.models.generate_content(model=model, contents=prompt, config=config)
+    _record_usage(model, response.usage_metadata)
+    if not response.text:
+        return "No content generated."
+    await response_cache.responses.put(key, model, response.text)
+    return response.text
+
+async def generate_summary(summary_prompt: str) -> str:
+    """Generates a summary from a given prompt, letting API errors propagate so callers can retry."""
+    return await _generate_cached(MODEL_NAME, summary_prompt)
 
 async def get_summary(summary_prompt: str) -> str:
     """Generates a summary from a given prompt."""
     try:
-        response = await client.aio.models.generate_content(
-            model=MODEL_NAME,
-            contents=summary_prompt,
-            config=types.GenerateContentConfig(safety_settings=SAFETY_SETTINGS),
-        )
-        return response.text or "No content generated."
+        return await generate_summary(summary_prompt)
     except Exception as e:
         print(f"Gemini API (Summary): An error occurred: {e}")
         return "No content generated."
@@ -48,31 +112,125 @@ def get_summary_prompt(content: str, summary_date: str) -> str:
     Please provide a summary of the above journal entries for the specified date.
     """
 
+def get_partial_summary_prompt(content: str, summary_date: str, part: int, total_parts: int) -> str:
+    """Creates a prompt that summarizes one time-ordered slice of a long journal day."""
+    return f"""
+    You are an AI assistant designed to summarize daily journal entries.
+    The journal for this day is long, so you are given part {part} of {total_parts}, in time order.
+    Summarize only this part: key activities, significant thoughts, and notable events, keeping
+    times where they matter. Be factual and compact; your notes will be merged with the other parts.
+
+    Date: {summary_date}
+
+    Journal Entries (part {part} of {total_parts}):
+    ---
+    {content}
+    ---
+    """
+
+def get_combine_summary_prompt(partial_summaries: list[str], summary_date: str) -> str:
+    """Creates a prompt that merges partial summaries into one daily summary."""
+    parts = "\n---\n".join(partial_summaries)
+    return f"""
+    You are an AI assistant designed to summarize daily journal entries.
+    Below are notes summarizing consecutive parts of one day's journal, in time order.
+    Combine them into a single concise, insightful, and coherent summary of the whole day.
+    Focus on key activities, significant thoughts, recurring themes, and notable events.
+    Keep the summary to around 3-5 concise paragraphs.
+
+    Date: {summary_date}
+
+    Partial Summaries:
+    ---
+    {parts}
+    ---
+
+    Please provide a summary of the whole day.
+    """
+
+def get_ask_prompt(question: str, entries: list[str]) -> str:
+    """Creates a prompt that answers a question from retrieved journal entries only."""
+    context = "\n".join(entries)
+    return f"""
+    You are an AI assistant answering questions about the user's personal journal.
+    Below are the journal entries and daily summaries most relevant to the question, with their dates.
+    Answer using only this material. If it does not contain the answer, say so briefly.
+    Mention dates where they help.
+
+    Journal Excerpts:
+    ---
+    {context}
+    ---
+
+    Question: {question}
+    """
+
+async def embed_texts(texts: list[str], task_type: str = "RETRIEVAL_DOCUMENT") -> list[list[float]]:
+    """Embeds texts for retrieval; use task_type="RETRIEVAL_QUERY" for the question being searched with."""
+    from google.genai import types
+
+    with _measured(EMBEDDING_MODEL_NAME, 'embed'):
+        response = await get_client().aio.models.embed_content(
+            model=EMBEDDING_MODEL_NAME,
+            contents=texts,
+            config=types.EmbedContentConfig(task_type=task_type)
+        )
+    return [embedding.values for embedding in response.embeddings]
+
 async def send_single_query_to_gemini(query_content: str) -> str:
     """Sends a single query to the Gemini chat model."""
     try:
-        response = await client.aio.models.generate_content(
-            model=CHAT_MODEL_NAME,
-            contents=query_content,
-            config=types.GenerateContentConfig(safety_settings=SAFETY_SETTINGS),
-        )
-        return response.text or "No content generated."
+        return await _generate_cached(CHAT_MODEL_NAME, query_content)
     except Exception as e:
         print(f"Gemini API (Single Query): An error occurred: {e}")
         return "No content generated."
 
-def start_new_gemini_chat() -> chats.AsyncChat:
-    """Starts a new multi-turn Gemini chat session."""
-    return client.aio.chats.create(
+async def stream_single_query_to_gemini(query_content: str) -> AsyncIterator[str]:
+    """Yields the reply to a single query as it is generated. A cached reply arrives in one piece."""
+    config = _generation_config()
+    key = _cache_key(CHAT_MODEL_NAME, query_content, config)
+    cached = await response_cache.responses.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    usage = None
+    with _measured(CHAT_MODEL_NAME, 'stream'):
+        async for chunk in await get_client().aio.models.generate_content_stream(model=CHAT_MODEL_NAME, contents=query_content, config=config):
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+    _record_usage(CHAT_MODEL_NAME, usage)
+    if parts:
+        await response_cache.responses.put(key, CHAT_MODEL_NAME, "".join(parts))
+
+def start_new_gemini_chat(history: list[types.Content] | None = None) -> chats.AsyncChat:
+    """Starts a multi-turn Gemini chat session, optionally continuing from an earlier history."""
+    return get_client().aio.chats.create(
         model=CHAT_MODEL_NAME,
-        config=types.GenerateContentConfig(safety_settings=SAFETY_SETTINGS)
+        config=_generation_config(),
+        history=history
     )
 
 async def send_message_to_gemini_chat(chat_session: chats.AsyncChat, message_content: str) -> str:
     """Sends a message within an ongoing Gemini chat session."""
     try:
-        response = await chat_session.send_message(message=message_content)
+        with _measured(CHAT_MODEL_NAME, 'chat'):
+            response = await chat_session.send_message(message=message_content)
+        _record_usage(CHAT_MODEL_NAME, response.usage_metadata)
         return response.text or "No content generated."
     except Exception as e:
         print(f"Gemini API (Multi-turn Chat): An error occurred: {e}")
         return "No content generated."
+
+async def stream_message_to_gemini_chat(chat_session: chats.AsyncChat, message_content: str) -> AsyncIterator[str]:
+    """Yields the reply to a chat message as it is generated; the turn is added to the history once it completes."""
+    usage = None
+    with _measured(CHAT_MODEL_NAME, 'chat_stream'):
+        async for chunk in await chat_session.send_message_stream(message=message_content):
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                yield chunk.text
+    _record_usage(CHAT_MODEL_NAME, usage)
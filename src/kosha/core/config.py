@@ -1,5 +1,6 @@
 
 import os
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -10,8 +11,63 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 TIMEZONE = os.getenv('TIMEZONE', 'UTC')
 MY_CHAT_ID = os.getenv('MY_CHAT_ID')
 
+# Nightly summary sweep: how many users are summarized at once, and how many
+# Gemini requests per minute the sweep may make in total.
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '10'))
+
+# Show /gemini replies while they are generated instead of after they finish.
+GEMINI_STREAMING = os.getenv('GEMINI_STREAMING', 'true').lower() in ('1', 'true', 'yes')
+
+# /ask also ranks journal entries by Gemini embeddings (needs numpy). Off by
+# default because every new entry costs an embedding request.
+ASK_EMBEDDINGS = os.getenv('ASK_EMBEDDINGS', 'false').lower() in ('1', 'true', 'yes')
+
+# Load google.genai and dateparser in the background once the bot is polling,
+# instead of on the first /gemini or /remind that needs them.
+PREWARM_IMPORTS = os.getenv('PREWARM_IMPORTS', 'true').lower() in ('1', 'true', 'yes')
+
+# User data is spread over this many SQLite files (database.db, database.1.db,
+# ...), each with its own writer. Existing users only move to a new layout
+# when `python -m src.kosha.rebalance` is run with the bot stopped.
+DB_SHARDS = int(os.getenv('DB_SHARDS', '1'))
+
+# Receive updates on a webhook instead of long polling when WEBHOOK_URL (the
+# public HTTPS URL Telegram posts to) is set. The bot listens on
+# WEBHOOK_LISTEN:WEBHOOK_PORT behind a TLS-terminating proxy, at the URL's path
+# unless the proxy rewrites it to WEBHOOK_PATH, and rejects requests that do
+# not carry WEBHOOK_SECRET (1-256 characters: A-Z, a-z, 0-9, _ and -).
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH') or urlsplit(WEBHOOK_URL).path or '/'
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Handler, database, Gemini, scheduler and send metrics are served in the
+# Prometheus text format at http://METRICS_LISTEN:METRICS_PORT/metrics (set
+# METRICS_PORT to 0 to turn the endpoint off). /stats shows a summary, to
+# ADMIN_CHAT_ID only, which defaults to MY_CHAT_ID.
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID') or MY_CHAT_ID
+
+# Journal entries older than this many days (counted back to the start of
+# their month) are moved nightly into compressed monthly archives. They still
+# show up in day views and summaries, but not in /search or /ask. 0 keeps
+# everything in the live table.
+LOG_ARCHIVE_DAYS = int(os.getenv('LOG_ARCHIVE_DAYS', '0'))
+
 if not BOT_TOKEN:
     raise ValueError('BOT_TOKEN is not set in the .env file')
 
 if not GEMINI_API_KEY:
     raise ValueError('GEMINI_API_KEY is not set in the .env file')
+
+if SUMMARY_CONCURRENCY < 1:
+    raise ValueError('SUMMARY_CONCURRENCY must be at least 1')
+
+if GEMINI_REQUESTS_PER_MINUTE < 1:
+    raise ValueError('GEMINI_REQUESTS_PER_MINUTE must be at least 1')
+
+if WEBHOOK_URL and not WEBHOOK_SECRET:
+    raise ValueError('WEBHOOK_SECRET must be set in the .env file when WEBHOOK_URL is')
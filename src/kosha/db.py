@@ -1,259 +1,684 @@
 import sqlite3
+import collections
 import os
 import datetime
+import heapq
 import json
+import re
+import threading
+import unicodedata
+import zlib
 import pytz
 
+from . import migrations
+from .cache import LRUCache
+from .core.config import DB_SHARDS, TIMEZONE
+
 DB_NAME = 'database.db'
+tz = pytz.timezone(TIMEZONE)
+
+# New users are spread over this many files. Shard 0 is DB_NAME and also
+# holds the directory (every user's row in `users`, with the shard holding
+# their data) and the tables that belong to no user.
+SHARDS = DB_SHARDS
+# Row ids in shard k are allocated from [k * SHARD_ID_SPAN, (k + 1) * SHARD_ID_SPAN),
+# so ids stay unique across files and a row's shard follows from its id.
+SHARD_ID_SPAN = 1 << 40
+
+# Applied once per connection when it is opened, instead of on every call.
+# WAL lets readers run alongside the writer, and NORMAL sync is durable
+# enough under WAL while avoiding an fsync on every commit.
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",      # ~16 MB page cache
+    "PRAGMA mmap_size = 134217728",    # 128 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+# Number of compiled statements sqlite3 keeps per connection.
+STATEMENT_CACHE_SIZE = 128
+# Journal searches rank matching entries in blocks of this many, newest first.
+SEARCH_CANDIDATES = 200
+# zlib level for archived months; they are written once and read rarely.
+ARCHIVE_COMPRESSION_LEVEL = 9
+
+# chat_id -> user_id never changes once a user exists, so the hot path
+# (every message, callback and /gemini turn) can skip SQLite entirely.
+USER_CACHE_SIZE = 10000
+user_ids = LRUCache(USER_CACHE_SIZE)
+# user_id -> shard; only the rebalance tool moves users, with the bot stopped.
+user_shards = LRUCache(USER_CACHE_SIZE)
+# Files queried by cross-shard reads: SHARDS, or more while users still sit in shards beyond it.
+shard_count = SHARDS
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+# Bumped by close_connections so other threads reopen instead of reusing a closed handle.
+_generation = 0
+
+def shard_path(shard: int) -> str:
+    """File holding `shard`: DB_NAME for shard 0, then e.g. database.1.db, database.2.db."""
+    if shard == 0:
+        return DB_NAME
+    root, ext = os.path.splitext(DB_NAME)
+    return f"{root}.{shard}{ext}"
+
+def get_connection(shard: int = 0) -> sqlite3.Connection:
+    """Returns the calling thread's long-lived connection to `shard`, opening it on first use."""
+    path = shard_path(shard)
+    if getattr(_local, 'generation', None) != _generation:
+        _local.conns = {}
+        _local.generation = _generation
+    conn = _local.conns.get(path)
+    if conn is not None:
+        return conn
+
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+
+    _local.conns[path] = conn
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+def close_connections():
+    """Closes every connection opened by get_connection, e.g. on shutdown."""
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        _connections.clear()
+        _generation += 1
+    _local.__dict__.clear()
+
+def shard_of_user(user_id) -> int:
+    """Returns the shard holding the user's data, from the directory in shard 0."""
+    shard = user_shards.get(user_id)
+    if shard is None:
+        row = get_connection().execute("SELECT shard FROM users WHERE id = ?", (user_id,)).fetchone()
+        shard = row[0] if row else 0
+        user_shards.put(user_id, shard)
+    return shard
+
+def shard_of_row(row_id) -> int:
+    return row_id // SHARD_ID_SPAN
+
+def user_connection(user_id) -> sqlite3.Connection:
+    return get_connection(shard_of_user(user_id))
+
+def next_id(table: str, shard: int) -> str:
+    """SQL for the next row id of `table` in `shard`'s id range, for use in an INSERT."""
+    return f"(SELECT COALESCE(MAX(id), {shard * SHARD_ID_SPAN}) + 1 FROM {table})"
+
+def group_by_shard(items, shard_of) -> dict:
+    """Groups items by shard, e.g. group_by_shard(ids, shard_of_row) -> {shard: [ids]}."""
+    groups = collections.defaultdict(list)
+    for item in items:
+        groups[shard_of(item)].append(item)
+    return groups
  
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS users
-                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal user ID)
-            telegram_chat_id INTEGER UNIQUE NOT NULL   -- Telegram's chat ID
-                    
-                   
-            -- We'll add daily_summary_time and other settings here later
-            );''')
-    
-    cursor.execute('''CREATE TABLE IF NOT EXISTS logs
-                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal message ID)
-                user_id INTEGER NOT NULL, -- Foreign key referencing the user table
-                content TEXT NOT NULL, -- The content of the message
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, -- The timestamp of the message
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE -- Foreign key constraint
-                );''')
-    
-    cursor.execute('''CREATE TABLE IF NOT EXISTS reminders
-                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal reminder ID)
-                user_id INTEGER NOT NULL, -- Foreign key referencing the user table
-                content TEXT NOT NULL, -- The content of the reminder
-                timestamp TEXT NOT NULL, -- when to send the reminder
-                is_active BOOLEAN DEFAULT TRUE,-- whether the reminder is active
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE -- Foreign key constraint
-                );''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS summaries
-                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal summary ID)
-                user_id INTEGER NOT NULL, -- Foreign key referencing the user table
-                content TEXT NOT NULL, -- The content of the summary
-                date DATE NOT NULL, -- The date of the summary
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, -- The timestamp of the summary
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE, -- Foreign key constraint
-                UNIQUE(user_id, date) -- Ensure there's only one summary per user and date
-                   
-                );''')
-    # creating todo table. Should have is_active column to track if task is done or not
-    cursor.execute('''CREATE TABLE IF NOT EXISTS todo
-                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal todo ID)
-                user_id INTEGER NOT NULL, -- Foreign key referencing the user table 
-                content TEXT NOT NULL, -- The content of the todo item
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, -- The timestamp of the last todo update
-                is_done BOOLEAN DEFAULT FALSE,-- whether the todo was completed
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE  -- Foreign key constraint
-                );''')
-
- #   cursor.execute('''CREATE TABLE IF NOT EXISTS sleep
- #               (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal sleep log ID)
- #               user_id INTEGER NOT NULL, -- Foreign key referencing the user table
-#                date  DATE NOT NULL, -- The date of the sleep session   
- #               sleep_start DATETIME NOT NULL, -- The start time of the sleep session
- #               sleep_end DATETIME DEFAULT NULL, -- The end time of the sleep session
- #               sleep_duration TEXT DEFAULT NULL, -- The duration of the sleep session
- #               FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE -- Foreign key constraint
- #               );''')
+def day_range(date):
+    """Returns the half-open [start, end) UTC timestamps covering a local calendar day.
+
+    Rows store CURRENT_TIMESTAMP (UTC text), so comparing against these bounds
+    lets SQLite use the (user_id, timestamp) indexes instead of DATE(timestamp).
+    """
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    start = tz.localize(datetime.datetime.combine(date, datetime.time.min))
+    end = tz.localize(datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min))
+    return (start.astimezone(pytz.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            end.astimezone(pytz.utc).strftime('%Y-%m-%d %H:%M:%S'))
 
-    
-    conn.commit()
-    conn.close()
-
-    print("Database initialized.")
+def init_db():
+    """Migrates every shard file, including shards beyond SHARDS that still hold users."""
+    global shard_count
+    version = migrations.migrate(get_connection())
+    used = get_connection().execute("SELECT MAX(shard) FROM users").fetchone()[0] or 0
+    shard_count = max(SHARDS, used + 1)
+    for shard in range(1, shard_count):
+        migrations.migrate(get_connection(shard))
+
+    shards = f" across {shard_count} shards" if shard_count > 1 else ""
+    print(f"Database initialized (schema version {version}){shards}.")
+
+def warm_user_cache():
+    """Fills the chat_id -> user_id and user_id -> shard caches from the directory."""
+    for user in get_all_users()[:USER_CACHE_SIZE]:
+        user_ids.put(user['telegram_chat_id'], user['id'])
+        user_shards.put(user['id'], user['shard'])
+    print(f"User cache warmed with {len(user_ids)} users.")
 
 def get_or_create_user(telegram_chat_id):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
+    user_id = user_ids.get(telegram_chat_id)
+    if user_id is not None:
+        return user_id
+
+    conn = get_connection()
 
-    cursor.execute("SELECT id FROM users WHERE telegram_chat_id = ?", (telegram_chat_id,))
-    user = cursor.fetchone()
+    user = conn.execute("SELECT id, shard FROM users WHERE telegram_chat_id = ?", (telegram_chat_id,)).fetchone()
 
     if user:
-        user_id = user[0]
+        user_id, shard = user
     else:
-        cursor.execute("INSERT INTO users (telegram_chat_id) VALUES (?)", (telegram_chat_id,))
-        conn.commit()
-        user_id = cursor.lastrowid
+        with conn:
+            cursor = conn.execute("INSERT INTO users (telegram_chat_id) VALUES (?)", (telegram_chat_id,))
+            user_id = cursor.lastrowid
+            shard = user_id % SHARDS
+            if shard:
+                # The data shard needs the user's row for its foreign keys; it is added before the
+                # directory entry commits, so a user never exists without it.
+                conn.execute("UPDATE users SET shard = ? WHERE id = ?", (shard, user_id))
+                with get_connection(shard) as shard_conn:
+                    shard_conn.execute("INSERT OR REPLACE INTO users (id, telegram_chat_id, shard) VALUES (?, ?, ?)",
+                                       (user_id, telegram_chat_id, shard))
         print(f"New user created with ID: {user_id} (chat ID: {telegram_chat_id})")
 
-    conn.close()
-
+    user_ids.put(telegram_chat_id, user_id)
+    user_shards.put(user_id, shard)
     return user_id
 
 def log_message(user_id,content):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
-
-    cursor.execute("INSERT INTO logs (user_id, content) VALUES (?, ?)", (user_id, content))
-    conn.commit()
+    shard = shard_of_user(user_id)
+    conn = get_connection(shard)
 
-    conn.close()
+    with conn:
+        conn.execute(f"INSERT INTO logs (id, user_id, content) VALUES ({next_id('logs', shard)}, ?, ?)", (user_id, content))
 
     print(f"Message logged for user ID: {user_id}")
 
-def get_messages_for_day(user_id,date):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT timestamp,content FROM logs WHERE user_id = ? AND DATE(timestamp) = ? ORDER BY timestamp ", (user_id,date))
-    logs = cursor.fetchall()
+def log_messages(entries):
+    """Inserts a batch of (user_id, content) journal entries, in one transaction per shard."""
+    for shard, rows in group_by_shard(entries, lambda entry: shard_of_user(entry[0])).items():
+        with get_connection(shard) as conn:
+            conn.executemany(f"INSERT INTO logs (id, user_id, content) VALUES ({next_id('logs', shard)}, ?, ?)", rows)
 
-    conn.close()
+    print(f"Logged {len(entries)} messages in one batch.")
 
-    return logs
+def get_messages_for_day(user_id,date):
+    conn = user_connection(user_id)
+
+    start, end = day_range(date)
+    logs = conn.execute("SELECT timestamp,content FROM logs WHERE user_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp ", (user_id, start, end)).fetchall()
+    archived = _archived_messages(conn, user_id, start, end)
+    if not archived:
+        return logs
+    # A local day can straddle the month boundary the archive was cut at.
+    return list(heapq.merge(archived, logs, key=lambda row: row[0]))
+
+def _pack_archive(entries) -> bytes:
+    return zlib.compress(json.dumps(entries, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), ARCHIVE_COMPRESSION_LEVEL)
+
+def _unpack_archive(data) -> list:
+    return json.loads(zlib.decompress(data))
+
+def _archived_messages(conn, user_id, start, end):
+    """(timestamp, content) of the user's archived entries in [start, end), oldest first."""
+    rows = conn.execute("SELECT data FROM logs_archive WHERE user_id = ? AND month >= ? AND month <= ? ORDER BY month",
+                        (user_id, start[:7], end[:7])).fetchall()
+    entries = [(timestamp, content) for (data,) in rows for _, timestamp, content in _unpack_archive(data)
+               if start <= timestamp < end]
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+def get_archivable_months(user_id, before):
+    """Returns (month, entries, chars) for each month of the user's journal entries older than `before`."""
+    conn = user_connection(user_id)
+
+    return conn.execute("""
+        SELECT substr(timestamp, 1, 7) AS month, COUNT(*) AS entries, SUM(LENGTH(content)) AS chars
+        FROM logs WHERE user_id = ? AND timestamp < ? GROUP BY month ORDER BY month
+    """, (user_id, before)).fetchall()
+
+def archive_logs(user_id, before):
+    """Moves the user's journal entries older than `before` (a UTC timestamp) into logs_archive.
+
+    Each month is packed and removed from logs (with its full-text index
+    entries and embeddings) in its own transaction, merged with anything
+    already archived for that month. Returns (entries, characters, packed bytes).
+    """
+    conn = user_connection(user_id)
+    moved = chars = packed = 0
+    for month, _, _ in get_archivable_months(user_id, before):
+        start = f"{month}-01"
+        end = min(before, f"{month}-32")
+        with conn:
+            rows = conn.execute("SELECT id, timestamp, content FROM logs WHERE user_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY id",
+                                (user_id, start, end)).fetchall()
+            entries = [list(row) for row in rows]
+            existing = conn.execute("SELECT data FROM logs_archive WHERE user_id = ? AND month = ?", (user_id, month)).fetchone()
+            if existing:
+                entries = sorted(_unpack_archive(existing[0]) + entries)
+            data = _pack_archive(entries)
+            conn.execute("INSERT OR REPLACE INTO logs_archive (user_id, month, entries, chars, data) VALUES (?, ?, ?, ?, ?)",
+                         (user_id, month, len(entries), sum(len(entry[2]) for entry in entries), data))
+            conn.execute("""
+                DELETE FROM journal_embeddings WHERE user_id = ? AND kind = 'log' AND row_id IN (
+                    SELECT id FROM logs WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
+                )
+            """, (user_id, user_id, start, end))
+            conn.execute("DELETE FROM logs WHERE user_id = ? AND timestamp >= ? AND timestamp < ?", (user_id, start, end))
+        moved += len(rows)
+        chars += sum(len(row['content']) for row in rows)
+        packed += len(data)
+    return moved, chars, packed
+
+def optimize_log_index(shard=0):
+    """Merges a shard's full-text index into one segment, dropping the entries of deleted rows.
+
+    FTS5 deletes only add tombstones, so after archiving most of a journal the
+    index is larger than before until its segments are merged.
+    """
+    with get_connection(shard) as conn:
+        conn.execute("INSERT INTO logs_fts (logs_fts) VALUES ('optimize')")
+
+def vacuum(shard=0):
+    """Rebuilds a shard's file without its free pages and empties its -wal file.
+
+    Under WAL the rebuilt pages go to the -wal file first; the checkpoint
+    copies them back and truncates it, which is when the file shrinks.
+    """
+    conn = get_connection(shard)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def log_storage(shard=0, pages=True):
+    """Returns the bytes of a shard's file, its free pages and, with `pages`, its live and archived journal b-trees.
+
+    The file bytes include the -wal file, which holds recent writes until they
+    are checkpointed. The live b-trees (logs, their index and full-text index)
+    are what scans and day lookups pull into the page cache. Sizing them reads
+    every one of their pages, so pass pages=False for just the cheap figures.
+    """
+    conn = get_connection(shard)
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    path = shard_path(shard)
+    storage = {
+        'file_bytes': sum(os.path.getsize(file) for file in (path, path + '-wal') if os.path.exists(file)),
+        'free_bytes': conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size,
+    }
+    if pages:
+        sizes = dict(conn.execute("""
+            SELECT name, pgsize FROM dbstat WHERE aggregate = TRUE AND name IN (
+                SELECT name FROM sqlite_schema WHERE tbl_name IN ('logs', 'logs_archive') OR name LIKE 'logs\\_fts\\_%' ESCAPE '\\'
+            )
+        """).fetchall())
+        storage['archive_bytes'] = sum(size for name, size in sizes.items() if name.startswith(('logs_archive', 'sqlite_autoindex_logs_archive')))
+        storage['live_bytes'] = sum(sizes.values()) - storage['archive_bytes']
+    return storage
+
+def _fold(text):
+    """Lowercases text and strips diacritics, as the logs_fts tokenizer does."""
+    if not text.isascii():
+        text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return text.lower()
+
+def fts_query(text):
+    """Turns free text into an FTS5 query that matches entries containing every word, or None if it has no words."""
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms)
+
+def _rank_matches(rows, text):
+    """Orders candidate (id, content) rows by BM25 term frequency and length normalization, newest first on ties.
+
+    Every candidate contains every term, so FTS5's inverse document
+    frequencies would only rescale terms; skipping them avoids its
+    per-query scan of each term's full posting list.
+    """
+    k1, b = 1.2, 0.75
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in re.findall(r'\w+', _fold(text))) + r')\b')
+    folded = [(row[0], _fold(row[1])) for row in rows]
+    average_length = sum(len(content) for _, content in folded) / len(folded)
+    scores = []
+    for log_id, content in folded:
+        norm = k1 * (1 - b + b * len(content) / average_length)
+        frequencies = collections.Counter(pattern.findall(content)).values()
+        scores.append((-sum(f * (k1 + 1) / (f + norm) for f in frequencies), -log_id))
+    return [-log_id for _, log_id in sorted(scores)]
+
+def search_logs(user_id, text, limit, offset=0):
+    """Returns (id, timestamp, snippet) rows for the user's best-matching journal entries, and their ranking span.
+
+    Matches are ranked in blocks of the SEARCH_CANDIDATES newest, then the
+    next newest, and so on, so a search costs about the same however large
+    the journal or common the words, and paging on reaches the oldest match.
+    The span is (first, last) of the block the first row was ranked in,
+    counting matches from the newest, or None if all matches fit in one.
+    Matched words in the snippet are wrapped in \x02 and \x03 so callers can
+    escape the text before highlighting.
+    """
+    query = fts_query(text)
+    if query is None:
+        return [], None
+    match = f'user_id : "{user_id}" AND content : ({query})'
+    conn = user_connection(user_id)
+
+    block, skip = divmod(offset, SEARCH_CANDIDATES)
+    ids, span = [], None
+    while len(ids) < limit:
+        # One match past the block tells whether older ones remain.
+        candidates = conn.execute("""
+            SELECT id, content FROM logs WHERE id IN (
+                SELECT rowid FROM logs_fts WHERE logs_fts MATCH ? ORDER BY rowid DESC LIMIT ? OFFSET ?
+            )
+        """, (match, SEARCH_CANDIDATES + 1, block * SEARCH_CANDIDATES)).fetchall()
+        older = len(candidates) > SEARCH_CANDIDATES
+        candidates = sorted(candidates, key=lambda row: row[0], reverse=True)[:SEARCH_CANDIDATES]
+        ranked = _rank_matches(candidates, text)[skip:skip + limit - len(ids)] if candidates else []
+        if ranked and span is None and (older or block):
+            span = (block * SEARCH_CANDIDATES + 1, block * SEARCH_CANDIDATES + len(candidates))
+        ids += ranked
+        if not older:
+            break
+        block, skip = block + 1, 0
+    if not ids:
+        return [], None
+
+    # Snippets are costly, so they are built only for the page being shown.
+    rows = conn.execute(f"""
+        SELECT logs.id, logs.timestamp, snippet(logs_fts, 0, char(2), char(3), '…', 16) AS snippet
+        FROM logs_fts JOIN logs ON logs.id = logs_fts.rowid
+        WHERE logs_fts MATCH ? AND logs_fts.rowid IN ({", ".join("?" * len(ids))})
+    """, (match, *ids)).fetchall()
+    order = {log_id: position for position, log_id in enumerate(ids)}
+    return sorted(rows, key=lambda row: order[row['id']]), span
+
+def rank_journal(user_id, query, limit):
+    """Returns up to `limit` (kind, id) keys of the user's logs and summaries that best match the FTS5 `query`, best first."""
+    conn = user_connection(user_id)
+
+    match = f'user_id : "{user_id}" AND content : ({query})'
+    return conn.execute("""
+        SELECT kind, id FROM (
+            SELECT * FROM (
+                SELECT 'log' AS kind, rowid AS id, bm25(logs_fts, 1.0, 0.0) AS score
+                FROM logs_fts WHERE logs_fts MATCH ? ORDER BY score LIMIT ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'summary' AS kind, rowid AS id, bm25(summaries_fts, 1.0, 0.0) AS score
+                FROM summaries_fts WHERE summaries_fts MATCH ? ORDER BY score LIMIT ?
+            )
+        ) ORDER BY score LIMIT ?
+    """, (match, limit, match, limit, limit)).fetchall()
+
+def get_journal_entries(keys):
+    """Returns {(kind, id): (date or timestamp, content)} for the given log and summary keys."""
+    entries = {}
+    for shard, shard_keys in group_by_shard(keys, lambda key: shard_of_row(key[1])).items():
+        conn = get_connection(shard)
+        for kind, query in (('log', "SELECT id, timestamp, content FROM logs WHERE id IN ({})"),
+                            ('summary', "SELECT id, date, content FROM summaries WHERE id IN ({})")):
+            ids = [row_id for key_kind, row_id in shard_keys if key_kind == kind]
+            if ids:
+                for row_id, when, content in conn.execute(query.format(", ".join("?" * len(ids))), ids):
+                    entries[(kind, row_id)] = (when, content)
+    return entries
+
+def get_journal_size(user_id):
+    """Returns (entries, characters) across the user's logs and summaries."""
+    conn = user_connection(user_id)
+
+    return conn.execute("""
+        SELECT SUM(entries), SUM(chars) FROM (
+            SELECT COUNT(*) AS entries, COALESCE(SUM(LENGTH(content)), 0) AS chars FROM logs WHERE user_id = ?
+            UNION ALL
+            SELECT COALESCE(SUM(entries), 0), COALESCE(SUM(chars), 0) FROM logs_archive WHERE user_id = ?
+            UNION ALL
+            SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM summaries WHERE user_id = ?
+        )
+    """, (user_id, user_id, user_id)).fetchone()
+
+def get_unembedded_entries(user_id, limit):
+    """Returns up to `limit` (kind, id, content) rows of the user's logs and summaries newer than their last embedded row."""
+    conn = user_connection(user_id)
+
+    return conn.execute("""
+        SELECT * FROM (
+            SELECT 'log', id, content FROM logs WHERE user_id = ? AND id > (
+                SELECT COALESCE(MAX(row_id), 0) FROM journal_embeddings WHERE user_id = ? AND kind = 'log'
+            ) ORDER BY id LIMIT ?
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'summary', id, content FROM summaries WHERE user_id = ? AND id > (
+                SELECT COALESCE(MAX(row_id), 0) FROM journal_embeddings WHERE user_id = ? AND kind = 'summary'
+            ) ORDER BY id LIMIT ?
+        )
+    """, (user_id, user_id, limit, user_id, user_id, limit)).fetchall()
+
+def put_embeddings(rows):
+    """Stores (kind, row_id, user_id, vector bytes) embeddings next to their rows."""
+    for shard, shard_rows in group_by_shard(rows, lambda row: shard_of_row(row[1])).items():
+        with get_connection(shard) as conn:
+            conn.executemany("INSERT OR REPLACE INTO journal_embeddings (kind, row_id, user_id, vector) VALUES (?, ?, ?, ?)", shard_rows)
+
+def get_embeddings(user_id):
+    conn = user_connection(user_id)
+
+    return conn.execute("SELECT kind, row_id, vector FROM journal_embeddings WHERE user_id = ?", (user_id,)).fetchall()
 
 def set_reminder(user_id, content, timestamp):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
+    shard = shard_of_user(user_id)
+    conn = get_connection(shard)
 
-    cursor.execute("INSERT INTO reminders (user_id, content, timestamp, is_active) VALUES (?, ?, ?, ?)", (user_id, content, timestamp.isoformat(), True))
-    conn.commit()
+    with conn:
+        cursor = conn.execute(f"INSERT INTO reminders (id, user_id, content, timestamp, fire_at, is_active) VALUES ({next_id('reminders', shard)}, ?, ?, ?, ?, ?)", (user_id, content, timestamp.isoformat(), int(timestamp.timestamp()), True))
     reminder_id = cursor.lastrowid
 
-    conn.close()
-
     print(f"Reminder {reminder_id} set for user ID: {user_id}")
     return reminder_id
 
 def deactivate_reminder(reminder_id):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
+    conn = get_connection(shard_of_row(reminder_id))
 
-    cursor.execute("UPDATE reminders SET is_active = FALSE WHERE id = ?", (reminder_id,))
-    conn.commit()
-
-    conn.close()
+    with conn:
+        conn.execute("UPDATE reminders SET is_active = FALSE WHERE id = ?", (reminder_id,))
 
     print(f"Reminder {reminder_id} deactivated.")
 
-def get_active_reminders( ):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def deactivate_reminders(reminder_ids):
+    """Deactivates many reminders, in one transaction per shard."""
+    for shard, ids in group_by_shard(reminder_ids, shard_of_row).items():
+        with get_connection(shard) as conn:
+            conn.executemany("UPDATE reminders SET is_active = FALSE WHERE id = ?", ((reminder_id,) for reminder_id in ids))
 
-    cursor.execute("""
-        SELECT r.id, u.telegram_chat_id AS chat_id, r.content, r.timestamp
+    print(f"{len(reminder_ids)} reminders deactivated.")
+
+def _merge_by_fire_at(per_shard):
+    if len(per_shard) == 1:
+        return per_shard[0]
+    return list(heapq.merge(*per_shard, key=lambda reminder: reminder['fire_at']))
+
+def get_active_reminders( ):
+    """Returns every shard's active reminders, soonest first."""
+    return _merge_by_fire_at([get_connection(shard).execute("""
+        SELECT r.id, u.telegram_chat_id AS chat_id, r.content, r.timestamp, r.fire_at
         FROM reminders r
         JOIN users u ON r.user_id = u.id
         WHERE r.is_active = TRUE
-        ORDER BY r.timestamp
-    """)
-    active_reminders = cursor.fetchall()
+        ORDER BY r.fire_at
+    """).fetchall() for shard in range(shard_count)])
 
-    conn.close()
-
-    return active_reminders 
+def get_reminders_due_before(fire_at):
+    """Returns active reminders firing before `fire_at` (UTC epoch seconds) in every shard, soonest first."""
+    return _merge_by_fire_at([get_connection(shard).execute("""
+        SELECT r.id, u.telegram_chat_id AS chat_id, r.content, r.timestamp, r.fire_at
+        FROM reminders r
+        JOIN users u ON r.user_id = u.id
+        WHERE r.is_active = TRUE AND r.fire_at < ?
+        ORDER BY r.fire_at
+    """, (fire_at,)).fetchall() for shard in range(shard_count)])
 
 def add_summary(user_id, content, date):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
+    shard = shard_of_user(user_id)
+    conn = get_connection(shard)
     try:
-        cursor.execute("INSERT INTO summaries (user_id, content, date) VALUES (?, ?, ?)", (user_id, content, date.isoformat()))
-        conn.commit()
+        with conn:
+            conn.execute(f"INSERT INTO summaries (id, user_id, content, date) VALUES ({next_id('summaries', shard)}, ?, ?, ?)", (user_id, content, date.isoformat()))
         print(f"Summary added for user ID: {user_id}")
     except sqlite3.IntegrityError:
         print(f"Summary already exists for user ID: {user_id}")
-        conn.rollback()
-    finally:
 
-        conn.close()
+def get_summary_checkpoints(date):
+    """Returns {user_id: sent_at} for every summary stored for a date in any shard (sent_at is None if undelivered)."""
+    checkpoints = {}
+    for shard in range(shard_count):
+        rows = get_connection(shard).execute("SELECT user_id, sent_at FROM summaries WHERE date = ?", (date.isoformat(),)).fetchall()
+        checkpoints.update((row['user_id'], row['sent_at']) for row in rows)
+    return checkpoints
 
-    
+def mark_summary_sent(user_id, date):
+    conn = user_connection(user_id)
+
+    with conn:
+        conn.execute("UPDATE summaries SET sent_at = CURRENT_TIMESTAMP WHERE user_id = ? AND date = ?", (user_id, date.isoformat()))
 
 def get_all_users():
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor() 
+    """Returns every user in every shard, with the shard holding their data, from the directory."""
+    conn = get_connection()
 
-    cursor.execute("SELECT id, telegram_chat_id FROM users")
-    users = cursor.fetchall()
+    return conn.execute("SELECT id, telegram_chat_id, shard FROM users").fetchall()
 
-    conn.close() 
+def get_summary_for_user(user_id, date):
+    conn = user_connection(user_id)
 
-    return users   
+    return conn.execute("SELECT content FROM summaries WHERE user_id = ? AND date = ?", (user_id, date.isoformat())).fetchone()
 
-def get_summary_for_user(user_id, date):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def get_cached_response(key, min_created_at):
+    """Returns the cached (response, created_at) for `key` unless it is older than `min_created_at`."""
+    conn = get_connection()
 
-    cursor.execute("SELECT content FROM summaries WHERE user_id = ? AND date = ?", (user_id, date.isoformat()))
-    summary = cursor.fetchone()
+    return conn.execute("SELECT response, created_at FROM gemini_cache WHERE key = ? AND created_at >= ?", (key, min_created_at)).fetchone()
 
-    conn.close()
+def touch_cached_response(key, accessed_at):
+    conn = get_connection()
 
-    return summary
+    with conn:
+        conn.execute("UPDATE gemini_cache SET accessed_at = ? WHERE key = ?", (accessed_at, key))
 
-def add_todo(user_id, content):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
+def put_cached_response(key, model, response, created_at):
+    conn = get_connection()
 
-    cursor.execute("INSERT INTO todo (user_id, content) VALUES (?, ?)", (user_id, content))
-    todo_id = cursor.lastrowid
-    conn.commit()
-    conn.close() 
-    return todo_id
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO gemini_cache (key, model, response, size, created_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (key, model, response, len(response.encode('utf-8')), created_at, created_at))
 
-    
+def prune_response_cache(min_created_at, max_bytes):
+    """Drops expired responses, then the least recently used ones until the cache fits in `max_bytes`."""
+    conn = get_connection()
 
-def get_todos_for_user(user_id,date): 
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with conn:
+        expired = conn.execute("DELETE FROM gemini_cache WHERE created_at < ?", (min_created_at,)).rowcount
+        evicted = conn.execute("""
+            DELETE FROM gemini_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running_size
+                    FROM gemini_cache
+                ) WHERE running_size > ?
+            )
+        """, (max_bytes,)).rowcount
 
-    cursor.execute("SELECT  id, content, is_done FROM todo WHERE user_id = ? AND DATE(timestamp) = ? ORDER BY timestamp ", (user_id,date))
-    todos = cursor.fetchall()
+    if expired or evicted:
+        print(f"Gemini cache pruned: {expired} expired, {evicted} evicted for size.")
+    return expired + evicted
 
-    conn.close()
+def get_gemini_session(user_id, min_updated_at):
+    """Returns the stored (history, turns) for `user_id` unless it was last used before `min_updated_at`."""
+    conn = user_connection(user_id)
 
-    return todos
+    return conn.execute("SELECT history, turns FROM gemini_sessions WHERE user_id = ? AND updated_at >= ?", (user_id, min_updated_at)).fetchone()
 
-def mark_todo_done(todo_id,new_value):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
+def save_gemini_session(user_id, history, turns, updated_at):
+    conn = user_connection(user_id)
 
-    cursor.execute("UPDATE todo SET is_done = ? WHERE id = ?", (new_value, todo_id))
-    conn.commit()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO gemini_sessions (user_id, history, turns, updated_at) VALUES (?, ?, ?, ?)",
+                     (user_id, history, turns, updated_at))
 
-    conn.close()
+def delete_gemini_session(user_id):
+    conn = user_connection(user_id)
+
+    with conn:
+        conn.execute("DELETE FROM gemini_sessions WHERE user_id = ?", (user_id,))
+
+def prune_gemini_sessions(min_updated_at):
+    """Drops chats nobody has touched since `min_updated_at`, in every shard."""
+    pruned = 0
+    for shard in range(shard_count):
+        with get_connection(shard) as conn:
+            pruned += conn.execute("DELETE FROM gemini_sessions WHERE updated_at < ?", (min_updated_at,)).rowcount
+    return pruned
+
+def add_todo(user_id, content):
+    shard = shard_of_user(user_id)
+    conn = get_connection(shard)
+
+    with conn:
+        cursor = conn.execute(f"INSERT INTO todo (id, user_id, content) VALUES ({next_id('todo', shard)}, ?, ?)", (user_id, content))
+    return cursor.lastrowid
+
+def get_todos_for_user(user_id,date): 
+    conn = user_connection(user_id)
+
+    start, end = day_range(date)
+    return conn.execute("SELECT  id, content, is_done FROM todo WHERE user_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp ", (user_id, start, end)).fetchall()
+
+def get_todos_for_all_users(date):
+    """Returns every user's TODOs for a day in one query, grouped as {(user_id, chat_id): [todo rows]}.
+
+    Users without TODOs that day are included with an empty list. Each shard
+    answers for the users whose data it holds.
+    """
+    start, end = day_range(date)
+    todos_by_user = {}
+    for shard in range(shard_count):
+        rows = get_connection(shard).execute("""
+            SELECT u.id AS user_id, u.telegram_chat_id AS chat_id, t.id, t.content, t.is_done
+            FROM users u
+            LEFT JOIN todo t ON t.user_id = u.id AND t.timestamp >= ? AND t.timestamp < ?
+            WHERE u.shard = ?
+            ORDER BY u.id, t.timestamp
+        """, (start, end, shard)).fetchall()
+
+        for row in rows:
+            todos = todos_by_user.setdefault((row['user_id'], row['chat_id']), [])
+            if row['id'] is not None:
+                todos.append(row)
+    return todos_by_user
+
+def mark_todo_done(todo_id,new_value):
+    """Sets a todo's done flag. Returns False if it already had that value or does not exist."""
+    conn = get_connection(shard_of_row(todo_id))
+
+    with conn:
+        cursor = conn.execute("UPDATE todo SET is_done = ? WHERE id = ? AND is_done != ?", (new_value, todo_id, new_value))
 
     print(f"Todo {todo_id} marked as done.")
-    return new_value
+    return cursor.rowcount > 0
 
 def delete_todo(todo_id):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute("PRAGMA foreign_keys = ON")
-    cursor = conn.cursor()
+    """Deletes a todo. Returns False if it was already gone."""
+    conn = get_connection(shard_of_row(todo_id))
 
-    cursor.execute("DELETE FROM todo WHERE id = ?", (todo_id,))
-    conn.commit()
-
-    conn.close()
+    with conn:
+        cursor = conn.execute("DELETE FROM todo WHERE id = ?", (todo_id,))
 
     print(f"Todo {todo_id} deleted.")
+    return cursor.rowcount > 0
 
 '''def log_sleep_start(user_id,timestamp):
     conn = sqlite3.connect(DB_NAME)
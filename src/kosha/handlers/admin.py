@@ -0,0 +1,70 @@
+import datetime
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from .auth import admin_only
+from . import todo
+from .. import metrics, outbox, response_cache, retrieval, sessions, streaming
+
+# Rows shown per table in /stats; the full breakdown is on the metrics endpoint.
+TOP_ROWS = 8
+
+def _ms(seconds) -> str:
+    return '-' if seconds is None else f"{seconds * 1000:.0f}ms" if seconds < 10 else f"{seconds:.0f}s"
+
+def _latency_rows(histogram, errors=None, limit=TOP_ROWS) -> list[str]:
+    """One line per label set, busiest first: calls, p50, p95, and errors when a counter is given."""
+    series = sorted(histogram.series().items(), key=lambda item: item[1].sum, reverse=True)
+    failed = errors.series() if errors is not None else {}
+    rows = []
+    for key, data in series[:limit]:
+        line = (f"  {'/'.join(key) or 'all'}: {data.count} × p50 {_ms(histogram.quantile(0.5, data))}, "
+                f"p95 {_ms(histogram.quantile(0.95, data))}, total {data.sum:.1f}s")
+        if failed.get(key):
+            line += f", {failed[key]} failed"
+        rows.append(line)
+    if len(series) > limit:
+        rows.append(f"  ... and {len(series) - limit} more")
+    return rows or ["  none yet"]
+
+def _counter_rows(counter) -> list[str]:
+    return [f"  {'/'.join(key)}: {value}" for key, value in sorted(counter.series().items())] or ["  none"]
+
+def render_stats() -> str:
+    """Plain-text summary of the metrics and of the caches' own counters."""
+    uptime = datetime.timedelta(seconds=int(metrics.uptime()))
+    queue = outbox.queue.stats()
+    responses = response_cache.responses.stats()
+    lines = [
+        f"Uptime {uptime}",
+        "",
+        "Handlers:", *_latency_rows(metrics.handler_seconds, metrics.handler_errors),
+        "",
+        "Database queries:", *_latency_rows(metrics.db_query_seconds, metrics.db_errors),
+        "Database thread wait:", *_latency_rows(metrics.db_wait_seconds),
+        "",
+        "Gemini requests (model/call):", *_latency_rows(metrics.gemini_seconds, metrics.gemini_errors),
+        "Gemini tokens (model/kind):", *_counter_rows(metrics.gemini_tokens),
+        "",
+        "Scheduled job lag:", *_latency_rows(metrics.job_lag_seconds),
+        "Misfires:", *_counter_rows(metrics.job_misfires),
+        "Job errors:", *_counter_rows(metrics.job_errors),
+        "Reminder lag:", *_latency_rows(metrics.reminder_lag_seconds),
+        "",
+        f"Outbox: {queue['sent']} sent, {queue['failed']} failed, {queue['retry_after']} RetryAfter, {queue['depth']} queued",
+        *_latency_rows(metrics.send_seconds),
+        "Send errors (method/error):", *_counter_rows(metrics.send_errors),
+        "",
+        f"Response cache: {responses['hit_rate']:.0%} hits ({responses['memory_entries']} in memory)",
+        f"Gemini sessions: {sessions.store.stats()['sessions']} open",
+        f"Streamed replies: {streaming.stats()['replies']}, /ask questions: {retrieval.stats()['questions']}",
+        f"TODO edits saved by coalescing: {todo.stats()['edits_saved']}",
+    ]
+    return "\n".join(lines)
+
+@admin_only
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Shows the bot's latency, error and usage metrics to the admin."""
+    if not update.message:
+        return
+    await outbox.reply(update.message, render_stats())
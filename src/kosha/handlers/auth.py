@@ -3,7 +3,8 @@ from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from ..core.config import MY_CHAT_ID
+from .. import metrics
+from ..core.config import ADMIN_CHAT_ID, MY_CHAT_ID
 
 def restricted_access(func):
     """Decorator to restrict access to only the allowed chat ID."""
@@ -18,5 +19,26 @@ def restricted_access(func):
             print(f"Unauthorized access denied for chat ID: {chat_id}")
             return
         
+        with metrics.handler_seconds.time(handler=func.__name__):
+            try:
+                return await func(update, context, *args, **kwargs)
+            except Exception:
+                metrics.handler_errors.inc(handler=func.__name__)
+                raise
+    return wrapped
+
+def admin_only(func):
+    """Decorator to restrict a command to ADMIN_CHAT_ID; without one, nobody may use it."""
+    @wraps(func)
+    async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        if not update.effective_chat:
+            return
+
+        chat_id = update.effective_chat.id
+
+        if not ADMIN_CHAT_ID or str(chat_id) != ADMIN_CHAT_ID:
+            print(f"Admin command denied for chat ID: {chat_id}")
+            return
+
         return await func(update, context, *args, **kwargs)
     return wrapped
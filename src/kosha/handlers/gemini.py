@@ -4,11 +4,26 @@ from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ChatAction
 
 from .auth import restricted_access
-from .. import db, utils, client as gemini_client
+from .. import async_db, outbox, retrieval, sessions, streaming, utils, client as gemini_client
+from ..core.config import GEMINI_STREAMING
 
 # Define state for the conversation
 GEMINI_CONVERSATION = 0
 
+async def _reply_to_single_query(message, prompt: str) -> None:
+    """Answers a one-off prompt, streaming the reply if enabled."""
+    if GEMINI_STREAMING:
+        if not await streaming.stream_reply(message, gemini_client.stream_single_query_to_gemini(prompt)):
+            await outbox.reply(message, "🤖 Sorry, I couldn't get a response from Gemini.")
+        return
+
+    response_text = await gemini_client.send_single_query_to_gemini(prompt)
+    if response_text == "No content generated.":
+        await outbox.reply(message, "🤖 Sorry, I couldn't get a response from Gemini.")
+    else:
+        for chunk in utils.render_telegram_html(response_text):
+            await outbox.reply(message, chunk, parse_mode='html')
+
 @restricted_access
 async def start_gemini(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Entry point for the /gemini command."""
@@ -16,7 +31,7 @@ async def start_gemini(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         return ConversationHandler.END
 
     chat_id = update.message.chat_id
-    user_id = db.get_or_create_user(chat_id)
+    user_id = await async_db.get_or_create_user(chat_id)
     query_text = " ".join(context.args) if context.args else None
 
     if context.bot:
@@ -25,59 +40,54 @@ async def start_gemini(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     if query_text:
         # Single-turn interaction
         print(f"User {user_id} sending single Gemini query: {query_text}")
-        response_text = await gemini_client.send_single_query_to_gemini(query_text)
-        
-        if response_text == "No content generated.":
-            await update.message.reply_text("🤖 Sorry, I couldn't get a response from Gemini.")
-        else:
-            response_text = utils.markdown_to_safe_html(response_text)
-            chunks = utils.split_message_for_telegram(response_text)
-            chunks = utils.fix_chunks_with_tags(chunks)
-            for chunk in chunks:
-                await update.message.reply_text(chunk, parse_mode='html')
-        
+        await _reply_to_single_query(update.message, query_text)
         return ConversationHandler.END
     else:
         # Start multi-turn conversation
         print(f"User {user_id} starting multi-turn Gemini chat.")
-        chat_session = gemini_client.start_new_gemini_chat()
-        context.user_data['gemini_chat_session'] = chat_session
-        
-        await update.message.reply_text(
-            "💬 *Gemini Chat started!* Send me your questions. Type `/endgemini` to end the chat.",
-            parse_mode='Markdown'
-        )
+        _, turns = await sessions.store.open(user_id)
+
+        if turns:
+            text = f"💬 *Gemini Chat resumed* after {turns} earlier messages. Type `/endgemini` to end the chat."
+        else:
+            text = "💬 *Gemini Chat started!* Send me your questions. Type `/endgemini` to end the chat."
+        await outbox.reply(update.message, text, parse_mode='Markdown')
         return GEMINI_CONVERSATION
 
 @restricted_access
 async def continue_gemini_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handles messages during an ongoing Gemini chat session."""
-    if not update.message or not update.message.text or not context.user_data:
+    if not update.message or not update.message.text:
         return GEMINI_CONVERSATION # Or END?
 
     chat_id = update.message.chat_id
-    user_id = db.get_or_create_user(chat_id)
+    user_id = await async_db.get_or_create_user(chat_id)
     user_message = update.message.text
-    chat_session = context.user_data.get('gemini_chat_session')
+    chat_session = await sessions.store.get(user_id)
 
     if not chat_session:
-        await update.message.reply_text("Your chat session has expired. Please start a new one with /gemini.")
+        await outbox.reply(update.message, "Your chat session has expired. Please start a new one with /gemini.")
         return ConversationHandler.END
 
     if context.bot:
         await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
 
     print(f"User {user_id} continuing Gemini chat with: {user_message}")
+    if GEMINI_STREAMING:
+        streamed = await streaming.stream_reply(update.message, gemini_client.stream_message_to_gemini_chat(chat_session, user_message))
+        await sessions.store.save(user_id)
+        if not streamed:
+            await outbox.reply(update.message, "🤖 Sorry, I couldn't get a response from Gemini.")
+        return GEMINI_CONVERSATION
+
     response_text = await gemini_client.send_message_to_gemini_chat(chat_session, user_message)
+    await sessions.store.save(user_id)
 
     if response_text == "No content generated.":
-        await update.message.reply_text("🤖 Sorry, I couldn't get a response from Gemini.")
+        await outbox.reply(update.message, "🤖 Sorry, I couldn't get a response from Gemini.")
     else:
-        response_text = utils.markdown_to_safe_html(response_text)
-        chunks = utils.split_message_for_telegram(response_text)
-        chunks = utils.fix_chunks_with_tags(chunks)
-        for chunk in chunks:
-            await update.message.reply_text(chunk, parse_mode='html')
+        for chunk in utils.render_telegram_html(response_text):
+            await outbox.reply(update.message, chunk, parse_mode='html')
             
     return GEMINI_CONVERSATION
 
@@ -87,11 +97,29 @@ async def end_gemini_conversation(update: Update, context: ContextTypes.DEFAULT_
     if not update.message:
         return ConversationHandler.END
 
-    user_id = db.get_or_create_user(update.message.chat_id)
+    user_id = await async_db.get_or_create_user(update.message.chat_id)
     print(f"User {user_id} ending multi-turn Gemini chat.")
+    await sessions.store.end(user_id)
     
-    if 'gemini_chat_session' in context.user_data:
-        del context.user_data['gemini_chat_session']
-    
-    await update.message.reply_text("👋 *Gemini Chat ended.*", parse_mode='Markdown')
+    await outbox.reply(update.message, "👋 *Gemini Chat ended.*", parse_mode='Markdown')
     return ConversationHandler.END
+
+@restricted_access
+async def ask_journal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answers a question about the user's journal from the most relevant entries."""
+    if not update.message or not context.args:
+        await outbox.reply(update.message, "Usage: /ask [question] (e.g., /ask when did I last see the dentist?)")
+        return
+
+    chat_id = update.message.chat_id
+    user_id = await async_db.get_or_create_user(chat_id)
+    question = " ".join(context.args)
+
+    if context.bot:
+        await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+
+    prompt = await retrieval.build_ask_prompt(user_id, question)
+    if prompt is None:
+        await outbox.reply(update.message, "🔎 I couldn't find anything in your journal about that.")
+        return
+    await _reply_to_single_query(update.message, prompt)
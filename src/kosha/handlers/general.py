@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import pytz
 from telegram import Update
@@ -5,7 +6,7 @@ from telegram.ext import ContextTypes
 from telegram.helpers import escape_markdown
 
 from .auth import restricted_access
-from .. import db, utils
+from .. import async_db, journal, outbox, utils
 
 @restricted_access
 async def handle_any_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -17,10 +18,10 @@ async def handle_any_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
     content = update.message.text
     print(f"Logging message for chat_id: {chat_id}")
 
-    user_id = db.get_or_create_user(chat_id)
-    db.log_message(user_id, content)
+    user_id = await async_db.get_or_create_user(chat_id)
+    await journal.writer.log(user_id, content)
 
-    await update.message.reply_text('Saved to your journal!')
+    await outbox.reply(update.message, 'Saved to your journal!')
 
 @restricted_access
 async def show_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -29,11 +30,11 @@ async def show_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     chat_id = update.message.chat_id
-    user_id = db.get_or_create_user(chat_id)
+    user_id = await async_db.get_or_create_user(chat_id)
     today = datetime.date.today()
     today_str = today.strftime('%Y-%m-%d')
     
-    logs = db.get_messages_for_day(user_id, today_str)
+    logs = await async_db.get_messages_for_day(user_id, today_str)
     
     if not logs:
         response_text = f"No logs found for today ({today_str})."
@@ -48,28 +49,28 @@ async def show_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             response_text += f"- {time_str}: {content}\n"
 
     escaped_response = escape_markdown(response_text, version=2)
-    await update.message.reply_text(escaped_response, parse_mode='MarkdownV2')
+    await outbox.reply(update.message, escaped_response, parse_mode='MarkdownV2')
 
 @restricted_access
 async def get_specific_summary(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Retrieves a summary for a specific date."""
     if not update.message or not context.args:
-        await update.message.reply_text("Usage: /summary [date] (e.g., /summary yesterday)")
+        await outbox.reply(update.message, "Usage: /summary [date] (e.g., /summary yesterday)")
         return
 
     chat_id = update.message.chat_id
-    user_id = db.get_or_create_user(chat_id)
+    user_id = await async_db.get_or_create_user(chat_id)
     input_txt = " ".join(context.args)
-    date = utils.parse_datetime(input_txt)
+    date = await asyncio.to_thread(utils.parse_datetime, input_txt)
 
     if date is None:
-        await update.message.reply_text("Invalid date format. Please try something like 'yesterday' or '2023-10-27'.")
+        await outbox.reply(update.message, "Invalid date format. Please try something like 'yesterday' or '2023-10-27'.")
         return
 
-    summary = db.get_summary_for_user(user_id, date.date())
+    summary = await async_db.get_summary_for_user(user_id, date.date())
     
     if not summary:
-        await update.message.reply_text(f"No summary found for {date.strftime('%Y-%m-%d')}.")
+        await outbox.reply(update.message, f"No summary found for {date.strftime('%Y-%m-%d')}.")
         return
 
-    await update.message.reply_text(summary['content'], parse_mode='Markdown')
+    await outbox.reply(update.message, summary['content'], parse_mode='Markdown')
@@ -0,0 +1,101 @@
+import datetime
+import html
+import time
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+
+from .auth import restricted_access
+from .. import async_db, outbox, utils
+
+PAGE_SIZE = 5
+# Queries behind the user's latest result messages, so their page buttons keep working.
+MAX_REMEMBERED_SEARCHES = 20
+
+
+def render_results(query_text: str, rows, page: int, span: tuple[int, int] | None = None) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Renders one page of search hits (fetched with one extra row to detect a next page) as HTML and its buttons.
+
+    `span` is the block of matches, counted from the newest, the page was ranked among, when there are too many to rank at once.
+    """
+    has_next = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    escaped_query = html.escape(query_text)
+
+    if not rows:
+        if page == 0:
+            return f"🔎 No journal entries match <b>{escaped_query}</b>.", None
+        response_text = f"🔎 No more results for <b>{escaped_query}</b>."
+    else:
+        response_text = f"🔎 Results for <b>{escaped_query}</b> (page {page + 1}):\n\n"
+        if span is not None and span[0] == 1:
+            response_text += f"<i>Best of your {span[1]} most recent matches; older ones follow on later pages.</i>\n\n"
+        elif span is not None:
+            response_text += f"<i>Older matches: best of matches {span[0]}–{span[1]}, counting back from the newest.</i>\n\n"
+        for row in rows:
+            timestamp = datetime.datetime.fromisoformat(row['timestamp']).replace(tzinfo=datetime.timezone.utc)
+            time_str = utils.normalize_timestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+            snippet = html.escape(row['snippet']).replace('\x02', '<b>').replace('\x03', '</b>')
+            response_text += f"<i>{time_str}</i>\n{snippet}\n\n"
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Previous", callback_data=f"search:{page - 1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"search:{page + 1}"))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    return response_text, reply_markup
+
+
+async def _search_page(user_id: int, query_text: str, page: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    start = time.perf_counter()
+    rows, span = await async_db.search_logs(user_id, query_text, PAGE_SIZE + 1, page * PAGE_SIZE)
+    print(f"Search for user {user_id} (page {page + 1}): {min(len(rows), PAGE_SIZE)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return render_results(query_text, rows, page, span)
+
+
+@restricted_access
+async def search_journal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Searches the user's journal for entries containing every given word."""
+    if not update.message or not context.args:
+        await outbox.reply(update.message, "Usage: /search [words] (e.g., /search dentist appointment)")
+        return
+
+    user_id = await async_db.get_or_create_user(update.message.chat_id)
+    query_text = " ".join(context.args)
+    response_text, reply_markup = await _search_page(user_id, query_text, 0)
+    sent = await outbox.reply(update.message, response_text, reply_markup=reply_markup, parse_mode='html')
+
+    if reply_markup is not None:
+        searches = context.user_data.setdefault('searches', {})
+        searches[sent.message_id] = query_text
+        while len(searches) > MAX_REMEMBERED_SEARCHES:
+            del searches[next(iter(searches))]
+
+
+@restricted_access
+async def handle_search_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handles the page buttons under search results."""
+    query = update.callback_query
+    if not query or not query.data or not query.message:
+        return
+
+    query_text = context.user_data.get('searches', {}).get(query.message.message_id)
+    if query_text is None:
+        await query.answer("This search has expired. Please run /search again.")
+        return
+    await query.answer()
+
+    page = int(query.data.partition(':')[2])
+    chat_id = query.message.chat_id
+    user_id = await async_db.get_or_create_user(chat_id)
+    response_text, reply_markup = await _search_page(user_id, query_text, page)
+    await outbox.queue.send(
+        chat_id,
+        context.bot.edit_message_text,
+        priority=outbox.INTERACTIVE,
+        chat_id=chat_id,
+        message_id=query.message.message_id,
+        text=response_text,
+        reply_markup=reply_markup,
+        parse_mode='html'
+    )
@@ -1,17 +1,38 @@
+import asyncio
 import datetime
+import hashlib
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
 from .auth import restricted_access
-from .. import db, utils
+from .. import async_db, outbox, utils
+from ..cache import LRUCache
 
+# Users whose rendered TODO list for today is kept; entries are dropped whenever their TODOs change.
+RENDER_CACHE_SIZE = 10000
+# TODO list messages whose current rendering is remembered, so edits that change nothing are skipped.
+SHOWN_MESSAGES = 1000
+# Edits to one TODO list message are at least this many seconds apart; taps in between share an edit.
+EDIT_INTERVAL = 1.0
 
-def _get_formatted_todos_content(user_id: int) -> tuple[str, InlineKeyboardMarkup | None]:
-    """Generates the formatted TODO list message and its inline keyboard."""
-    today = datetime.date.today()
-    todos = db.get_todos_for_user(user_id, today.strftime('%Y-%m-%d'))
-    
-    response_text = f"📝 *Your TODOs for Today ({today.strftime('%Y-%m-%d')}):*\n\n"
+rendered_lists = LRUCache(RENDER_CACHE_SIZE)
+shown_digests = LRUCache(SHOWN_MESSAGES)
+# Bumped on every change to a user's TODOs, so a render that raced with the change is not cached.
+_versions = {}
+# Debounced edits not yet sent, and how many taps each one covers, by (chat_id, message_id).
+_pending_edits = {}
+_pending_taps = {}
+last_edits = LRUCache(SHOWN_MESSAGES)
+skipped_edits = 0
+callbacks_received = 0
+edits_sent = 0
+
+
+def render_todos(todos, day: datetime.date) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Renders TODO rows (id, content, is_done) as the list message and its inline keyboard."""
+    response_text = f"📝 *Your TODOs for Today ({day.strftime('%Y-%m-%d')}):*\n\n"
     keyboard = []
     
     if not todos:
@@ -34,68 +55,189 @@ def _get_formatted_todos_content(user_id: int) -> tuple[str, InlineKeyboardMarku
     return response_text, reply_markup
 
 
-async def _send_or_edit_todos(update: Update, context: ContextTypes.DEFAULT_TYPE, message_id: int = None) -> None:
-    """Sends or edits the TODO list message."""
-    if not update.effective_chat:
+def _digest(text: str, todos) -> str:
+    # The keyboard is determined by each TODO's id and done flag, which is far cheaper than serializing it.
+    buttons = ",".join(f"{todo['id']}:{int(bool(todo['is_done']))}" for todo in todos)
+    return hashlib.sha1(f"{text}\0{buttons}".encode('utf-8')).hexdigest()
+
+
+def cached_todos(user_id: int, day: datetime.date) -> tuple[str, InlineKeyboardMarkup | None, str] | None:
+    """Returns the user's cached (text, reply_markup, digest) TODO list for `day`, or None if it must be rendered."""
+    entry = rendered_lists.get(user_id)
+    if entry is None or entry[0] != day:
+        return None
+    return entry[1]
+
+
+def cache_todos(user_id: int, day: datetime.date, todos, version: int) -> tuple[str, InlineKeyboardMarkup | None, str]:
+    """Renders TODO rows loaded at `version` and caches them unless the user's TODOs changed since."""
+    response_text, reply_markup = render_todos(todos, day)
+    rendered = (response_text, reply_markup, _digest(response_text, todos))
+    if _versions.get(user_id, 0) == version:
+        rendered_lists.put(user_id, (day, rendered))
+    return rendered
+
+
+def cache_version(user_id: int) -> int:
+    """Version to pass to cache_todos for TODOs about to be loaded."""
+    return _versions.get(user_id, 0)
+
+
+def invalidate_todos(user_id: int) -> None:
+    """Drops the user's rendered list after their TODOs changed."""
+    _versions[user_id] = _versions.get(user_id, 0) + 1
+    rendered_lists.pop(user_id)
+
+
+async def get_rendered_todos(user_id: int, day: datetime.date) -> tuple[str, InlineKeyboardMarkup | None, str]:
+    """Returns the user's TODO list for `day` as (text, reply_markup, digest), rendering it only on a cache miss."""
+    rendered = cached_todos(user_id, day)
+    if rendered is None:
+        version = cache_version(user_id)
+        todos = await async_db.get_todos_for_user(user_id, day.strftime('%Y-%m-%d'))
+        rendered = cache_todos(user_id, day, todos, version)
+    return rendered
+
+
+def remember_shown(chat_id: int, message_id: int, digest: str) -> None:
+    """Records which rendering a TODO list message shows, so identical edits to it can be skipped."""
+    shown_digests.put((chat_id, message_id), digest)
+
+
+async def _send_todos(update: Update) -> None:
+    """Replies with the TODO list message."""
+    if not update.effective_chat or not update.message:
         return
-        
-    user_id = db.get_or_create_user(update.effective_chat.id)
-    response_text, reply_markup = _get_formatted_todos_content(user_id)
-    
-    if message_id and context.bot:
-        await context.bot.edit_message_text(
-            chat_id=update.effective_chat.id,
+
+    chat_id = update.effective_chat.id
+    user_id = await async_db.get_or_create_user(chat_id)
+    response_text, reply_markup, digest = await get_rendered_todos(user_id, datetime.date.today())
+    sent = await outbox.reply(
+        update.message,
+        text=response_text,
+        reply_markup=reply_markup,
+        parse_mode='Markdown'
+    )
+    remember_shown(chat_id, sent.message_id, digest)
+
+
+async def _edit_todos(bot, chat_id: int, message_id: int) -> None:
+    """Brings a TODO list message up to date, unless it already shows the current list."""
+    global skipped_edits, edits_sent
+
+    user_id = await async_db.get_or_create_user(chat_id)
+    response_text, reply_markup, digest = await get_rendered_todos(user_id, datetime.date.today())
+    if shown_digests.get((chat_id, message_id)) == digest:
+        skipped_edits += 1
+        return
+    try:
+        await outbox.queue.send(
+            chat_id,
+            bot.edit_message_text,
+            priority=outbox.INTERACTIVE,
+            chat_id=chat_id,
             message_id=message_id,
             text=response_text,
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
-    elif update.message:
-        await update.message.reply_text(
-            text=response_text,
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        edits_sent += 1
+    except BadRequest as e:
+        # The message was shown before we started tracking it, and already matches.
+        if "not modified" not in str(e).lower():
+            raise
+    remember_shown(chat_id, message_id, digest)
+
+
+async def _edit_later(bot, chat_id: int, message_id: int) -> None:
+    key = (chat_id, message_id)
+    wait = last_edits.get(key, 0.0) + EDIT_INTERVAL - time.monotonic()
+    if wait > 0:
+        await asyncio.sleep(wait)
+    # Taps from here on schedule a new edit, since this one may render before their changes land.
+    del _pending_edits[key]
+    taps = _pending_taps.pop(key, 1)
+    last_edits.put(key, time.monotonic())
+    try:
+        await _edit_todos(bot, chat_id, message_id)
+    except Exception as e:
+        print(f"Error editing TODO list {message_id} in chat {chat_id}: {e}")
+        return
+    if taps > 1:
+        print(f"Coalesced {taps} TODO taps in chat {chat_id} into one edit.")
+
+
+def schedule_edit(bot, chat_id: int, message_id: int) -> None:
+    """Edits a TODO list message after a tap, merging taps within EDIT_INTERVAL into one edit.
+
+    The first tap on a quiet message is shown right away; later taps wait for
+    the interval and are shown together, rendered from the latest state.
+    """
+    key = (chat_id, message_id)
+    if key in _pending_edits:
+        _pending_taps[key] = _pending_taps.get(key, 1) + 1
+        return
+    _pending_edits[key] = asyncio.create_task(_edit_later(bot, chat_id, message_id))
+
+
+def stats() -> dict:
+    return {
+        'rendered_lists': rendered_lists.stats(),
+        'skipped_edits': skipped_edits,
+        'callbacks': callbacks_received,
+        'edits': edits_sent,
+        'edits_saved': callbacks_received - edits_sent,
+    }
 
 @restricted_access
 async def add_new_todo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Adds a new TODO item."""
     if not update.message or not context.args:
-        await update.message.reply_text("Usage: /todo [task description]")
+        await outbox.reply(update.message, "Usage: /todo [task description]")
         return
 
-    user_id = db.get_or_create_user(update.message.chat_id)
+    user_id = await async_db.get_or_create_user(update.message.chat_id)
     todo_text = " ".join(context.args)
     escaped_todo = utils.escape_markdown_v1(todo_text)
     
-    db.add_todo(user_id, escaped_todo)
-    await _send_or_edit_todos(update, context)
+    await async_db.add_todo(user_id, escaped_todo)
+    invalidate_todos(user_id)
+    await _send_todos(update)
 
 @restricted_access
 async def show_daily_todos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Displays the TODO list for the current day."""
-    await _send_or_edit_todos(update, context)
+    await _send_todos(update)
 
 @restricted_access
 async def handle_todo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handles button presses on the TODO list."""
+    """Handles button presses on the TODO list.
+
+    Each change is written immediately; the message edit showing it may be merged with other taps.
+    """
+    global callbacks_received
+
     query = update.callback_query
     if not query or not query.data or not query.message:
         return
         
+    callbacks_received += 1
     await query.answer()
 
     action, _, todo_id_str = query.data.partition(':')
     todo_id = int(todo_id_str)
 
     if action == 'done':
-        db.mark_todo_done(todo_id, True)
+        changed = await async_db.mark_todo_done(todo_id, True)
     elif action == 'undone':
-        db.mark_todo_done(todo_id, False)
+        changed = await async_db.mark_todo_done(todo_id, False)
     elif action == 'delete':
-        db.delete_todo(todo_id)
+        changed = await async_db.delete_todo(todo_id)
     else:
         print(f"Unknown TODO action: {action}")
         return
 
-    await _send_or_edit_todos(update, context, message_id=query.message.message_id)
+    # A repeated tap changes nothing, so the cached list and the shown message both stay as they are.
+    if changed:
+        invalidate_todos(await async_db.get_or_create_user(query.message.chat_id))
+    schedule_edit(context.bot, query.message.chat_id, query.message.message_id)
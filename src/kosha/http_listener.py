@@ -0,0 +1,101 @@
+"""A minimal asyncio HTTP/1.1 listener, shared by the webhook and the metrics endpoint.
+
+Reads plain requests with a Content-Length body; TLS, chunked bodies and the
+rest are left to a reverse proxy in front of it.
+"""
+import asyncio
+from http import HTTPStatus
+
+# Seconds the rest of a request may take once its first line has arrived.
+REQUEST_TIMEOUT = 10
+# Clients we serve send a handful of headers; more than this is refused.
+MAX_HEADERS = 100
+
+class RequestError(Exception):
+    """A request answered with `status` before it is handled; the connection is then closed."""
+
+    def __init__(self, status: HTTPStatus):
+        super().__init__(status.phrase)
+        self.status = status
+
+async def read_request(reader: asyncio.StreamReader, idle_timeout: float, max_body_size: int):
+    """Reads one request as (method, target, headers, body), or returns None once the client closes the connection.
+
+    Waits up to `idle_timeout` for the request line and REQUEST_TIMEOUT for
+    each header line and the body, raising asyncio.TimeoutError past either.
+    """
+    request_line = await asyncio.wait_for(reader.readline(), idle_timeout)
+    if not request_line:
+        return None
+    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    count = 0
+    while (line := await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)) not in (b'\r\n', b'\n', b''):
+        count += 1
+        if count > MAX_HEADERS:
+            raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > max_body_size:
+        raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await asyncio.wait_for(reader.readexactly(length), REQUEST_TIMEOUT)
+    return method, target, headers, body
+
+class HTTPListener:
+    """Serves connections, answering each request with handle(); subclasses set the limits below."""
+
+    # Seconds to wait for a request line, including between keep-alive requests.
+    idle_timeout = REQUEST_TIMEOUT
+    max_body_size = 0
+    keep_alive = True
+    content_type = None
+
+    def __init__(self):
+        self._server = None
+
+    async def start(self, listen: str, port: int) -> None:
+        self._server = await asyncio.start_server(self._serve, listen, port)
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def handle(self, method: str, target: str, headers: dict, body: bytes) -> tuple[HTTPStatus, bytes]:
+        raise NotImplementedError
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, self.idle_timeout, self.max_body_size)
+                except RequestError as e:
+                    await self._respond(writer, 'POST', e.status, b'', False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self.handle(method, target, headers, body)
+                keep_alive = self.keep_alive and headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, method, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, method: str, status: HTTPStatus, payload: bytes, keep_alive: bool) -> None:
+        content_type = f"Content-Type: {self.content_type}\r\n" if self.content_type else ""
+        writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n{content_type}Content-Length: {len(payload)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(payload)
+        await writer.drain()
@@ -0,0 +1,103 @@
+import asyncio
+
+from . import async_db
+
+# A burst of pasted or forwarded messages is committed as one transaction
+# instead of one commit per message. Whatever queues up while a commit is in
+# flight goes into the next one, up to MAX_BATCH_SIZE. A FLUSH_DELAY above
+# zero additionally holds each batch open for that long (or until it is full);
+# in benchmarks any fixed delay costs more throughput than it saves.
+MAX_BATCH_SIZE = 200
+FLUSH_DELAY = 0.0
+
+class JournalWriter:
+    """Write-behind queue that group-commits journal inserts."""
+
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE, flush_delay: float = FLUSH_DELAY):
+        self.max_batch_size = max_batch_size
+        self.flush_delay = flush_delay
+        self.batches = 0
+        self.messages = 0
+        self._queue = None
+        self._full = None
+        self._task = None
+        self._closed = False
+
+    def _start(self):
+        self._queue = asyncio.Queue()
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def log(self, user_id, content):
+        """Queues a journal entry and returns once its batch has been committed."""
+        if self._closed:
+            raise RuntimeError("Journal writer is closed.")
+        if self._task is None:
+            self._start()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((user_id, content, future))
+        if self._queue.qsize() >= self.max_batch_size:
+            self._full.set()
+        await future
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is not None and self._queue.qsize() < self.max_batch_size - 1:
+                if self.flush_delay > 0:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.flush_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    # Let handlers already scheduled in this loop turn enqueue too.
+                    await asyncio.sleep(0)
+            batch = self._drain([first])
+            # close() queues a None sentinel behind the last real entry.
+            entries = [entry for entry in batch if entry is not None]
+            if entries:
+                await self._commit(entries)
+            if len(entries) < len(batch):
+                return
+
+    def _drain(self, batch):
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if self._queue.qsize() < self.max_batch_size:
+            self._full.clear()
+        return batch
+
+    async def _commit(self, batch):
+        try:
+            await async_db.log_messages([(user_id, content) for user_id, content, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # Retry one by one so a single bad row doesn't fail its neighbours.
+                print(f"Error committing journal batch of {len(batch)}, retrying individually: {e}")
+                for entry in batch:
+                    await self._commit([entry])
+                return
+            print(f"Error committing journal entry: {e}")
+            _, _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.messages += len(batch)
+        for _, _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def close(self):
+        """Stops accepting entries and commits everything still queued."""
+        self._closed = True
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        self._full.set()
+        await self._task
+        print(f"Journal writer flushed ({self.messages} messages in {self.batches} batches).")
+
+writer = JournalWriter()
@@ -0,0 +1,212 @@
+"""In-process counters and latency histograms, served in the Prometheus text format.
+
+Everything is kept in memory and resets when the bot restarts. A scraper can
+read /metrics on METRICS_LISTEN:METRICS_PORT, and admins get a summary from
+/stats. Recording a sample takes a lock and a bisect, so it is cheap enough
+for every handler call and query.
+"""
+import bisect
+import contextlib
+import threading
+import time
+from http import HTTPStatus
+
+from .http_listener import HTTPListener
+
+# Upper bounds in seconds, from sub-millisecond SQLite reads to slow Gemini replies.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+started_at = time.time()
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    def series(self) -> dict:
+        """A snapshot of {label values: value} for every label combination seen so far."""
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._series.items()}
+
+    def _copy(self, value):
+        return value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.series().items()):
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+class Gauge(_Metric):
+    """A value read from `collect()` at scrape time, returning {label values: value}."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, collect, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def series(self) -> dict:
+        try:
+            return dict(self.collect())
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            return {}
+
+class _HistogramSeries:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets: int):
+        # counts[i] is the number of samples in bucket i alone; the last one is +Inf.
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets))
+            series.counts[index] += 1
+            series.sum += value
+            series.count += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes how long the block took, whether or not it raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _copy(self, series):
+        copy = _HistogramSeries(len(self.buckets))
+        copy.counts, copy.sum, copy.count = list(series.counts), series.sum, series.count
+        return copy
+
+    def quantile(self, q: float, series: _HistogramSeries) -> float | None:
+        """Estimates a quantile by interpolating within its bucket, as Prometheus' histogram_quantile does."""
+        if not series.count:
+            return None
+        rank = q * series.count
+        seen = 0
+        for index, count in enumerate(series.counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def _samples(self, key, series) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), series.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', _format_value(bound))])} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(series.sum)}")
+        lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# --- The bot's metrics ---
+
+handler_seconds = Histogram('kosha_handler_seconds', "Time spent in each Telegram update handler.", ('handler',))
+handler_errors = Counter('kosha_handler_errors_total', "Handler calls that raised, by handler.", ('handler',))
+
+db_query_seconds = Histogram('kosha_db_query_seconds', "Time each db function ran on its database thread.", ('query',))
+db_wait_seconds = Histogram('kosha_db_wait_seconds', "Time db work waited for a free database thread.", ('pool',))
+db_errors = Counter('kosha_db_errors_total', "db functions that raised, by function.", ('query',))
+
+gemini_seconds = Histogram('kosha_gemini_request_seconds', "Gemini request latency, to the last chunk when streamed.", ('model', 'call'))
+gemini_tokens = Counter('kosha_gemini_tokens_total', "Tokens reported by Gemini, by model and kind (prompt, output or thoughts).", ('model', 'kind'))
+gemini_errors = Counter('kosha_gemini_errors_total', "Gemini requests that failed, by model and call.", ('model', 'call'))
+
+job_lag_seconds = Histogram('kosha_job_lag_seconds', "Delay between a scheduled job's due time and its submission, including runs then skipped as misfires.", ('job',))
+job_misfires = Counter('kosha_job_misfires_total', "Scheduled job runs skipped because they were too late.", ('job',))
+job_errors = Counter('kosha_job_errors_total', "Scheduled job runs that raised.", ('job',))
+reminder_lag_seconds = Histogram('kosha_reminder_lag_seconds', "Delay between a reminder's due time and it being handed to the outbox.")
+
+send_seconds = Histogram('kosha_send_seconds', "Time from queueing an outbound Telegram call to its completion.", ('priority',))
+send_errors = Counter('kosha_send_errors_total', "Outbound Telegram calls that failed, by method and error.", ('method', 'error'))
+send_retries = Counter('kosha_send_retry_after_total', "Times Telegram asked us to slow down (RetryAfter).")
+
+def uptime() -> float:
+    return time.time() - started_at
+
+Gauge('kosha_uptime_seconds', "Seconds since the bot started.", lambda: {(): round(uptime(), 3)})
+
+# --- HTTP endpoint ---
+
+class MetricsServer(HTTPListener):
+    """Answers GET /metrics with render(); everything else gets a 404."""
+
+    keep_alive = False
+    content_type = CONTENT_TYPE
+
+    async def handle(self, method: str, target: str, headers: dict, body: bytes) -> tuple[HTTPStatus, bytes]:
+        if target.partition('?')[0] != '/metrics':
+            return HTTPStatus.NOT_FOUND, b''
+        if method not in ('GET', 'HEAD'):
+            return HTTPStatus.METHOD_NOT_ALLOWED, b''
+        return HTTPStatus.OK, render().encode('utf-8')
+
+server = MetricsServer()
@@ -0,0 +1,225 @@
+import datetime
+import sqlite3
+
+import pytz
+
+from .core.config import TIMEZONE
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Each one runs in its own transaction together with the version bump, so a
+# crash mid-migration leaves the database at the previous version. Only ever
+# append to MIGRATIONS; never edit a migration that has already shipped.
+
+def _create_initial_tables(conn: sqlite3.Connection):
+    """Create the original tables."""
+    # IF NOT EXISTS keeps this safe on databases created before versioning.
+    cursor = conn.cursor()
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS users
+                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal user ID)
+            telegram_chat_id INTEGER UNIQUE NOT NULL   -- Telegram's chat ID
+                    
+                   
+            -- We'll add daily_summary_time and other settings here later
+            );''')
+    
+    cursor.execute('''CREATE TABLE IF NOT EXISTS logs
+                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal message ID)
+                user_id INTEGER NOT NULL, -- Foreign key referencing the user table
+                content TEXT NOT NULL, -- The content of the message
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, -- The timestamp of the message
+                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE -- Foreign key constraint
+                );''')
+    
+    cursor.execute('''CREATE TABLE IF NOT EXISTS reminders
+                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal reminder ID)
+                user_id INTEGER NOT NULL, -- Foreign key referencing the user table
+                content TEXT NOT NULL, -- The content of the reminder
+                timestamp TEXT NOT NULL, -- when to send the reminder
+                is_active BOOLEAN DEFAULT TRUE,-- whether the reminder is active
+                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE -- Foreign key constraint
+                );''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS summaries
+                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal summary ID)
+                user_id INTEGER NOT NULL, -- Foreign key referencing the user table
+                content TEXT NOT NULL, -- The content of the summary
+                date DATE NOT NULL, -- The date of the summary
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, -- The timestamp of the summary
+                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE, -- Foreign key constraint
+                UNIQUE(user_id, date) -- Ensure there's only one summary per user and date
+                   
+                );''')
+    # creating todo table. Should have is_active column to track if task is done or not
+    cursor.execute('''CREATE TABLE IF NOT EXISTS todo
+                (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal todo ID)
+                user_id INTEGER NOT NULL, -- Foreign key referencing the user table 
+                content TEXT NOT NULL, -- The content of the todo item
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, -- The timestamp of the last todo update
+                is_done BOOLEAN DEFAULT FALSE,-- whether the todo was completed
+                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE  -- Foreign key constraint
+                );''')
+
+ #   cursor.execute('''CREATE TABLE IF NOT EXISTS sleep
+ #               (id INTEGER PRIMARY KEY, -- Auto-incrementing primary key (internal sleep log ID)
+ #               user_id INTEGER NOT NULL, -- Foreign key referencing the user table
+#                date  DATE NOT NULL, -- The date of the sleep session   
+ #               sleep_start DATETIME NOT NULL, -- The start time of the sleep session
+ #               sleep_end DATETIME DEFAULT NULL, -- The end time of the sleep session
+ #               sleep_duration TEXT DEFAULT NULL, -- The duration of the sleep session
+ #               FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE -- Foreign key constraint
+ #               );''')
+
+def _add_user_timestamp_indexes(conn: sqlite3.Connection):
+    """Index logs and todos by (user_id, timestamp) for day-range lookups."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_user_timestamp ON logs(user_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_todo_user_timestamp ON todo(user_id, timestamp)")
+
+def _add_summary_sent_at(conn: sqlite3.Connection):
+    """Track when each summary was delivered so the nightly sweep can resume."""
+    conn.execute("ALTER TABLE summaries ADD COLUMN sent_at DATETIME")
+    # Summaries written before this column existed were sent right away.
+    conn.execute("UPDATE summaries SET sent_at = timestamp")
+
+def _add_gemini_cache(conn: sqlite3.Connection):
+    """Add the persistent tier of the Gemini response cache."""
+    conn.execute('''CREATE TABLE gemini_cache
+                (key TEXT PRIMARY KEY, -- sha256 of model, config and prompt
+                model TEXT NOT NULL, -- The model that produced the response
+                response TEXT NOT NULL, -- The cached response text
+                size INTEGER NOT NULL, -- Length of the response in bytes, for size-based eviction
+                created_at REAL NOT NULL, -- Unix time the response was stored, for TTL expiry
+                accessed_at REAL NOT NULL -- Unix time of the last hit, for LRU eviction
+                );''')
+    conn.execute("CREATE INDEX idx_gemini_cache_accessed_at ON gemini_cache(accessed_at)")
+
+def _add_reminder_fire_at(conn: sqlite3.Connection):
+    """Store reminder fire times as indexed UTC epoch seconds."""
+    conn.execute("ALTER TABLE reminders ADD COLUMN fire_at INTEGER")
+    # The TEXT timestamps mix UTC offsets; naive ones were written in the configured timezone.
+    tz = pytz.timezone(TIMEZONE)
+    rows = conn.execute("SELECT id, timestamp FROM reminders").fetchall()
+    updates = []
+    for reminder_id, timestamp in rows:
+        parsed = datetime.datetime.fromisoformat(timestamp)
+        if parsed.tzinfo is None:
+            parsed = tz.localize(parsed)
+        updates.append((int(parsed.timestamp()), reminder_id))
+    conn.executemany("UPDATE reminders SET fire_at = ? WHERE id = ?", updates)
+    conn.execute("CREATE INDEX idx_reminders_active_fire_at ON reminders(fire_at) WHERE is_active = TRUE")
+
+def _add_gemini_sessions(conn: sqlite3.Connection):
+    """Persist multi-turn Gemini chat history across restarts."""
+    conn.execute('''CREATE TABLE gemini_sessions
+                (user_id INTEGER PRIMARY KEY, -- One open chat per user
+                history TEXT NOT NULL, -- JSON list of google.genai Content dicts, oldest first
+                turns INTEGER NOT NULL, -- Messages the user has sent in this chat, including trimmed ones
+                updated_at REAL NOT NULL, -- Unix time of the last turn, for idle expiry
+                FOREIGN KEY (user_id) REFERENCES users(id)
+                );''')
+
+def _add_logs_fts(conn: sqlite3.Connection):
+    """Index journal entries for full-text search."""
+    # External-content table: the text lives only in logs, the index only holds terms.
+    # user_id is indexed too so a search intersects with one user's entries inside FTS.
+    conn.execute('''CREATE VIRTUAL TABLE logs_fts USING fts5
+                (content, user_id,
+                content='logs', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+                );''')
+    conn.execute('''CREATE TRIGGER logs_fts_insert AFTER INSERT ON logs BEGIN
+                INSERT INTO logs_fts (rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+                END;''')
+    conn.execute('''CREATE TRIGGER logs_fts_delete AFTER DELETE ON logs BEGIN
+                INSERT INTO logs_fts (logs_fts, rowid, content, user_id) VALUES ('delete', old.id, old.content, old.user_id);
+                END;''')
+    conn.execute('''CREATE TRIGGER logs_fts_update AFTER UPDATE OF content, user_id ON logs BEGIN
+                INSERT INTO logs_fts (logs_fts, rowid, content, user_id) VALUES ('delete', old.id, old.content, old.user_id);
+                INSERT INTO logs_fts (rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+                END;''')
+    # Backfill entries written before the index existed.
+    conn.execute("INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')")
+
+def _add_ask_index(conn: sqlite3.Connection):
+    """Index daily summaries for full-text search and store embeddings for /ask."""
+    conn.execute('''CREATE VIRTUAL TABLE summaries_fts USING fts5
+                (content, user_id,
+                content='summaries', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+                );''')
+    conn.execute('''CREATE TRIGGER summaries_fts_insert AFTER INSERT ON summaries BEGIN
+                INSERT INTO summaries_fts (rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+                END;''')
+    conn.execute('''CREATE TRIGGER summaries_fts_delete AFTER DELETE ON summaries BEGIN
+                INSERT INTO summaries_fts (summaries_fts, rowid, content, user_id) VALUES ('delete', old.id, old.content, old.user_id);
+                END;''')
+    conn.execute('''CREATE TRIGGER summaries_fts_update AFTER UPDATE OF content, user_id ON summaries BEGIN
+                INSERT INTO summaries_fts (summaries_fts, rowid, content, user_id) VALUES ('delete', old.id, old.content, old.user_id);
+                INSERT INTO summaries_fts (rowid, content, user_id) VALUES (new.id, new.content, new.user_id);
+                END;''')
+    conn.execute("INSERT INTO summaries_fts (summaries_fts) VALUES ('rebuild')")
+
+    conn.execute('''CREATE TABLE journal_embeddings
+                (kind TEXT NOT NULL, -- 'log' or 'summary'
+                row_id INTEGER NOT NULL, -- id in logs or summaries
+                user_id INTEGER NOT NULL, -- Owner, so one user's vectors load together
+                vector BLOB NOT NULL, -- float32 embedding
+                PRIMARY KEY (kind, row_id)
+                );''')
+    # Also finds the newest embedded row per user and kind, so new rows are found without a scan.
+    conn.execute("CREATE INDEX idx_journal_embeddings_user ON journal_embeddings(user_id, kind, row_id)")
+
+def _add_user_shard(conn: sqlite3.Connection):
+    """Record which shard holds each user's data."""
+    # In shard 0 every user has a row here (the directory); other shards only
+    # have rows for the users whose data they hold, for their foreign keys.
+    conn.execute("ALTER TABLE users ADD COLUMN shard INTEGER NOT NULL DEFAULT 0")
+    # Set while the rebalance tool moves a user, so an interrupted move can be finished.
+    conn.execute("ALTER TABLE users ADD COLUMN moving_from INTEGER")
+
+def _add_logs_archive(conn: sqlite3.Connection):
+    """Keep old journal entries compressed, one row per user and month."""
+    conn.execute('''CREATE TABLE logs_archive
+                (user_id INTEGER NOT NULL,
+                month TEXT NOT NULL, -- 'YYYY-MM' of the entries' UTC timestamps
+                entries INTEGER NOT NULL, -- Number of entries packed in data
+                chars INTEGER NOT NULL, -- Their total content length, for journal size estimates
+                data BLOB NOT NULL, -- zlib-compressed JSON [[id, timestamp, content], ...] in id order
+                PRIMARY KEY (user_id, month),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                );''')
+
+MIGRATIONS = [
+    _create_initial_tables,
+    _add_user_timestamp_indexes,
+    _add_summary_sent_at,
+    _add_gemini_cache,
+    _add_reminder_fire_at,
+    _add_gemini_sessions,
+    _add_logs_fts,
+    _add_ask_index,
+    _add_user_shard,
+    _add_logs_archive,
+]
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Applies every pending migration and returns the resulting schema version."""
+    version = get_version(conn)
+    if version > len(MIGRATIONS):
+        raise RuntimeError(f"Database schema version {version} is newer than this code ({len(MIGRATIONS)}).")
+
+    for version, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {migration.__doc__}")
+
+    return version
@@ -0,0 +1,226 @@
+import asyncio
+import collections
+import datetime
+import heapq
+import itertools
+import statistics
+import time
+
+from telegram.error import RetryAfter
+
+from . import metrics
+from .ratelimit import TokenBucket
+
+# Lower numbers go first: replies to a user who is waiting beat scheduled bulk sends.
+INTERACTIVE = 0
+BULK = 1
+
+# Telegram allows roughly 30 messages/second overall and about one per second
+# per chat (short bursts are tolerated). Stay a little under both.
+GLOBAL_RATE = 25
+GLOBAL_BURST = 5
+CHAT_RATE = 1
+CHAT_BURST = 3
+MAX_IN_FLIGHT = 8
+MAX_RETRIES = 3
+LATENCY_SAMPLES = 1000
+
+class _Item:
+    __slots__ = ('chat_id', 'priority', 'seq', 'method', 'args', 'kwargs', 'future', 'enqueued_at', 'retries')
+
+    def __init__(self, chat_id, priority, seq, method, args, kwargs, future):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.seq = seq
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.retries = 0
+
+def _seconds(retry_after) -> float:
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class Outbox:
+    """Prioritized, rate-limited queue for every outbound Telegram call.
+
+    Calls for one chat are delivered strictly in order (so chunked replies
+    never arrive shuffled). Across chats, the highest-priority chat whose
+    per-chat bucket has a token goes next, paced by a global bucket.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.sent = 0
+        self.failed = 0
+        self.retry_afters = 0
+        self._buckets = {}
+        self._chats = {}
+        self._ready = []
+        self._seq = itertools.count()
+        self._depth = 0
+        self._latencies = {INTERACTIVE: collections.deque(maxlen=LATENCY_SAMPLES),
+                           BULK: collections.deque(maxlen=LATENCY_SAMPLES)}
+        self._wakeup = None
+        self._in_flight = None
+        self._task = None
+        # Running _deliver tasks; the loop only keeps weak references to tasks.
+        self._deliveries = set()
+
+    def _start(self):
+        self._wakeup = asyncio.Event()
+        self._in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def send(self, chat_id, method, /, *args, priority=BULK, **kwargs):
+        """Queues `method(*args, **kwargs)` (a Bot API coroutine) for `chat_id` and returns its result."""
+        if self._task is None:
+            self._start()
+
+        item = _Item(chat_id, priority, next(self._seq), method, args, kwargs,
+                     asyncio.get_running_loop().create_future())
+        queue = self._chats.setdefault(chat_id, collections.deque())
+        queue.append(item)
+        self._depth += 1
+        if len(queue) == 1:
+            self._make_ready(chat_id)
+        return await item.future
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+        return bucket
+
+    def _make_ready(self, chat_id):
+        head = self._chats[chat_id][0]
+        heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            _, _, chat_id = heapq.heappop(self._ready)
+            bucket = self._bucket(chat_id)
+            delay = bucket.delay()
+            if delay > 0:
+                # Park this chat until its bucket refills; other chats keep flowing.
+                loop.call_later(delay, self._make_ready, chat_id)
+                continue
+
+            bucket.reserve()
+            await self.global_bucket.acquire()
+            await self._in_flight.acquire()
+            task = asyncio.create_task(self._deliver(chat_id))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, chat_id):
+        item = self._chats[chat_id][0]
+        try:
+            result = await item.method(*item.args, **item.kwargs)
+        except RetryAfter as e:
+            self.retry_afters += 1
+            metrics.send_retries.inc()
+            if item.retries < MAX_RETRIES:
+                item.retries += 1
+                wait = _seconds(e.retry_after)
+                print(f"Telegram asked to retry chat {chat_id} after {wait:.0f}s.")
+                self._bucket(chat_id).pause(wait)
+                self._in_flight.release()
+                self._make_ready(chat_id)
+                return
+            self._finish(chat_id, item, error=e)
+        except Exception as e:
+            self._finish(chat_id, item, error=e)
+        else:
+            self._finish(chat_id, item, result=result)
+        self._in_flight.release()
+
+    def _finish(self, chat_id, item, result=None, error=None):
+        queue = self._chats[chat_id]
+        queue.popleft()
+        self._depth -= 1
+        if queue:
+            self._make_ready(chat_id)
+        else:
+            del self._chats[chat_id]
+            if len(self._buckets) > 10000:
+                # A bucket that has refilled completely is identical to a new one.
+                self._buckets = {c: b for c, b in self._buckets.items() if b.delay(CHAT_BURST) > 0}
+
+        elapsed = time.perf_counter() - item.enqueued_at
+        metrics.send_seconds.observe(elapsed, priority='interactive' if item.priority == INTERACTIVE else 'bulk')
+        if error is None:
+            self.sent += 1
+            self._latencies[item.priority].append(elapsed)
+            if not item.future.done():
+                item.future.set_result(result)
+        else:
+            self.failed += 1
+            metrics.send_errors.inc(method=getattr(item.method, '__name__', 'unknown'), error=type(error).__name__)
+            if not item.future.done():
+                item.future.set_exception(error)
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def stats(self) -> dict:
+        latency = {}
+        for priority, name in ((INTERACTIVE, 'interactive'), (BULK, 'bulk')):
+            samples = sorted(self._latencies[priority])
+            if samples:
+                latency[name] = {
+                    'p50': statistics.median(samples),
+                    'p99': samples[int(0.99 * (len(samples) - 1))],
+                    'max': samples[-1],
+                }
+        return {
+            'depth': self._depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retry_after': self.retry_afters,
+            'latency': latency,
+        }
+
+    async def close(self, timeout: float = 10):
+        """Gives queued messages up to `timeout` seconds to go out, then stops the dispatcher.
+
+        Calls still queued or in flight after that fail, so nothing awaiting send() hangs.
+        """
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._depth and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        tasks = [self._task, *self._deliveries]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        unsent = self._depth
+        error = RuntimeError("The outbox was closed before this message was sent.")
+        for items in self._chats.values():
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(error)
+        self._chats.clear()
+        self._ready.clear()
+        self._depth = 0
+        self._task = None
+        print(f"Outbox stopped ({unsent} messages left unsent).")
+
+queue = Outbox()
+
+async def reply(message, text, **kwargs):
+    """Replies to a user's message through the queue at interactive priority."""
+    return await queue.send(message.chat_id, message.reply_text, text, priority=INTERACTIVE, **kwargs)
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, bursting up to `capacity`.
+
+    Callers reserve tokens up front and sleep off any debt, so waiters are
+    served in the order they asked without needing a lock.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Takes `tokens` now and returns how many seconds the caller must wait before using them."""
+        self._refill()
+        self._tokens -= tokens
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def delay(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` would be available, without taking them."""
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Makes the bucket yield nothing for at least `seconds`, e.g. after a server-side RetryAfter."""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+    async def acquire(self, tokens: float = 1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
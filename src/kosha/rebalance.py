@@ -0,0 +1,123 @@
+"""Moves users' data to the shard the router assigns them under the current DB_SHARDS.
+
+Run with the bot stopped, after changing DB_SHARDS:
+
+    python -m src.kosha.rebalance [--dry-run]
+
+Each user is moved in three steps: their rows are copied into the target
+shard, the directory in shard 0 is pointed at it, and the rows are deleted
+from the source shard. Rows get new ids in the target shard's range, in
+their original order. A move interrupted by a crash is finished on the
+next run.
+"""
+import argparse
+import collections
+import time
+
+from . import db
+
+# Tables whose ids come from their shard's range; moved rows are given new ids in the target's range.
+ID_TABLES = ('logs', 'summaries', 'reminders', 'todo')
+# Per-user tables without their own ids, copied as they are.
+USER_TABLES = ('gemini_sessions', 'logs_archive')
+# Which id table each journal_embeddings kind points into.
+EMBEDDED_TABLES = {'log': 'logs', 'summary': 'summaries'}
+PROGRESS_EVERY = 1000
+
+def target_shard(user_id) -> int:
+    return user_id % db.SHARDS
+
+def _columns(conn, table) -> list[str]:
+    return [row['name'] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def _delete_user_rows(conn, user_id):
+    for table in ('journal_embeddings', *USER_TABLES, *ID_TABLES):
+        conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+def _copy_user(user_id, chat_id, source, target) -> int:
+    """Copies the user's rows into `target` in one transaction, replacing anything an interrupted move left there."""
+    src = db.get_connection(source)
+    dst = db.get_connection(target)
+    copied = 0
+    new_ids = {}
+    with dst:
+        _delete_user_rows(dst, user_id)
+        if target != 0:
+            dst.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            dst.execute("INSERT INTO users (id, telegram_chat_id, shard) VALUES (?, ?, ?)", (user_id, chat_id, target))
+
+        for table in (*ID_TABLES, *USER_TABLES):
+            columns = _columns(src, table)
+            rows = src.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE user_id = ? ORDER BY rowid", (user_id,)).fetchall()
+            if table in ID_TABLES:
+                last_id = dst.execute(f"SELECT COALESCE(MAX(id), ?) FROM {table}", (target * db.SHARD_ID_SPAN,)).fetchone()[0]
+                new_ids[table] = {row['id']: last_id + i for i, row in enumerate(rows, start=1)}
+                rows = [{**dict(row), 'id': new_ids[table][row['id']]} for row in rows]
+            dst.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(':' + column for column in columns)})",
+                            [dict(row) for row in rows])
+            copied += len(rows)
+
+        embeddings = src.execute("SELECT kind, row_id, vector FROM journal_embeddings WHERE user_id = ?", (user_id,)).fetchall()
+        moved = [(kind, new_ids[EMBEDDED_TABLES[kind]][row_id], user_id, vector) for kind, row_id, vector in embeddings
+                 if row_id in new_ids[EMBEDDED_TABLES[kind]]]
+        dst.executemany("INSERT INTO journal_embeddings (kind, row_id, user_id, vector) VALUES (?, ?, ?, ?)", moved)
+    return copied + len(moved)
+
+def _finish_move(user_id, source):
+    """Deletes a moved user's rows from the shard they left and clears the directory's in-progress mark."""
+    with db.get_connection(source) as conn:
+        _delete_user_rows(conn, user_id)
+        if source != 0:
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    with db.get_connection() as conn:
+        conn.execute("UPDATE users SET moving_from = NULL WHERE id = ?", (user_id,))
+
+def move_user(user_id, chat_id, source, target) -> int:
+    """Moves one user's data from `source` to `target` and returns the number of rows moved."""
+    copied = _copy_user(user_id, chat_id, source, target)
+    with db.get_connection() as conn:
+        conn.execute("UPDATE users SET shard = ?, moving_from = ? WHERE id = ?", (target, source, user_id))
+    _finish_move(user_id, source)
+    db.user_shards.put(user_id, target)
+    return copied
+
+def rebalance(dry_run: bool = False) -> dict:
+    """Moves every user whose data is not on their assigned shard; returns {(source, target): users moved}."""
+    db.init_db()
+    directory = db.get_connection()
+
+    for user_id, source in directory.execute("SELECT id, moving_from FROM users WHERE moving_from IS NOT NULL").fetchall():
+        print(f"Finishing the interrupted move of user {user_id} out of shard {source}.")
+        if not dry_run:
+            _finish_move(user_id, source)
+
+    pending = [(user['id'], user['telegram_chat_id'], user['shard']) for user in db.get_all_users()
+               if user['shard'] != target_shard(user['id'])]
+    moves = collections.Counter((source, target_shard(user_id)) for user_id, _, source in pending)
+    for (source, target), users in sorted(moves.items()):
+        print(f"{users} users {'to move' if dry_run else 'moving'} from shard {source} to shard {target}.")
+    if dry_run or not pending:
+        return dict(moves)
+
+    started = time.perf_counter()
+    rows = 0
+    for done, (user_id, chat_id, source) in enumerate(pending, start=1):
+        rows += move_user(user_id, chat_id, source, target_shard(user_id))
+        if done % PROGRESS_EVERY == 0:
+            print(f"Moved {done}/{len(pending)} users ({rows} rows).")
+    print(f"Moved {len(pending)} users ({rows} rows) in {time.perf_counter() - started:.1f}s.")
+
+    if db.shard_count > db.SHARDS:
+        unused = ", ".join(db.shard_path(shard) for shard in range(db.SHARDS, db.shard_count))
+        print(f"No users are left in {unused}; the files can be removed.")
+    db.shard_count = db.SHARDS
+    return dict(moves)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move users' data to the shards assigned under DB_SHARDS.")
+    parser.add_argument('--dry-run', action='store_true', help="only report how many users would move")
+    args = parser.parse_args()
+    try:
+        rebalance(args.dry_run)
+    finally:
+        db.close_connections()
@@ -0,0 +1,124 @@
+import asyncio
+import collections
+import datetime
+import heapq
+import time
+
+from . import async_db, metrics, outbox, utils
+
+# Only reminders due within this many seconds are held in memory; the rest
+# stay in SQLite until the window slides forward.
+WINDOW_SECONDS = 3600
+# Reminders this close to now at startup count as missed rather than upcoming.
+MISSED_GRACE_SECONDS = 5
+
+class ReminderDispatcher:
+    """Fires reminders from an in-memory heap that covers only the next time window."""
+
+    def __init__(self, window: float = WINDOW_SECONDS):
+        self.window = window
+        self._heap = []
+        self._scheduled = set()
+        self._window_end = 0
+        self._wakeup = None
+        self._task = None
+        self._bot = None
+
+    async def start(self, bot):
+        """Delivers reminders missed while the bot was down, loads the first window and starts firing."""
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        await self._send_missed(time.time() + MISSED_GRACE_SECONDS)
+        await self._refill()
+        self._task = asyncio.create_task(self._run())
+        print(f"Reminder dispatcher started with {len(self._heap)} reminders in the next {self.window}s.")
+
+    def add(self, reminder_id, chat_id, content, timestamp: datetime.datetime):
+        """Tracks a newly stored reminder. Ones beyond the window are picked up by the next refill."""
+        fire_at = int(timestamp.timestamp())
+        if fire_at < self._window_end and reminder_id not in self._scheduled:
+            self._push(reminder_id, chat_id, content, fire_at)
+            if self._wakeup is not None:
+                self._wakeup.set()
+        print(f"Reminder {reminder_id} scheduled for user {chat_id}")
+
+    def _push(self, reminder_id, chat_id, content, fire_at):
+        heapq.heappush(self._heap, (fire_at, reminder_id, chat_id, content))
+        self._scheduled.add(reminder_id)
+
+    async def _refill(self):
+        # Move the window first so add() already pushes anything stored while we query.
+        self._window_end = int(time.time()) + self.window
+        for reminder in await async_db.get_reminders_due_before(self._window_end):
+            if reminder['id'] not in self._scheduled:
+                self._push(reminder['id'], reminder['chat_id'], reminder['content'], reminder['fire_at'])
+
+    async def _send_missed(self, cutoff):
+        """Sends one digest per chat for every reminder that should already have fired, then deactivates them together."""
+        missed = await async_db.get_reminders_due_before(cutoff)
+        if not missed:
+            return
+
+        by_chat = collections.defaultdict(list)
+        for reminder in missed:
+            by_chat[reminder['chat_id']].append(reminder)
+
+        def scheduled_for(reminder):
+            fire_time = datetime.datetime.fromtimestamp(reminder['fire_at'], datetime.timezone.utc)
+            return utils.normalize_timestamp(fire_time).strftime('%Y-%m-%d %H:%M')
+
+        async def send_digest(chat_id, reminders):
+            if len(reminders) == 1:
+                text = f"⚠️ Missed Reminder: {reminders[0]['content']}\n(Scheduled for {scheduled_for(reminders[0])})"
+            else:
+                text = f"⚠️ {len(reminders)} Missed Reminders:\n" + "\n".join(f"- {scheduled_for(r)}: {r['content']}" for r in reminders)
+            try:
+                await outbox.queue.send(chat_id, self._bot.send_message, chat_id=chat_id, text=text)
+            except Exception as e:
+                print(f"Error sending missed reminder digest to {chat_id}: {e}")
+
+        await asyncio.gather(*(send_digest(chat_id, reminders) for chat_id, reminders in by_chat.items()))
+        await async_db.deactivate_reminders([reminder['id'] for reminder in missed])
+        print(f"Sent {len(missed)} missed reminders as {len(by_chat)} digests.")
+
+    async def _send(self, reminder_id, chat_id, content):
+        try:
+            # Reminders are time-sensitive, so they jump ahead of bulk sends.
+            await outbox.queue.send(chat_id, self._bot.send_message, chat_id=chat_id, text=f"🔔 Reminder: {content}", priority=outbox.INTERACTIVE)
+            print(f"Reminder {reminder_id} sent to {chat_id}")
+        except Exception as e:
+            print(f"Error sending reminder {reminder_id} to {chat_id}: {e}")
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            if now >= self._window_end:
+                await self._refill()
+                continue
+
+            if not self._heap or self._heap[0][0] > now:
+                next_fire = self._heap[0][0] if self._heap else self._window_end
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(next_fire, self._window_end) - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+                metrics.reminder_lag_seconds.observe(now - due[-1][0])
+            try:
+                await asyncio.gather(*(self._send(reminder_id, chat_id, content) for _, reminder_id, chat_id, content in due))
+                await async_db.deactivate_reminders([reminder_id for _, reminder_id, _, _ in due])
+            except Exception as e:
+                print(f"Error firing {len(due)} reminders: {e}")
+            finally:
+                self._scheduled.difference_update(reminder_id for _, reminder_id, _, _ in due)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+dispatcher = ReminderDispatcher()
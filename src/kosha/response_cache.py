@@ -0,0 +1,73 @@
+import hashlib
+import time
+
+from . import async_db
+from .cache import LRUCache
+
+MEMORY_ENTRIES = 256
+TTL_SECONDS = 7 * 24 * 3600
+MAX_DISK_BYTES = 50 * 1024 * 1024
+# Expired and oversized entries are pruned from SQLite every this many writes.
+PRUNE_EVERY = 50
+
+def make_key(model: str, prompt: str, config: str = "") -> str:
+    """Content address for a response: the same model, config and prompt always map to the same key."""
+    digest = hashlib.sha256()
+    for part in (model, config, prompt):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class ResponseCache:
+    """Two-tier Gemini response cache: an in-memory LRU in front of the gemini_cache table."""
+
+    def __init__(self, memory_entries: int = MEMORY_ENTRIES, ttl: float = TTL_SECONDS, max_disk_bytes: int = MAX_DISK_BYTES):
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = LRUCache(memory_entries)
+        # Counted here rather than by the LRU, which would count an expired entry as a hit.
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    async def get(self, key: str):
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None:
+            response, created_at = entry
+            if created_at >= now - self.ttl:
+                self.memory_hits += 1
+                return response
+            self.memory.pop(key)
+
+        row = await async_db.get_cached_response(key, now - self.ttl)
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        self.memory.put(key, (row['response'], row['created_at']))
+        await async_db.touch_cached_response(key, now)
+        return row['response']
+
+    async def put(self, key: str, model: str, response: str):
+        now = time.time()
+        self.memory.put(key, (response, now))
+        await async_db.put_cached_response(key, model, response, now)
+
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            await async_db.prune_response_cache(now - self.ttl, self.max_disk_bytes)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_entries': len(self.memory),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+responses = ResponseCache()
@@ -0,0 +1,164 @@
+import collections
+import datetime
+import importlib.util
+import re
+import statistics
+import time
+
+from . import async_db, utils
+from . import client as gemini_client
+from .core.config import ASK_EMBEDDINGS
+from .summaries import gemini_limiter
+
+TOP_K = 8
+# Each ranker proposes this many entries before their rankings are fused.
+CANDIDATES = 30
+# Reciprocal rank fusion constant; larger values flatten the rank weighting.
+RRF_K = 60
+EMBED_BATCH = 100
+# New entries embedded per /ask at most, so a large backlog catches up over several questions.
+MAX_EMBEDDED_PER_ASK = 500
+LATENCY_SAMPLES = 1000
+
+STOPWORDS = frozenset("""
+    a about above after again all am an and any are as at be because been before being below between both but by
+    can could did do does doing down during each few for from had has have having he her here hers him his how i if
+    in into is it its just me more most my no nor not now of off on once only or other our out over own same she
+    should so some such than that the their them then there these they this those through to too under until up
+    very was we were what when where which while who whom why will with would you your
+""".split())
+
+def bm25_query(question: str) -> str | None:
+    """FTS5 query matching entries that contain any meaningful word of the question, or None if there is none."""
+    terms = [term for term in re.findall(r'\w+', question.lower()) if term not in STOPWORDS]
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+class DenseIndex:
+    """Unit-length embeddings of each user's entries, held as one NumPy matrix per user.
+
+    Loaded from journal_embeddings on first use; entries written since the
+    last question are embedded and appended before each search.
+    """
+
+    def __init__(self):
+        self._users = {}
+
+    async def _refresh(self, user_id):
+        import numpy
+
+        if user_id not in self._users:
+            keys, vectors = [], []
+            for kind, row_id, vector in await async_db.get_embeddings(user_id):
+                keys.append((kind, row_id))
+                vectors.append(numpy.frombuffer(vector, dtype=numpy.float32))
+            self._users[user_id] = (keys, numpy.vstack(vectors) if vectors else None)
+        keys, matrix = self._users[user_id]
+
+        new_rows = await async_db.get_unembedded_entries(user_id, MAX_EMBEDDED_PER_ASK)
+        for start in range(0, len(new_rows), EMBED_BATCH):
+            batch = new_rows[start:start + EMBED_BATCH]
+            await gemini_limiter.acquire()
+            vectors = numpy.asarray(await gemini_client.embed_texts([row[2] for row in batch]), dtype=numpy.float32)
+            vectors /= numpy.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            await async_db.put_embeddings([(kind, row_id, user_id, vector.tobytes())
+                                           for (kind, row_id, _), vector in zip(batch, vectors)])
+            # Stored batches are never returned by get_unembedded_entries again, so each one
+            # goes into the cache as soon as it is stored, keys and rows together.
+            keys = keys + [(kind, row_id) for kind, row_id, _ in batch]
+            matrix = vectors if matrix is None else numpy.vstack((matrix, vectors))
+            self._users[user_id] = (keys, matrix)
+        if new_rows:
+            print(f"Embedded {len(new_rows)} new journal entries for user {user_id}.")
+        return keys, matrix
+
+    def forget(self, user_ids=None):
+        """Drops the cached embeddings of `user_ids` (or of every user), to be reloaded on their next question."""
+        if user_ids is None:
+            self._users.clear()
+        for user_id in user_ids or ():
+            self._users.pop(user_id, None)
+
+    async def search(self, user_id, question: str, k: int) -> list[tuple]:
+        import numpy
+
+        keys, matrix = await self._refresh(user_id)
+        if matrix is None:
+            return []
+        query = numpy.asarray((await gemini_client.embed_texts([question], "RETRIEVAL_QUERY"))[0], dtype=numpy.float32)
+        scores = matrix @ (query / (numpy.linalg.norm(query) + 1e-12))
+        top = numpy.argpartition(-scores, min(k, len(keys) - 1))[:k]
+        return [keys[i] for i in top[numpy.argsort(-scores[top])]]
+
+# Dense retrieval is optional; BM25 works without numpy, which is only imported once an /ask needs it.
+dense = DenseIndex() if ASK_EMBEDDINGS and importlib.util.find_spec('numpy') else None
+
+# Per-question retrieval latency and prompt sizes, for comparing against sending the whole journal.
+latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+tokens_sent = 0
+tokens_full_context = 0
+
+def fuse(rankings: list[list[tuple]], k: int) -> list[tuple]:
+    """Merges ranked key lists with reciprocal rank fusion and returns the top `k` keys."""
+    scores = collections.defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] += 1 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+def format_entry(kind: str, when: str, content: str) -> str:
+    if kind == 'summary':
+        return f"[{when}] (daily summary) {content}"
+    timestamp = datetime.datetime.fromisoformat(when).replace(tzinfo=datetime.timezone.utc)
+    return f"[{utils.normalize_timestamp(timestamp).strftime('%Y-%m-%d %H:%M')}] {content}"
+
+async def retrieve(user_id, question: str, k: int = TOP_K) -> list[str]:
+    """Returns the user's `k` most relevant logs and summaries for `question`, formatted and in date order."""
+    rankings = []
+    query = bm25_query(question)
+    if query is not None:
+        rankings.append([tuple(key) for key in await async_db.rank_journal(user_id, query, CANDIDATES)])
+    if dense is not None:
+        try:
+            rankings.append(await dense.search(user_id, question, CANDIDATES))
+        except Exception as e:
+            print(f"Dense retrieval failed, using BM25 only: {e}")
+
+    keys = fuse(rankings, k)
+    entries = await async_db.get_journal_entries(keys)
+    found = sorted((entries[key][0], key[0], entries[key][1]) for key in keys if key in entries)
+    return [format_entry(kind, when, content) for when, kind, content in found]
+
+async def build_ask_prompt(user_id, question: str) -> str | None:
+    """Builds the /ask prompt from retrieved entries, or returns None if nothing in the journal matches."""
+    global tokens_sent, tokens_full_context
+
+    start = time.perf_counter()
+    entries = await retrieve(user_id, question)
+    elapsed = time.perf_counter() - start
+    latencies.append(elapsed)
+    if not entries:
+        return None
+
+    prompt = gemini_client.get_ask_prompt(question, entries)
+    sent = utils.estimate_tokens(prompt)
+    # The same prompt with every entry, each carrying a "[YYYY-MM-DD HH:MM] " prefix and a newline.
+    journal_entries, journal_chars = await async_db.get_journal_size(user_id)
+    full = sent - utils.estimate_tokens("\n".join(entries)) + (journal_chars + 20 * journal_entries) // utils.CHARS_PER_TOKEN
+    tokens_sent += sent
+    tokens_full_context += full
+    print(f"Ask for user {user_id}: {len(entries)} entries retrieved in {elapsed * 1000:.1f} ms, "
+          f"prompt ~{sent} tokens vs ~{full} with the whole journal ({100 * (1 - sent / max(full, 1)):.0f}% saved).")
+    return prompt
+
+def stats() -> dict:
+    samples = sorted(latencies)
+    return {
+        'questions': len(samples),
+        'dense': dense is not None,
+        'retrieval_p50': statistics.median(samples) if samples else None,
+        'retrieval_p99': samples[int(0.99 * (len(samples) - 1))] if samples else None,
+        'tokens_sent': tokens_sent,
+        'tokens_full_context': tokens_full_context,
+    }
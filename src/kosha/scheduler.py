@@ -1,118 +1,121 @@
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.cron import CronTrigger
+import asyncio
 import datetime
+import time
 
-from . import db, utils
-from . import client as gemini_client
+from . import archive, async_db, metrics, outbox, reminder_dispatcher, summaries, utils
+from .core.config import LOG_ARCHIVE_DAYS
 from .handlers import todo as todo_handlers
 
 scheduler = AsyncIOScheduler(timezone=utils.tz)
 
+def _record_job_event(event):
+    """Feeds job start lag, misfires and errors into the metrics."""
+    if event.code == EVENT_JOB_SUBMITTED:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for run_time in event.scheduled_run_times:
+            metrics.job_lag_seconds.observe(max((now - run_time).total_seconds(), 0.0), job=event.job_id)
+    elif event.code == EVENT_JOB_MISSED:
+        metrics.job_misfires.inc(job=event.job_id)
+    elif event.code == EVENT_JOB_ERROR:
+        metrics.job_errors.inc(job=event.job_id)
+
+scheduler.add_listener(_record_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_ERROR)
+
 async def setup_scheduler_jobs(bot):
     """Sets up and reloads all scheduled jobs on bot startup."""
-    active_reminders = db.get_active_reminders()
-    for reminder in active_reminders:
-        time_stamp = utils.normalize_timestamp(datetime.datetime.fromisoformat(reminder['timestamp']))
-        now_tz_aware = datetime.datetime.now(utils.tz)
-        
-        if time_stamp <= now_tz_aware + datetime.timedelta(seconds=5):
-            print(f"Missed reminder (bot inactive): {reminder['content']}")
-            try:
-                await bot.send_message(
-                    chat_id=reminder['chat_id'],
-                    text=f"⚠️ Missed Reminder: {reminder['content']}\n(Scheduled for {time_stamp.strftime('%Y-%m-%d %H:%M')})",
-                )
-            except Exception as e:
-                print(f"Error sending missed reminder notification: {e}")
-            db.deactivate_reminder(reminder['id'])
-            continue
-        
-        schedule_reminder(bot, reminder['id'], reminder['chat_id'], reminder['content'], time_stamp)
-
-    users = db.get_all_users()
-    for user in users:
-        schedule_daily_summary_job(bot, user['id'], user['telegram_chat_id'], hour=2, minute=0)
-        schedule_hourly_checkin_job(bot, user['id'], user['telegram_chat_id'], start_hour=6, end_hour=23)
+    await reminder_dispatcher.dispatcher.start(bot)
+    schedule_nightly_summary_job(bot, hour=2, minute=0)
+    schedule_hourly_checkin_job(bot, start_hour=6, end_hour=23)
+    if LOG_ARCHIVE_DAYS:
+        schedule_log_archive_job(hour=3, minute=30)
 
     print(f"Scheduler setup complete in timezone: {datetime.datetime.now(utils.tz).strftime('%Z')}")
 
-def schedule_reminder(bot, reminder_id, chat_id, content, timestamp: datetime.datetime):
-    job_id = f'reminder_{reminder_id}'
+def schedule_nightly_summary_job(bot, hour, minute):
+    """Registers the single sweep that summarizes yesterday for every user."""
     scheduler.add_job(
-        send_reminder,
-        DateTrigger(run_date=timestamp),
-        args=[bot, reminder_id, chat_id, content],
-        id=job_id,
-        replace_existing=True
-    )
-    print(f"Reminder {reminder_id} scheduled for user {chat_id}")
-
-async def send_reminder(bot, reminder_id, chat_id, content):
-    try:
-        await bot.send_message(chat_id=chat_id, text=f"🔔 Reminder: {content}")
-        print(f"Reminder {reminder_id} sent to {chat_id}")
-    except Exception as e:
-        print(f"Error sending reminder {reminder_id} to {chat_id}: {e}")
-    finally:
-        db.deactivate_reminder(reminder_id)
-
-def schedule_daily_summary_job(bot, user_id, chat_id, hour, minute):
-    job_id = f'daily_summary_{user_id}'
-    scheduler.add_job(
-        send_summary,
+        summaries.run_nightly_summaries,
         CronTrigger(hour=hour, minute=minute, timezone=utils.tz),
-        args=[bot, user_id, chat_id],
-        id=job_id,
-        replace_existing=True
+        args=[bot],
+        id='nightly_summaries',
+        replace_existing=True,
+        coalesce=True,
+        misfire_grace_time=3600,
     )
 
-async def send_summary(bot, user_id, chat_id):
-    yesterday = datetime.date.today() - datetime.timedelta(days=1)
-    yesterday_str = yesterday.strftime('%Y-%m-%d')
-    logs = db.get_messages_for_day(user_id, yesterday_str)
-
-    if not logs:
-        # No need to send a message if there are no logs
-        print(f"No logs for {yesterday_str} for user {user_id}, skipping summary.")
-        return
+    # If we (re)started after tonight's sweep time, finish whatever that run
+    # left undone. Already-delivered summaries are skipped, so this is cheap.
+    now = datetime.datetime.now(utils.tz)
+    if (now.hour, now.minute) >= (hour, minute):
+        scheduler.add_job(summaries.run_nightly_summaries, args=[bot], id='nightly_summaries_resume', replace_existing=True)
 
-    logs_txt = "\n".join([f"- {utils.normalize_timestamp(datetime.datetime.fromisoformat(ts)).strftime('%H:%M')}: {c}" for ts, c in logs])
-    summary_prompt = gemini_client.get_summary_prompt(logs_txt, yesterday_str)
-    summary = await gemini_client.get_summary(summary_prompt)
-
-    if summary == "No content generated.":
-        print(f"Gemini failed to generate a summary for user {user_id}")
-        return
-
-    db.add_summary(user_id, summary, yesterday)
-    try:
-        await bot.send_message(chat_id=chat_id, text=f"📅 *Summary for {yesterday_str}:*\n\n{summary}", parse_mode='Markdown')
-    except Exception as e:
-        print(f"Error sending summary to {chat_id}: {e}")
-
-def schedule_hourly_checkin_job(bot, user_id, chat_id, start_hour, end_hour):
-    job_id = f'hourly_checkin_{user_id}'
+def schedule_hourly_checkin_job(bot, start_hour, end_hour):
+    """Registers the single hourly sweep that sends every user their check-in."""
     hours = f'{start_hour}-{end_hour}' if end_hour >= start_hour else f'{start_hour}-23,0-{end_hour}'
     scheduler.add_job(
-        send_hourly_checkin,
+        send_hourly_checkins,
         CronTrigger(hour=hours, minute=0, timezone=utils.tz),
-        args=[bot, user_id, chat_id],
-        id=job_id,
-        replace_existing=True
+        args=[bot],
+        id='hourly_checkins',
+        replace_existing=True,
+        coalesce=True,
+    )
+
+def schedule_log_archive_job(hour, minute):
+    """Registers the nightly move of old journal entries into the monthly archives, after the summaries."""
+    scheduler.add_job(
+        archive.run_nightly_archive,
+        CronTrigger(hour=hour, minute=minute, timezone=utils.tz),
+        id='log_archive',
+        replace_existing=True,
+        coalesce=True,
+        misfire_grace_time=3600,
     )
 
-async def send_hourly_checkin(bot, user_id, chat_id):
+async def send_hourly_checkin(bot, chat_id, todo_list_text, todo_list_markup, digest):
     greeting = "Hey there! 👋 Whatcha doing?"
-    todo_list_text, todo_list_markup = todo_handlers._get_formatted_todos_content(user_id)
 
     try:
-        await bot.send_message(chat_id=chat_id, text=greeting)
-        await bot.send_message(
+        await outbox.queue.send(chat_id, bot.send_message, chat_id=chat_id, text=greeting)
+        sent = await outbox.queue.send(
+            chat_id,
+            bot.send_message,
             chat_id=chat_id,
             text=todo_list_text,
             reply_markup=todo_list_markup,
             parse_mode='Markdown'
         )
     except Exception as e:
-        print(f"Error sending hourly check-in to {chat_id}: {e}")
\ No newline at end of file
+        print(f"Error sending hourly check-in to {chat_id}: {e}")
+        return False
+    todo_handlers.remember_shown(chat_id, sent.message_id, digest)
+    return True
+
+async def send_hourly_checkins(bot):
+    """Renders every user's TODOs, reusing cached lists, then queues all the check-ins."""
+    started = time.perf_counter()
+    today = datetime.date.today()
+    users = await async_db.get_all_users()
+    rendered = {user['id']: todo_handlers.cached_todos(user['id'], today) for user in users}
+    cached = sum(message is not None for message in rendered.values())
+
+    # Lists not in the cache are loaded for everyone in one query, as before.
+    if cached < len(users):
+        versions = {user_id: todo_handlers.cache_version(user_id) for user_id in rendered}
+        todos_by_user = await async_db.get_todos_for_all_users(today.strftime('%Y-%m-%d'))
+        for (user_id, _), todos in todos_by_user.items():
+            if rendered.get(user_id) is None and user_id in versions:
+                rendered[user_id] = todo_handlers.cache_todos(user_id, today, todos, versions[user_id])
+    render_done = time.perf_counter()
+
+    # Everything is queued at once; the outbox paces delivery to Telegram's limits.
+    messages = [(user['telegram_chat_id'], *rendered[user['id']]) for user in users if rendered.get(user['id']) is not None]
+    results = await asyncio.gather(*(send_hourly_checkin(bot, *message) for message in messages))
+    finished = time.perf_counter()
+
+    print(f"Hourly check-in sweep: {len(messages)} users ({cached} lists cached), {results.count(False)} failed; "
+          f"load and render {(render_done - started) * 1e3:.1f}ms, "
+          f"send {finished - render_done:.2f}s, total {finished - started:.2f}s")
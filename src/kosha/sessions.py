@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import collections
+import json
+import time
+from typing import TYPE_CHECKING
+
+from . import async_db, client as gemini_client
+from .utils import estimate_tokens
+
+if TYPE_CHECKING:
+    from google.genai import chats, types
+
+# At most this many chats are held in memory; the least recently used is
+# dropped first. Dropped chats are still in SQLite and come back on the next message.
+MAX_SESSIONS = 200
+# Chats idle this long are dropped from memory.
+IDLE_SECONDS = 30 * 60
+# Chats idle this long are forgotten entirely.
+PERSIST_SECONDS = 7 * 24 * 3600
+# Every turn resends the whole history, so older turns are trimmed once it
+# grows past this many estimated tokens.
+TOKEN_BUDGET = 8000
+# Per-turn prompt sizes kept for reporting how a long chat grows.
+PROMPT_SAMPLES = 100
+
+class _Session:
+    __slots__ = ('chat', 'turns', 'last_used', 'history_bytes', 'prompt_tokens')
+
+    def __init__(self, chat: chats.AsyncChat, turns: int = 0):
+        self.chat = chat
+        self.turns = turns
+        self.last_used = time.monotonic()
+        self.history_bytes = 0
+        self.prompt_tokens = collections.deque(maxlen=PROMPT_SAMPLES)
+
+def _tokens(content: types.Content) -> int:
+    return sum(estimate_tokens(part.text) for part in content.parts or () if part.text)
+
+def trim_history(history: list[types.Content], token_budget: int) -> list[types.Content]:
+    """Drops whole turns from the front until the history fits in `token_budget` estimated tokens.
+
+    A turn starts at a user message, so the result still opens with the user
+    as Gemini expects. The latest turn is always kept.
+    """
+    starts = [i for i, content in enumerate(history) if content.role == 'user']
+    total = sum(_tokens(content) for content in history)
+    cut = 0
+    for start in starts[1:]:
+        if total <= token_budget:
+            break
+        total -= sum(_tokens(content) for content in history[cut:start])
+        cut = start
+    return history[cut:]
+
+def serialize_history(history: list[types.Content]) -> str:
+    return json.dumps([content.model_dump(mode='json', exclude_none=True) for content in history])
+
+def deserialize_history(data: str) -> list[types.Content]:
+    from google.genai import types
+
+    return [types.Content.model_validate(content) for content in json.loads(data)]
+
+class SessionStore:
+    """Multi-turn Gemini chats per user: bounded in memory, trimmed to a token budget, persisted to SQLite."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_seconds: float = IDLE_SECONDS, token_budget: int = TOKEN_BUDGET):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.token_budget = token_budget
+        self.evicted = 0
+        self.restored = 0
+        self.trimmed = 0
+        self._sessions = collections.OrderedDict()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[user_id]
+            self.evicted += 1
+
+    def _put(self, user_id, session: _Session):
+        self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+        self._expire()
+
+    async def _load(self, user_id):
+        row = await async_db.get_gemini_session(user_id, time.time() - PERSIST_SECONDS)
+        if row is None:
+            return None
+        session = _Session(gemini_client.start_new_gemini_chat(deserialize_history(row['history'])), row['turns'])
+        session.history_bytes = len(row['history'])
+        self.restored += 1
+        return session
+
+    async def open(self, user_id, resume: bool = True) -> tuple[chats.AsyncChat, int]:
+        """Returns the user's chat, restored from SQLite if `resume` and one is stored, and how many turns it already has."""
+        await async_db.prune_gemini_sessions(time.time() - PERSIST_SECONDS)
+        session = await self._load(user_id) if resume else None
+        if session is None:
+            await async_db.delete_gemini_session(user_id)
+            session = _Session(gemini_client.start_new_gemini_chat())
+        self._put(user_id, session)
+        return session.chat, session.turns
+
+    async def get(self, user_id):
+        """Returns the user's open chat, or None if there is none in memory or SQLite."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = await self._load(user_id)
+            if session is None:
+                return None
+        session.last_used = time.monotonic()
+        self._put(user_id, session)
+        return session.chat
+
+    async def save(self, user_id):
+        """Records the turn just sent on the user's chat: trims old turns past the budget and persists the history."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            return
+
+        history = session.chat.get_history(curated=True)
+        # The prompt for this turn was everything before the model's reply.
+        prompt_tokens = sum(_tokens(content) for content in history)
+        if history and history[-1].role == 'model':
+            prompt_tokens -= _tokens(history[-1])
+        trimmed = trim_history(history, self.token_budget)
+        if len(trimmed) < len(history):
+            self.trimmed += len(history) - len(trimmed)
+            session.chat = gemini_client.start_new_gemini_chat(trimmed)
+
+        data = serialize_history(trimmed)
+        session.turns += 1
+        session.history_bytes = len(data)
+        session.prompt_tokens.append(prompt_tokens)
+        await async_db.save_gemini_session(user_id, data, session.turns, time.time())
+
+        dropped = f", trimmed {len(history) - len(trimmed)} messages" if len(trimmed) < len(history) else ""
+        print(f"Gemini chat for user {user_id}: turn {session.turns}, prompt ~{prompt_tokens} tokens, "
+              f"history {session.history_bytes} bytes{dropped}.")
+
+    async def end(self, user_id):
+        session = self._sessions.pop(user_id, None)
+        await async_db.delete_gemini_session(user_id)
+        if session is not None and session.prompt_tokens:
+            samples = session.prompt_tokens
+            print(f"Gemini chat for user {user_id} ended after {session.turns} turns: "
+                  f"prompt ~{samples[0]} tokens at first, ~{max(samples)} at peak, ~{samples[-1]} at the end.")
+
+    def stats(self) -> dict:
+        sizes = [session.history_bytes for session in self._sessions.values()]
+        return {
+            'sessions': len(sizes),
+            'max_sessions': self.max_sessions,
+            'history_bytes': sum(sizes),
+            'bytes_per_session': sum(sizes) / len(sizes) if sizes else 0,
+            'largest_session_bytes': max(sizes, default=0),
+            'evicted': self.evicted,
+            'restored': self.restored,
+            'trimmed_messages': self.trimmed,
+        }
+
+store = SessionStore()
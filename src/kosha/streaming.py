@@ -0,0 +1,111 @@
+import asyncio
+import collections
+import contextlib
+import statistics
+import time
+from typing import AsyncIterator
+
+from . import outbox, utils
+
+# Telegram allows about one edit per second per chat before it starts answering RetryAfter.
+EDIT_INTERVAL = 1.0
+MAX_MESSAGE_LENGTH = 4000
+TTFT_SAMPLES = 1000
+
+# Seconds from sending a request to the first piece of reply text, across all streamed replies.
+ttft_samples = collections.deque(maxlen=TTFT_SAMPLES)
+
+def render(text: str) -> list[str]:
+    """Renders reply Markdown into Telegram HTML messages with balanced tags."""
+    return list(utils.render_telegram_html(text, MAX_MESSAGE_LENGTH))
+
+class ReplyStream:
+    """Shows a reply to `message` while it is being generated.
+
+    The first text is posted right away; after that the message is edited at
+    most every EDIT_INTERVAL seconds. Text that no longer fits continues in a
+    new message, and earlier messages are edited only if their rendering changed.
+    """
+
+    def __init__(self, message):
+        self.message = message
+        self.text = ""
+        self.ttft = None
+        self.edits = 0
+        self._started = time.perf_counter()
+        self._sent = []
+        self._last_flush = 0.0
+        self._flush_task = None
+        # Whether _flush_task is still waiting out EDIT_INTERVAL rather than sending.
+        self._flush_pending = False
+
+    def feed(self, delta: str):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self._started
+            ttft_samples.append(self.ttft)
+        self.text += delta
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_pending = True
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        wait = self._last_flush + EDIT_INTERVAL - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._flush_pending = False
+        await self._flush()
+
+    async def _flush(self):
+        self._last_flush = time.monotonic()
+        for i, chunk in enumerate(render(self.text)):
+            try:
+                if i == len(self._sent):
+                    sent = await outbox.reply(self.message, chunk, parse_mode='html')
+                    self._sent.append([sent, chunk])
+                elif self._sent[i][1] != chunk:
+                    sent = self._sent[i][0]
+                    await outbox.queue.send(sent.chat_id, sent.edit_text, chunk, parse_mode='html', priority=outbox.INTERACTIVE)
+                    self._sent[i][1] = chunk
+                    self.edits += 1
+            except Exception as e:
+                print(f"Error streaming reply to {self.message.chat_id}: {e}")
+                return
+
+    async def finish(self):
+        """Brings every message up to date with the full text right away.
+
+        An edit still waiting out EDIT_INTERVAL is dropped rather than waited
+        for; the outbox's per-chat pacing spaces the final edit instead.
+        """
+        if self._flush_task is not None:
+            if self._flush_pending:
+                self._flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+        await self._flush()
+        elapsed = time.perf_counter() - self._started
+        if self.ttft is not None:
+            print(f"Streamed reply to {self.message.chat_id}: first text after {self.ttft:.2f}s, "
+                  f"{len(self.text)} chars in {elapsed:.2f}s over {len(self._sent)} messages and {self.edits} edits.")
+
+async def stream_reply(message, deltas: AsyncIterator[str]) -> bool:
+    """Streams generated text into replies to `message`. Returns False if no text was generated."""
+    stream = ReplyStream(message)
+    try:
+        async for delta in deltas:
+            stream.feed(delta)
+    except Exception as e:
+        print(f"Gemini API (Streaming): An error occurred: {e}")
+    await stream.finish()
+    return bool(stream.text.strip())
+
+def stats() -> dict:
+    samples = sorted(ttft_samples)
+    if not samples:
+        return {'replies': 0}
+    return {
+        'replies': len(samples),
+        'ttft_p50': statistics.median(samples),
+        'ttft_p99': samples[int(0.99 * (len(samples) - 1))],
+        'ttft_max': samples[-1],
+    }
@@ -0,0 +1,171 @@
+import asyncio
+import datetime
+import random
+import statistics
+import time
+
+from . import async_db, outbox, utils
+from . import client as gemini_client
+from .core.config import SUMMARY_CONCURRENCY, GEMINI_REQUESTS_PER_MINUTE
+from .ratelimit import TokenBucket
+
+# Days whose journal fits in one window take the single-call path; longer
+# days are split into windows, summarized concurrently, then combined.
+WINDOW_TOKEN_BUDGET = 30000
+WINDOW_CONCURRENCY = 3
+
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 2.0  # seconds, doubled on every retry
+
+# Shared by every summary request so a sweep never bursts past the quota.
+gemini_limiter = TokenBucket(rate=GEMINI_REQUESTS_PER_MINUTE / 60, capacity=1)
+
+async def _generate_with_retry(prompt: str) -> str:
+    """Calls Gemini under the rate limit, retrying failures with exponential backoff and jitter."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await gemini_limiter.acquire()
+        try:
+            return await gemini_client.generate_summary(prompt)
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            delay = BACKOFF_BASE * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            print(f"Gemini summary attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+def split_into_windows(entries: list[str], token_budget: int) -> list[list[str]]:
+    """Groups consecutive entries into windows of at most `token_budget` estimated tokens.
+
+    An entry that is larger than the budget on its own is cut into pieces.
+    """
+    max_chars = token_budget * utils.CHARS_PER_TOKEN
+    windows = []
+    current = []
+    current_tokens = 0
+    for entry in entries:
+        pieces = [entry[i:i + max_chars] for i in range(0, len(entry), max_chars)] or [entry]
+        for piece in pieces:
+            tokens = utils.estimate_tokens(piece)
+            if current and current_tokens + tokens > token_budget:
+                windows.append(current)
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        windows.append(current)
+    return windows
+
+async def _summarize_windows(windows: list[list[str]], date_str: str) -> list[str]:
+    """Map step: summarizes each window concurrently. Partials are cached by prompt like any other summary."""
+    semaphore = asyncio.Semaphore(WINDOW_CONCURRENCY)
+
+    async def summarize(index, window):
+        async with semaphore:
+            prompt = gemini_client.get_partial_summary_prompt("\n".join(window), date_str, index, len(windows))
+            return await _generate_with_retry(prompt)
+
+    partials = await asyncio.gather(*(summarize(i, window) for i, window in enumerate(windows, start=1)))
+    return [partial for partial in partials if partial != "No content generated."]
+
+async def summarize_entries(entries: list[str], date_str: str) -> str:
+    """Summarizes a day's formatted log lines, chunking them when they exceed the token budget."""
+    windows = split_into_windows(entries, WINDOW_TOKEN_BUDGET)
+    if len(windows) <= 1:
+        return await _generate_with_retry(gemini_client.get_summary_prompt("\n".join(entries), date_str))
+
+    print(f"Journal for {date_str} spans {len(windows)} windows, using map-reduce summarization.")
+    partials = await _summarize_windows(windows, date_str)
+    # Reduce step; if the partials themselves are too long, fold them again first.
+    while len(partials) > 1 and utils.estimate_tokens("\n".join(partials)) > WINDOW_TOKEN_BUDGET:
+        windows = split_into_windows(partials, WINDOW_TOKEN_BUDGET)
+        if len(windows) == len(partials):
+            break  # nothing left to group; let the combine prompt take them as they are
+        partials = await _summarize_windows(windows, date_str)
+    if not partials:
+        return "No content generated."
+    return await _generate_with_retry(gemini_client.get_combine_summary_prompt(partials, date_str))
+
+async def _send_summary(bot, user_id, chat_id, summary, date) -> bool:
+    date_str = date.strftime('%Y-%m-%d')
+    try:
+        await outbox.queue.send(chat_id, bot.send_message, chat_id=chat_id, text=f"📅 *Summary for {date_str}:*\n\n{summary}", parse_mode='Markdown')
+    except Exception as e:
+        print(f"Error sending summary to {chat_id}: {e}")
+        return False
+    await async_db.mark_summary_sent(user_id, date)
+    return True
+
+async def summarize_user(bot, user_id, chat_id, date, checkpoint=False) -> str:
+    """Generates, stores and sends one user's summary for `date`. Returns what happened.
+
+    `checkpoint` is True when a summary for the date was stored on an earlier
+    run but never delivered; it is sent as is instead of being regenerated.
+    """
+    if checkpoint:
+        stored = await async_db.get_summary_for_user(user_id, date)
+        sent = await _send_summary(bot, user_id, chat_id, stored['content'], date)
+        return 'resumed' if sent else 'unsent'
+
+    date_str = date.strftime('%Y-%m-%d')
+    logs = await async_db.get_messages_for_day(user_id, date_str)
+    if not logs:
+        # No need to send a message if there are no logs
+        print(f"No logs for {date_str} for user {user_id}, skipping summary.")
+        return 'no_logs'
+
+    entries = [f"- {utils.normalize_timestamp(datetime.datetime.fromisoformat(ts)).strftime('%H:%M')}: {c}" for ts, c in logs]
+    summary = await summarize_entries(entries, date_str)
+
+    if summary == "No content generated.":
+        print(f"Gemini failed to generate a summary for user {user_id}")
+        return 'empty'
+
+    # Stored before sending: if we crash in between, the next run only has to send it.
+    await async_db.add_summary(user_id, summary, date)
+    sent = await _send_summary(bot, user_id, chat_id, summary, date)
+    return 'sent' if sent else 'unsent'
+
+async def run_nightly_summaries(bot, date=None):
+    """Summarizes `date` (default: yesterday) for every user with bounded concurrency.
+
+    Users whose summary was already delivered are skipped, so re-running the
+    sweep after a restart only picks up the remaining work.
+    """
+    if date is None:
+        date = datetime.datetime.now(utils.tz).date() - datetime.timedelta(days=1)
+
+    started = time.perf_counter()
+    users = await async_db.get_all_users()
+    checkpoints = await async_db.get_summary_checkpoints(date)
+    pending = [user for user in users if user['id'] not in checkpoints or checkpoints[user['id']] is None]
+
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    latencies = []
+    outcomes = {}
+
+    async def worker(user):
+        async with semaphore:
+            user_started = time.perf_counter()
+            try:
+                outcome = await summarize_user(bot, user['id'], user['telegram_chat_id'], date,
+                                               checkpoint=user['id'] in checkpoints)
+            except Exception as e:
+                print(f"Summary for user {user['id']} failed: {e}")
+                outcome = 'failed'
+            elapsed = time.perf_counter() - user_started
+            latencies.append(elapsed)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            print(f"Summary for user {user['id']}: {outcome} in {elapsed:.2f}s")
+
+    await asyncio.gather(*(worker(user) for user in pending))
+
+    total = time.perf_counter() - started
+    skipped = len(users) - len(pending)
+    latency_report = ""
+    if latencies:
+        latencies.sort()
+        latency_report = (f", per-user latency p50 {statistics.median(latencies):.2f}s"
+                          f" p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f}s max {latencies[-1]:.2f}s")
+    print(f"Nightly summaries for {date.isoformat()} finished in {total:.1f}s: "
+          f"{len(pending)} processed {outcomes}, {skipped} already sent{latency_report}")
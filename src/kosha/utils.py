@@ -1,40 +1,151 @@
-from dateparser.search import search_dates
 import pytz
+import collections
 import datetime
 import re
 import html
+from typing import Iterator
 
 from .core.config import TIMEZONE
 
 tz = pytz.timezone(TIMEZONE)
 
-def reminder_input(input_text):
-    """Parses a string to find a date and a reminder message."""
-    now = datetime.datetime.now(tz)
-    results = search_dates(input_text, settings={
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for budgeting
+
+_WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+_DAY_OFFSETS = {'yesterday': -1, 'today': 0, 'tomorrow': 1}
+
+# One date or time expression in the forms /remind and /summary usually get.
+_DATE_ATOM = re.compile(rf"""\b(?:
+    in\s+(?P<count>\d{{1,4}}|an?)\s+(?P<unit>second|minute|hour|day|week)s?
+  | (?P<day>today|tomorrow|yesterday)
+  | (?:(?:on|next)\s+)?(?P<weekday>{'|'.join(_WEEKDAYS)})
+  | (?P<year>\d{{4}})-(?P<month>\d{{2}})-(?P<date>\d{{2}})
+  | (?:at\s+)?(?P<hour12>1[0-2]|0?[1-9])(?::(?P<minute12>[0-5]\d))?\s*(?P<meridiem>[ap]m)
+  | (?:at\s+)?(?P<hour24>[01]?\d|2[0-3]):(?P<minute24>[0-5]\d)
+  | at\s+(?P<named>noon|midnight)
+)\b""", re.IGNORECASE | re.VERBOSE)
+
+# Anything dateparser might read as (part of) a date; if it is left over, the fast path defers to dateparser.
+_DATE_HINTS = re.compile(r"""\d|\b(?:
+    next|last|this|ago|before|after|noon|midnight|morning|afternoon|evening|night|tonight
+  | (?:sec|second|min|minute|hr|hour|day|week|fortnight|month|year)s?
+  | today|tomorrow|yesterday|mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun
+  | jan|january|feb|february|mar|march|apr|april|may|jun|june|jul|july|aug|august|sep|sept|september
+  | oct|october|nov|november|dec|december
+)\b""", re.IGNORECASE | re.VERBOSE)
+
+def _atom_time(atom) -> datetime.time | None:
+    if atom['hour12']:
+        hour = int(atom['hour12']) % 12 + (12 if atom['meridiem'].lower() == 'pm' else 0)
+        return datetime.time(hour, int(atom['minute12'] or 0))
+    if atom['hour24']:
+        return datetime.time(int(atom['hour24']), int(atom['minute24']))
+    if atom['named']:
+        return datetime.time(12 if atom['named'].lower() == 'noon' else 0)
+    return None
+
+def _atom_date(atom, now: datetime.datetime, prefer: str) -> datetime.date | None:
+    if atom['day']:
+        return now.date() + datetime.timedelta(days=_DAY_OFFSETS[atom['day'].lower()])
+    if atom['weekday']:
+        # Like dateparser, a bare weekday never means today: it is the next one, or the last one for past dates.
+        weekday = _WEEKDAYS.index(atom['weekday'].lower())
+        if prefer == 'future':
+            return now.date() + datetime.timedelta(days=(weekday - now.weekday()) % 7 or 7)
+        return now.date() - datetime.timedelta(days=(now.weekday() - weekday) % 7 or 7)
+    if atom['year']:
+        return datetime.date(int(atom['year']), int(atom['month']), int(atom['date']))
+    return None
+
+def _at(day: datetime.date, time_of_day: datetime.time) -> datetime.datetime:
+    return tz.localize(datetime.datetime.combine(day, time_of_day))
+
+def quick_parse_date(input_text: str, now: datetime.datetime, prefer: str) -> tuple[str, datetime.datetime] | None:
+    """Parses the common date forms without dateparser, as (matched text, aware datetime).
+
+    Handles "in 2 hours", "tomorrow 9am", "at 18:30", "yesterday", ISO dates
+    and weekday names, alone or a day followed by a time. Returns None for
+    anything else, or if the rest of the text still looks date-like, so the
+    caller can fall back to dateparser.
+    """
+    atoms = list(_DATE_ATOM.finditer(input_text))
+    if not atoms or len(atoms) > 2:
+        return None
+    first, last = atoms[0], atoms[-1]
+    if len(atoms) == 2 and input_text[first.end():last.start()].strip():
+        return None
+    rest = input_text[:first.start()] + " " + input_text[last.end():]
+    if _DATE_HINTS.search(rest):
+        return None
+
+    try:
+        if first['unit']:
+            if len(atoms) > 1:
+                return None
+            count = 1 if first['count'].lower() in ('a', 'an') else int(first['count'])
+            parsed = tz.normalize(now + datetime.timedelta(**{f"{first['unit'].lower()}s": count}))
+        elif len(atoms) == 1:
+            day, time_of_day = _atom_date(first, now, prefer), _atom_time(first)
+            if day is None:
+                parsed = _at(now.date(), time_of_day)
+                if prefer == 'future' and parsed <= now:
+                    parsed = _at(now.date() + datetime.timedelta(days=1), time_of_day)
+                elif prefer == 'past' and parsed > now:
+                    parsed = _at(now.date() - datetime.timedelta(days=1), time_of_day)
+            elif first['day']:
+                parsed = tz.localize(datetime.datetime.combine(day, now.time()))
+            else:
+                parsed = _at(day, datetime.time())
+        else:
+            day, time_of_day = _atom_date(first, now, prefer), _atom_time(last)
+            if day is None or time_of_day is None:
+                day, time_of_day = _atom_date(last, now, prefer), _atom_time(first)
+            if day is None or time_of_day is None:
+                return None
+            parsed = _at(day, time_of_day)
+    except ValueError:  # e.g. 2025-02-30
+        return None
+    return input_text[first.start():last.end()], parsed
+
+def search_date(input_text: str, prefer: str, now: datetime.datetime | None = None) -> tuple[str, datetime.datetime] | None:
+    """Finds the first date in `input_text` as (matched text, aware datetime), preferring 'future' or 'past' dates."""
+    now = now or datetime.datetime.now(tz)
+    found = quick_parse_date(input_text, now, prefer)
+    if found is not None:
+        return found
+
+    from dateparser.search import search_dates
+
+    settings = {
         'TIMEZONE': TIMEZONE,
         'RETURN_AS_TIMEZONE_AWARE': True,
-        'PREFER_DATES_FROM': 'future',
+        'PREFER_DATES_FROM': prefer,
         'RELATIVE_BASE': now
-    })
+    }
+    # Language detection costs far more than parsing, so English is tried on its own first.
+    results = search_dates(input_text, languages=['en'], settings=settings) or search_dates(input_text, settings=settings)
+    return results[0] if results else None
 
-    if not results:
+def warm_up_date_parser():
+    """Imports dateparser and loads its language data up front; the first search otherwise takes seconds."""
+    from dateparser.search import search_dates
+
+    search_dates("in 2 hours", settings={'TIMEZONE': TIMEZONE, 'RETURN_AS_TIMEZONE_AWARE': True})
+
+def reminder_input(input_text, now=None):
+    """Parses a string to find a date and a reminder message."""
+    found = search_date(input_text, 'future', now)
+    if not found:
         return None, ""
 
-    time_str, parsed_datetime = results[0]
+    time_str, parsed_datetime = found
     reminder_message = input_text.replace(time_str, "").strip()
     return parsed_datetime, reminder_message
 
-def parse_datetime(input_text):
+def parse_datetime(input_text, now=None):
     """Parses a string to find a single date."""
-    now = datetime.datetime.now(tz)
-    results = search_dates(input_text, settings={
-        'TIMEZONE': TIMEZONE,
-        'RETURN_AS_TIMEZONE_AWARE': True,
-        'PREFER_DATES_FROM': 'past',
-        'RELATIVE_BASE': now
-    })
-    return results[0][1] if results else None
+    found = search_date(input_text, 'past', now)
+    return found[1] if found else None
 
 def normalize_timestamp(timestamp: datetime.datetime) -> datetime.datetime:
     """Converts a timestamp to the application's configured timezone."""
@@ -43,6 +154,9 @@ def normalize_timestamp(timestamp: datetime.datetime) -> datetime.datetime:
     else:
         return timestamp.astimezone(tz)
 
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
 def escape_markdown_v1(text: str) -> str:
     """Escapes characters for Telegram's Markdown v1."""
     for char in ['_', '*', '`', '[']:
@@ -137,4 +251,242 @@ def markdown_to_safe_html(text: str) -> str:
     text = re.sub(r'`([^`\n]+)`', r'<code>\1</code>', text)
     # Code blocks
     text = re.sub(r'```(.*?)```', lambda m: f'<pre>{html.escape(m.group(1))}</pre>', text, flags=re.DOTALL)
-    return text
\ No newline at end of file
+    return text
+
+_INLINE_TOKEN = re.compile(r'`[^`\n]+`|\*\*|\*|[^*`]+|`')
+_TEXT, _OPEN, _CLOSE = 0, 1, 2
+_EMPHASIS = {'**': 'b', '*': 'i'}
+
+def _inline_atoms(segment: str):
+    """Atoms for Markdown outside code blocks. As in markdown_to_safe_html, emphasis never spans lines."""
+    for number, line in enumerate(segment.split('\n')):
+        if number:
+            yield _TEXT, '\n'
+        if '*' not in line and '`' not in line:
+            yield _TEXT, line
+            continue
+        tokens = _INLINE_TOKEN.findall(line)
+        remaining = {marker: tokens.count(marker) for marker in _EMPHASIS}
+        stack = []
+        for token in tokens:
+            tag = _EMPHASIS.get(token)
+            if tag is not None:
+                remaining[token] -= 1
+                if stack and stack[-1] == tag:
+                    stack.pop()
+                    yield _CLOSE, tag
+                elif tag not in stack and remaining[token]:
+                    # Only open when a closing marker follows on this line; a lone '*' stays literal.
+                    stack.append(tag)
+                    yield _OPEN, tag
+                else:
+                    yield _TEXT, token
+            elif len(token) > 2 and token[0] == '`':
+                yield _OPEN, 'code'
+                yield _TEXT, token[1:-1]
+                yield _CLOSE, 'code'
+            else:
+                yield _TEXT, token
+        for tag in reversed(stack):
+            yield _CLOSE, tag
+
+def _block_atoms(text: str):
+    pos = 0
+    while pos < len(text):
+        fence = text.find('```', pos)
+        end = text.find('```', fence + 3) if fence != -1 else -1
+        if end == -1:
+            yield from _inline_atoms(text[pos:])
+            return
+        yield from _inline_atoms(text[pos:fence])
+        yield _OPEN, 'pre'
+        yield _TEXT, text[fence + 3:end]
+        yield _CLOSE, 'pre'
+        pos = end + 3
+
+def _markdown_atoms(text: str):
+    """Splits Markdown into (kind, value) atoms: raw text runs and properly nested open/close tags."""
+    pending = []
+    for kind, value in _block_atoms(text):
+        # Merge neighbouring text so the chunker handles few, long runs.
+        if kind == _TEXT:
+            pending.append(value)
+            continue
+        if pending:
+            yield _TEXT, ''.join(pending)
+            pending.clear()
+        yield kind, value
+    if pending:
+        yield _TEXT, ''.join(pending)
+
+def _fitting_prefix(run: str, room: int) -> str:
+    """Longest prefix of `run` whose escaped form fits in `room` characters, never splitting an entity."""
+    size = max(0, min(room, len(run)))
+    used = len(html.escape(run[:size]))
+    if used > room:
+        # Each raw character escapes to at least one, so dropping the overflow always fits...
+        size = max(0, size - (used - room))
+        used = len(html.escape(run[:size]))
+    # ...and may drop too much where entities were cut, so grow back one character at a time.
+    while size < len(run):
+        width = len(html.escape(run[size]))
+        if used + width > room:
+            break
+        used += width
+        size += 1
+    return run[:size]
+
+def _pieces(run: str, size: int):
+    """Splits a text run into pieces of about `size` characters, never between the newlines of a paragraph break."""
+    start = 0
+    while start < len(run):
+        end = start + size
+        while end < len(run) and run[end - 1] == '\n' and run[end] == '\n':
+            end += 1
+        yield run[start:end]
+        start = end
+
+class _Chunker:
+    """Packs atoms into HTML chunks of at most `max_length` characters, closing and reopening tags at each cut."""
+
+    def __init__(self, max_length: int):
+        self.max_length = max_length
+        self._start(())
+
+    def _start(self, stack):
+        self.opened = tuple(stack)
+        self.stack = list(stack)
+        self.prefix = ''.join(f'<{tag}>' for tag in stack)
+        self.atoms = []
+        self.length = len(self.prefix)
+        # Room kept free for the closing tags of everything still open.
+        self.reserve = sum(len(tag) + 3 for tag in stack)
+        self.has_text = False
+
+    def _render(self, atoms, stack):
+        if not any(kind == _TEXT and not value.isspace() for kind, value, _ in atoms):
+            return None
+        body = (self.prefix + ''.join(rendered for _, _, rendered in atoms)).rstrip()
+        return body + ''.join(f'</{tag}>' for tag in reversed(stack))
+
+    def _find_break(self):
+        """Latest paragraph, else line, else word break in the second half of the chunk, as (atom index, offset, separator)."""
+        half = self.max_length // 2
+        starts = []
+        position = len(self.prefix)
+        for _, _, rendered in self.atoms:
+            starts.append(position)
+            position += len(rendered)
+
+        for separator in ('\n\n', '\n', ' '):
+            for index in range(len(self.atoms) - 1, -1, -1):
+                kind, value, rendered = self.atoms[index]
+                if starts[index] + len(rendered) < half:
+                    break
+                if kind != _TEXT:
+                    continue
+                offset = value.rfind(separator)
+                if offset == -1:
+                    continue
+                before = offset if len(rendered) == len(value) else len(html.escape(value[:offset]))
+                if starts[index] + before >= half:
+                    return index, offset, len(separator)
+                break
+        return None
+
+    def _cut(self):
+        """Ends the chunk at its best break point. Returns the chunk (None if it has no text) and the atoms carried into the next."""
+        head, stack, tail = self.atoms, self.stack, []
+        found = self._find_break()
+        if found is not None:
+            index, offset, separator = found
+            run = self.atoms[index][1]
+            head = self.atoms[:index] + [(_TEXT, run[:offset], html.escape(run[:offset]))]
+            tail = [(_TEXT, run[offset + separator:])] + [(kind, value) for kind, value, _ in self.atoms[index + 1:]]
+            stack = list(self.opened)
+            for kind, value, _ in self.atoms[:index]:
+                if kind == _OPEN:
+                    stack.append(value)
+                elif kind == _CLOSE:
+                    stack.pop()
+
+        chunk = self._render(head, stack)
+        self._start(stack)
+        return chunk, tail
+
+    def _place(self, kind, value):
+        """Appends an atom to the chunk. Returns None, or the atoms that must follow a cut when it does not all fit."""
+        if kind == _TEXT:
+            if not self.has_text and 'pre' not in self.stack:
+                # Whitespace at the start of a message is dropped, except inside code blocks.
+                value = value.lstrip()
+                if not value:
+                    return None
+            room = self.max_length - self.length - self.reserve
+            # Escaping only grows text, so a run longer than the room cannot fit.
+            if len(value) <= room:
+                escaped = html.escape(value)
+                if len(escaped) <= room:
+                    self.atoms.append((_TEXT, value, escaped))
+                    self.length += len(escaped)
+                    self.has_text = self.has_text or not value.isspace()
+                    return None
+            head = _fitting_prefix(value, room)
+            if head:
+                self.atoms.append((_TEXT, head, html.escape(head)))
+                self.has_text = True
+            return [(_TEXT, value[len(head):])]
+
+        tag = f'<{value}>' if kind == _OPEN else f'</{value}>'
+        if kind == _OPEN:
+            if self.length + self.reserve + 2 * len(tag) + 1 > self.max_length and self.atoms:
+                return [(kind, value)]
+            self.stack.append(value)
+            self.reserve += len(tag) + 1
+        else:
+            self.stack.pop()
+            self.reserve -= len(tag)
+        self.atoms.append((kind, value, tag))
+        self.length += len(tag)
+        return None
+
+    def add(self, kind, value):
+        """Adds an atom, yielding each chunk it fills."""
+        if kind == _TEXT and len(value) > self.max_length:
+            # A long run is fed a chunk's worth at a time, so no cut copies the rest of it.
+            pending = collections.deque((_TEXT, piece) for piece in _pieces(value, self.max_length))
+            left = None
+        else:
+            # Most atoms fit where they are, without going through the queue.
+            left = self._place(kind, value)
+            if left is None:
+                return
+            pending = collections.deque()
+        while True:
+            if left is not None:
+                chunk, tail = self._cut()
+                if chunk:
+                    yield chunk
+                pending.extendleft(reversed(tail + left))
+            if not pending:
+                return
+            left = self._place(*pending.popleft())
+
+    def finish(self):
+        chunk = self._render(self.atoms, self.stack)
+        if chunk:
+            yield chunk
+
+def render_telegram_html(text: str, max_length: int = 4000) -> Iterator[str]:
+    """Converts basic Markdown to Telegram-safe HTML and splits it into messages, in a single pass.
+
+    Does the work of markdown_to_safe_html, split_message_for_telegram and
+    fix_chunks_with_tags in linear time. Every chunk is at most `max_length`
+    characters with balanced tags. Chunks break at a paragraph, line or word
+    boundary where one is close enough to the limit, and mid-word otherwise,
+    so a single huge line is still split. Code blocks are escaped once.
+    """
+    chunker = _Chunker(max_length)
+    for kind, value in _markdown_atoms(text):
+        yield from chunker.add(kind, value)
+    yield from chunker.finish()
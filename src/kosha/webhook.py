@@ -0,0 +1,113 @@
+import asyncio
+import hmac
+import itertools
+import json
+import signal
+from http import HTTPStatus
+from telegram import Update
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler
+
+from .http_listener import HTTPListener
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+# Telegram's updates are a few KB; anything much larger is not from Telegram.
+MAX_BODY_SIZE = 1 << 20
+# Seconds an idle keep-alive connection from Telegram is held open.
+IDLE_TIMEOUT = 60
+# Concurrent connections Telegram may open to deliver updates (its default is 40).
+MAX_CONNECTIONS = 40
+
+def _update_types(handler) -> set[str]:
+    if isinstance(handler, ConversationHandler):
+        nested = itertools.chain(handler.entry_points, *handler.states.values(), handler.fallbacks)
+        return set().union(*map(_update_types, nested))
+    if isinstance(handler, CallbackQueryHandler):
+        return {Update.CALLBACK_QUERY}
+    # Our message handlers only read update.message, so edits and channel posts are not requested.
+    if isinstance(handler, (CommandHandler, MessageHandler)):
+        return {Update.MESSAGE}
+    return set(Update.ALL_TYPES)
+
+def allowed_updates(application: Application) -> list[str]:
+    """Update types the registered handlers can use; a handler of unknown type asks for all of them."""
+    types = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            types |= _update_types(handler)
+    return sorted(types)
+
+class WebhookServer(HTTPListener):
+    """Minimal HTTP/1.1 listener for Telegram's webhook POSTs.
+
+    Requests to `path` carrying the secret token are decoded and put on the
+    application's update queue, exactly where polling puts them. TLS is left
+    to a reverse proxy in front of it.
+    """
+
+    idle_timeout = IDLE_TIMEOUT
+    max_body_size = MAX_BODY_SIZE
+
+    def __init__(self, application: Application, path: str, secret: str):
+        super().__init__()
+        self.application = application
+        self.path = path
+        self.secret = secret.encode('utf-8')
+        self.received = 0
+        self.rejected = 0
+
+    async def handle(self, method: str, target: str, headers: dict, body: bytes) -> tuple[HTTPStatus, bytes]:
+        if target.partition('?')[0] != self.path:
+            return HTTPStatus.NOT_FOUND, b''
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, b''
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode('utf-8'), self.secret):
+            self.rejected += 1
+            print(f"Rejected a webhook request without the secret token ({self.rejected} so far).")
+            return HTTPStatus.FORBIDDEN, b''
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Could not decode a webhook update: {e}")
+            return HTTPStatus.BAD_REQUEST, b''
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return HTTPStatus.OK, b''
+
+async def start(application: Application, url: str, listen: str, port: int, path: str, secret: str) -> WebhookServer:
+    """Starts listening and points the bot's webhook at `url`, asking only for the update types we handle."""
+    server = WebhookServer(application, path, secret)
+    await server.start(listen, port)
+    types = allowed_updates(application)
+    await application.bot.set_webhook(url, secret_token=secret, allowed_updates=types, max_connections=MAX_CONNECTIONS)
+    print(f"Webhook set to {url}, listening on {listen}:{port}{path} for {', '.join(types)}.")
+    return server
+
+async def _run(application: Application, url: str, listen: str, port: int, path: str, secret: str) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    server = None
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        server = await start(application, url, listen, port, path, secret)
+        await stop.wait()
+        print("Stop signal received. Shutting down the webhook listener.")
+    finally:
+        if server is not None:
+            await server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def run(application: Application, url: str, listen: str, port: int, path: str, secret: str) -> None:
+    """Runs the bot on a webhook until SIGINT or SIGTERM, with the same lifecycle hooks as run_polling."""
+    asyncio.run(_run(application, url, listen, port, path, secret))